@@ -14,4 +14,6 @@ if not _ASTROPY_SETUP_:
     # For egg_info test builds to pass, put package imports here.
 
     from .ascii_processing import *
+    from .memmap_processing import *
+    from .tree_walking import *
 
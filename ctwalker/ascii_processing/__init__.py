@@ -4,4 +4,6 @@ have whatever.py files in this directory implementing some modules, but this
 is just an example sub-package, so it doesn't actually do anything.
 """
 from .full_tree import *
+from .tree_index import *
+from .conversion_manifest import *
 from .hlist_ascii_utils import get_subvolID_from_fname
@@ -0,0 +1,316 @@
+""" Module storing a self-contained benchmark suite measuring the throughput
+of the ASCII parsers on synthetic Consistent Trees files generated on the fly.
+
+The suite can be run from the command line, for example::
+
+    python -m ctwalker.ascii_processing.benchmarks --num_trees 100 1000 -o results.json
+
+Results are stored as JSON so that the output of different versions of the code
+can be compared with `compare_benchmark_results`.
+"""
+import os
+import sys
+import json
+import shutil
+import platform
+import tempfile
+import multiprocessing
+from time import time, strftime
+
+import numpy as np
+
+from .fake_trees import write_fake_tree_file, fake_tree_columns_dtype
+from .full_tree import full_tree_row_generator, full_tree_chunk_generator
+from .full_tree import write_full_tree_memmaps
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+
+__all__ = ('run_parser_benchmarks', 'compare_benchmark_results')
+
+
+default_column_projections = {
+    'narrow': (1, 31),
+    'medium': (0, 1, 3, 10, 16, 17, 18, 28, 29, 31),
+    'wide': tuple(range(57))}
+
+benchmark_names = ('full_tree_row_generator', 'full_tree_chunk_generator',
+    'write_full_tree_memmaps')
+
+
+def run_parser_benchmarks(output_fname=None, num_trees_sequence=(100, 1000),
+        column_projections=None, compressions=(None, 'gzip'), **kwargs):
+    """ Time the ASCII parsers across file sizes, column projections and compression.
+
+    For every combination of file size and compression, a synthetic tree file
+    is written with `write_fake_tree_file`, and each benchmark in ``benchmarks``
+    is run once per column projection. Each run takes place in a fresh
+    worker process, so that the reported peak memory of one run
+    is not contaminated by any of the others.
+
+    Parameters
+    ----------
+    output_fname : string, optional
+        Absolute path to a JSON file where the results will be stored.
+        Default is None, in which case the results are only returned.
+
+    num_trees_sequence : sequence of integers, optional
+        Number of trees of each synthetic file. Each tree stores ~150 halos
+        on average, or about 70kB of ASCII data. Default is (100, 1000).
+
+    column_projections : dict, optional
+        Dictionary mapping a name to a sequence of column numbers.
+        Default is ``default_column_projections``, which requests
+        2, 10 and all 57 columns of the synthetic files.
+
+    compressions : sequence, optional
+        Any of None and 'gzip'. Default is (None, 'gzip').
+
+    benchmarks : sequence of strings, optional
+        Any of the names stored in ``benchmark_names``. Default is all of them.
+
+    block_size : int, optional
+        Block size passed to `full_tree_chunk_generator`. Default is 2**24.
+
+    memory_budget : int, optional
+        Memory budget passed to `write_full_tree_memmaps`. Default is 2**28.
+
+    tmp_dirname : string, optional
+        Directory where the synthetic files and the memmaps are written.
+        Default is a new temporary directory that is deleted upon completion.
+
+    verbose : bool, optional
+        Whether to print one line per run. Default is False.
+
+    Returns
+    -------
+    results : dict
+        Dictionary with a ``metadata`` entry describing the environment
+        and a ``runs`` entry storing a list with one dictionary per run.
+        Each run reports ``rows_per_sec``, ``mb_per_sec`` (in units of the
+        uncompressed ASCII data) and ``peak_rss_mb``, the peak resident memory
+        of the process executing the run, or None when it cannot be measured.
+    """
+    if column_projections is None:
+        column_projections = default_column_projections
+    benchmarks = kwargs.get('benchmarks', benchmark_names)
+    for name in benchmarks:
+        if name not in benchmark_names:
+            msg = "Benchmark ``{0}`` must be one of {1}".format(name, benchmark_names)
+            raise ValueError(msg)
+    block_size = kwargs.get('block_size', 2**24)
+    memory_budget = kwargs.get('memory_budget', 2**28)
+    verbose = kwargs.get('verbose', False)
+
+    tmp_dirname = kwargs.get('tmp_dirname', None)
+    remove_tmp_dirname = tmp_dirname is None
+    if remove_tmp_dirname:
+        tmp_dirname = tempfile.mkdtemp()
+
+    runs = []
+    try:
+        for num_trees in num_trees_sequence:
+            for compression in compressions:
+                basename = 'tree_0_0_{0}.dat'.format(num_trees)
+                fname = os.path.join(tmp_dirname, basename)
+                if compression == 'gzip':
+                    fname = fname + '.gz'
+                elif compression is not None:
+                    msg = "Compression ``{0}`` must be None or 'gzip'".format(compression)
+                    raise ValueError(msg)
+                num_rows = write_fake_tree_file(fname, num_trees=num_trees)
+                num_ascii_bytes = _uncompressed_size(fname, num_trees)
+
+                for projection_name, colnums in sorted(column_projections.items()):
+                    for benchmark in benchmarks:
+                        task = (benchmark, fname, tuple(colnums),
+                            os.path.join(tmp_dirname, 'memmaps'), block_size, memory_budget)
+                        runtime, peak_rss_mb = _run_in_fresh_process(task)
+                        run = dict(benchmark=benchmark, num_trees=num_trees,
+                            num_rows=num_rows, num_bytes=num_ascii_bytes,
+                            compression=compression, projection=projection_name,
+                            num_columns=len(colnums), runtime=runtime,
+                            rows_per_sec=num_rows/runtime,
+                            mb_per_sec=num_ascii_bytes/runtime/1e6,
+                            peak_rss_mb=peak_rss_mb)
+                        runs.append(run)
+                        if verbose:
+                            print(_format_run(run))
+                os.remove(fname)
+    finally:
+        if remove_tmp_dirname:
+            shutil.rmtree(tmp_dirname)
+
+    results = dict(metadata=_environment_metadata(), runs=runs)
+    if output_fname is not None:
+        with open(output_fname, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    return results
+
+
+def compare_benchmark_results(reference_fname, new_fname):
+    """ Compare two JSON files written by `run_parser_benchmarks`.
+
+    Parameters
+    ----------
+    reference_fname : string
+        Absolute path to the results of the reference version of the code
+
+    new_fname : string
+        Absolute path to the results of the new version of the code
+
+    Returns
+    -------
+    comparison : list
+        List of dictionaries, one per run present in both files, storing the
+        ratio of the new to the reference ``rows_per_sec`` and ``peak_rss_mb``.
+        A ``speedup`` below unity indicates a performance regression.
+    """
+    with open(reference_fname) as f:
+        reference_runs = json.load(f)['runs']
+    with open(new_fname) as f:
+        new_runs = json.load(f)['runs']
+
+    def key(run):
+        return (run['benchmark'], run['num_trees'], run['compression'], run['projection'])
+    reference_runs = dict((key(run), run) for run in reference_runs)
+
+    comparison = []
+    for run in new_runs:
+        try:
+            reference_run = reference_runs[key(run)]
+        except KeyError:
+            continue
+        result = dict(benchmark=run['benchmark'], num_trees=run['num_trees'],
+            compression=run['compression'], projection=run['projection'],
+            speedup=run['rows_per_sec']/reference_run['rows_per_sec'], memory_ratio=None)
+        if run['peak_rss_mb'] is not None and reference_run['peak_rss_mb'] is not None:
+            result['memory_ratio'] = run['peak_rss_mb']/reference_run['peak_rss_mb']
+        comparison.append(result)
+    return comparison
+
+
+def _run_in_fresh_process(task):
+    """ Run a single benchmark in a new worker process, returning
+    the runtime and the peak resident memory of the worker.
+    """
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(_run_benchmark, (task, ))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _run_benchmark(task):
+    """ Run a single benchmark in the calling process.
+    """
+    benchmark, fname, colnums, memmap_dirname, block_size, memory_budget = task
+    full_dt = fake_tree_columns_dtype()
+    #  Column names such as 't/|u|' cannot be used as directory names of the memmaps
+    dt = np.dtype([(full_dt.names[i].replace('/', '_over_'), full_dt[full_dt.names[i]])
+        for i in colnums])
+
+    start = time()
+    if benchmark == 'full_tree_row_generator':
+        for __ in full_tree_row_generator(fname, *colnums):
+            pass
+    elif benchmark == 'full_tree_chunk_generator':
+        for __ in full_tree_chunk_generator(fname, dt, *colnums, block_size=block_size):
+            pass
+    else:
+        summary = write_full_tree_memmaps([fname], memmap_dirname, dt, *colnums,
+            memory_budget=memory_budget)
+        if summary[0]['error'] is not None:
+            raise RuntimeError(summary[0]['error'])
+    runtime = time() - start
+
+    if os.path.isdir(memmap_dirname):
+        shutil.rmtree(memmap_dirname)
+    return runtime, _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    """ Peak resident memory of the calling process in MB,
+    or None on platforms without the resource module.
+    """
+    if not HAS_RESOURCE:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #  ru_maxrss is in bytes on Mac OS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return maxrss/1e6
+    else:
+        return maxrss/1e3
+
+
+def _uncompressed_size(fname, num_trees):
+    """ Number of bytes of ASCII data in the tree file,
+    regenerating the uncompressed file when necessary.
+    """
+    if not fname.endswith('.gz'):
+        return os.path.getsize(fname)
+    uncompressed_fname = fname[:-3] + '.tmp'
+    write_fake_tree_file(uncompressed_fname, num_trees=num_trees)
+    num_bytes = os.path.getsize(uncompressed_fname)
+    os.remove(uncompressed_fname)
+    return num_bytes
+
+
+def _environment_metadata():
+    """ Dictionary describing the machine and the versions of the code.
+    """
+    try:
+        from .. import __version__ as ctwalker_version
+    except ImportError:
+        ctwalker_version = None
+    return dict(ctwalker_version=ctwalker_version, numpy_version=np.__version__,
+        python_version=platform.python_version(), platform=platform.platform(),
+        processor=platform.processor(), num_cpus=multiprocessing.cpu_count(),
+        timestamp=strftime('%Y-%m-%dT%H:%M:%S'))
+
+
+def _format_run(run):
+    """ One-line summary of a single benchmark run.
+    """
+    peak_rss = 'n/a' if run['peak_rss_mb'] is None else '{0:.1f}MB'.format(run['peak_rss_mb'])
+    return ('{benchmark:>26s}  {num_rows:>9d} rows  {compression!s:>5s}  {projection:>7s}  '
+        '{rows_per_sec:>11.4g} rows/s  {mb_per_sec:>8.3g} MB/s  peak RSS {0}'.format(
+            peak_rss, **run))
+
+
+def _main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output_fname', default=None,
+        help='JSON file where the results are stored')
+    parser.add_argument('--num_trees', type=int, nargs='+', default=[100, 1000],
+        help='Number of trees of each synthetic file')
+    parser.add_argument('--benchmarks', nargs='+', default=list(benchmark_names),
+        choices=benchmark_names)
+    parser.add_argument('--projections', nargs='+', default=sorted(default_column_projections),
+        choices=sorted(default_column_projections))
+    parser.add_argument('--no_gzip', action='store_true', help='Only benchmark plain files')
+    parser.add_argument('--compare', default=None,
+        help='JSON file of reference results to compare with. Requires -o.')
+    args = parser.parse_args(argv)
+    if args.compare is not None and args.output_fname is None:
+        parser.error('--compare requires the results to be stored with -o/--output_fname')
+
+    projections = dict((name, default_column_projections[name]) for name in args.projections)
+    compressions = (None, ) if args.no_gzip else (None, 'gzip')
+    run_parser_benchmarks(args.output_fname, args.num_trees, projections, compressions,
+        benchmarks=args.benchmarks, verbose=True)
+
+    if args.compare is not None:
+        for result in compare_benchmark_results(args.compare, args.output_fname):
+            print('{benchmark:>26s}  {num_trees:>6d} trees  {compression!s:>5s}  '
+                '{projection:>7s}  speedup {speedup:.3f}'.format(**result))
+
+
+if __name__ == '__main__':
+    _main()
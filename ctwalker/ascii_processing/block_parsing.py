@@ -0,0 +1,359 @@
+""" Module storing the block-level parsing engine used to convert
+large blocks of Consistent Trees ASCII data directly into typed Numpy arrays.
+"""
+import io
+import os
+import numpy as np
+
+from ..utils.array_utils import ragged_ranges
+
+
+__all__ = ('skip_tree_file_header', 'ascii_block_generator',
+    'locate_tree_headers', 'parse_ascii_block', 'tree_aligned_byte_ranges',
+    'read_byte_range')
+
+
+def skip_tree_file_header(f):
+    """ Advance the binary file object ``f`` past the header of a Consistent Trees file,
+    returning the number of trees stored in the file.
+
+    In the header of a typical Consistent Trees ASCII file,
+    there are a sequence of lines beginning with '#'. The first line that does not
+    begin with '#' is a single integer providing the total number of tree roots.
+    """
+    while True:
+        raw_header_line = f.readline()
+        if raw_header_line[:1] != b'#':
+            break
+    return int(raw_header_line)
+
+
+def ascii_block_generator(f, block_size):
+    """ Iterate over the binary file object ``f`` yielding blocks of bytes.
+
+    Each yielded block has a size of approximately ``block_size`` bytes,
+    always stores complete lines and always ends with a newline character.
+
+    Parameters
+    ----------
+    f : file object
+        File object opened in binary mode
+
+    block_size : int
+        Number of bytes to read before completing the last line of the block
+    """
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        block += f.readline()
+        if block[-1:] != b'\n':
+            block += b'\n'
+        yield block
+
+
+def locate_tree_headers(block):
+    """ Find the '#tree' lines in a block of Consistent Trees ASCII data.
+
+    Parameters
+    ----------
+    block : bytes
+        Complete lines of ASCII data following the header of a tree file
+
+    Returns
+    -------
+    tree_root_ids : ndarray
+        Integer array storing the tree root ID of each '#tree' line in the block
+
+    tree_root_indices : ndarray
+        Integer array storing the index of the first halo of each tree,
+        counting only the halo rows of the block
+
+    num_rows : int
+        Number of halo rows in the block
+
+    tree_byte_offsets : ndarray
+        Integer array storing the position in the block of each '#tree' line
+    """
+    return _locate_tree_headers(block, *_line_bounds(block))
+
+
+def parse_ascii_block(block, desired_columns_dtype, colnums_to_yield, tree_headers=None):
+    """ Convert a block of Consistent Trees ASCII data into a structured array.
+
+    The requested fields of every halo are first located with array operations
+    over the leading bytes of each line, and copied into a compact block storing
+    only these fields. The fields that follow the last requested column are never
+    scanned, so the cost of the conversion scales with the position of the last
+    requested column rather than with the width of the file.
+    The compact block is then converted by the compiled tokenizer of `numpy.loadtxt`,
+    so that no Python object is created per halo. When the requested columns span
+    most of the width of the lines, the block is converted directly.
+
+    Parameters
+    ----------
+    block : bytes
+        Complete lines of ASCII data following the header of a tree file,
+        as yielded by `ascii_block_generator`
+
+    desired_columns_dtype : `numpy.dtype`
+        Structured dtype of the returned array
+
+    colnums_to_yield : sequence of integers
+        Column numbers of the ASCII data stored in each field of ``desired_columns_dtype``
+
+    tree_headers : tuple, optional
+        Output of `locate_tree_headers` for ``block``, for callers that also need
+        the byte offsets of the trees. Default is None, in which case
+        the '#tree' lines are located here.
+
+    Returns
+    -------
+    chunk : ndarray
+        Structured array of shape (num_rows, ) storing the requested columns
+
+    tree_root_ids : ndarray
+        Integer array storing the tree root ID of each tree beginning in the block
+
+    tree_root_indices : ndarray
+        Integer array storing the indices of ``chunk`` where each of these trees begins
+    """
+    arr, line_starts, line_stops = _line_bounds(block)
+    if tree_headers is None:
+        tree_headers = _locate_tree_headers(block, arr, line_starts, line_stops)
+    tree_root_ids, tree_root_indices, num_rows, __ = tree_headers
+
+    if num_rows == 0:
+        chunk = np.zeros(0, dtype=desired_columns_dtype)
+    else:
+        projected_block, usecols = _project_fields(
+            block, arr, line_starts, line_stops, colnums_to_yield)
+        chunk = np.loadtxt(io.BytesIO(projected_block), dtype=desired_columns_dtype,
+            usecols=usecols, comments='#', ndmin=1)
+
+    if len(chunk) != num_rows:
+        msg = ("Block of ASCII data has {0} halo rows but only {1} rows were parsed.\n"
+            "Consistent Trees files may not contain empty lines".format(num_rows, len(chunk)))
+        raise ValueError(msg)
+
+    return chunk, tree_root_ids, tree_root_indices
+
+
+def _line_bounds(block):
+    """ Bytes of the block as an array, along with the position of the first byte
+    and of the terminating newline of each line.
+    """
+    arr = np.frombuffer(block, dtype='u1')
+    line_stops = np.flatnonzero(arr == ord(b'\n'))
+    line_starts = np.zeros(len(line_stops), dtype=line_stops.dtype)
+    line_starts[1:] = line_stops[:-1] + 1
+    return arr, line_starts, line_stops
+
+
+def _locate_tree_headers(block, arr, line_starts, line_stops):
+    """ Implementation of `locate_tree_headers` for a block whose lines are already known.
+    """
+    is_tree_line = (line_stops > line_starts) & (arr[np.minimum(line_starts, len(arr)-1)] == ord(b'#'))
+    tree_lines = np.flatnonzero(is_tree_line)
+    tree_root_ids = np.array(list(int(block[line_starts[i]:line_stops[i]].split()[-1])
+        for i in tree_lines), dtype='i8')
+    tree_root_indices = tree_lines - np.arange(len(tree_lines))
+    tree_byte_offsets = line_starts[tree_lines].astype('i8')
+    return tree_root_ids, tree_root_indices, len(line_stops) - len(tree_lines), tree_byte_offsets
+
+
+def _project_fields(block, arr, line_starts, line_stops, colnums_to_yield, max_lines=2**16):
+    """ Copy the requested fields of every halo row of a block into a compact block
+    storing one line per halo, returning the compact block along with the
+    column numbers of the requested fields in the compact block.
+
+    The fields of each line are located in a window of its leading bytes
+    that is just wide enough to contain the last requested field, so that
+    the trailing fields of the lines are never scanned, and may even be
+    malformed or missing. When the requested fields span more than a quarter of the
+    width of the lines, the input block is returned unchanged.
+    """
+    colnums_to_yield = tuple(int(colnum) for colnum in colnums_to_yield)
+    requested = np.unique(colnums_to_yield)
+    num_leading_fields = int(requested[-1]) + 1
+
+    is_halo = (line_stops > line_starts) & (arr[np.minimum(line_starts, len(arr)-1)] != ord(b'#'))
+    line_starts, line_stops = line_starts[is_halo], line_stops[is_halo]
+    if len(line_starts) == 0:
+        return block, colnums_to_yield
+
+    #  The leading fields of the first line determine the width of the window
+    first_line = block[line_starts[0]:line_stops[0]]
+    leading_fields = first_line.split(None, num_leading_fields)
+    if len(leading_fields) <= num_leading_fields:
+        return block, colnums_to_yield
+    width = len(first_line) - len(leading_fields[-1])
+    if width > 0.25*np.mean(line_stops - line_starts):
+        return block, colnums_to_yield
+
+    #  Each field is copied along with the whitespace that follows it,
+    #  up to the beginning of the next field or to the newline ending the line
+    field_starts = np.zeros((len(line_starts), len(requested)), dtype='i8')
+    field_stops = np.zeros((len(line_starts), len(requested)), dtype='i8')
+    for first in range(0, len(line_starts), max_lines):
+        lines = np.arange(first, min(first + max_lines, len(line_starts)))
+        _locate_leading_fields(arr, line_starts, line_stops, lines, requested,
+            width + width//8 + 8, field_starts, field_stops)
+
+    #  The last byte copied after each field becomes a space,
+    #  or a newline after the last field of the line
+    offsets, indices = ragged_ranges(field_starts.reshape(-1), field_stops.reshape(-1))
+    projected = arr[indices]
+    separators = offsets[1:] - 1
+    projected[separators] = ord(b' ')
+    projected[separators[len(requested)-1::len(requested)]] = ord(b'\n')
+
+    usecols = tuple(int(i) for i in np.searchsorted(requested, colnums_to_yield))
+    return projected.tobytes(), usecols
+
+
+def _locate_leading_fields(arr, line_starts, line_stops, lines, requested, width,
+        field_starts, field_stops):
+    """ Store the position of the first byte of each of the ``requested`` fields
+    of the input ``lines`` in ``field_starts``, and the position of the first byte
+    of the following field, or of the newline ending the line, plus one,
+    in ``field_stops``. Only the first ``width`` bytes of each line are scanned,
+    and the window is widened for the lines whose last requested field does not fit in it.
+    """
+    num_leading_fields = int(requested[-1]) + 1
+    while len(lines) > 0:
+        starts, line_lengths = line_starts[lines], line_stops[lines] - line_starts[lines]
+        window = _leading_bytes(arr, starts, width)
+        is_separator = window <= ord(b' ')
+        is_field_start = np.empty_like(is_separator)
+        is_field_start[:, 0] = ~is_separator[:, 0]
+        np.greater(is_separator[:, :-1], is_separator[:, 1:], out=is_field_start[:, 1:])
+
+        #  The window may extend past the end of the line into the following lines
+        flat_positions = np.flatnonzero(is_field_start)
+        row = flat_positions // width
+        start_positions = flat_positions - row*width
+        in_line = start_positions < line_lengths[row]
+        row, start_positions = row[in_line], start_positions[in_line]
+        num_fields = np.bincount(row, minlength=len(lines))
+
+        #  A line is complete once the field following the last requested field
+        #  begins inside the window, or once the entire line fits in the window
+        is_complete = (num_fields > num_leading_fields) | (line_lengths < width)
+        if np.any(num_fields[is_complete] < num_leading_fields):
+            msg = ("A line of the block of ASCII data has fewer than the {0} fields "
+                "required to yield column {1}".format(num_leading_fields, requested[-1]))
+            raise ValueError(msg)
+
+        first_field = (np.cumsum(num_fields) - num_fields)[is_complete][:, np.newaxis]
+        num_fields = num_fields[is_complete][:, np.newaxis]
+        has_next_field = requested + 1 < num_fields
+        next_field_positions = start_positions[
+            np.minimum(first_field + requested + 1, len(start_positions) - 1)]
+
+        complete_lines = lines[is_complete]
+        starts = starts[is_complete][:, np.newaxis]
+        field_starts[complete_lines] = starts + start_positions[first_field + requested]
+        field_stops[complete_lines] = starts + np.where(has_next_field,
+            next_field_positions, line_lengths[is_complete][:, np.newaxis] + 1)
+
+        lines = lines[~is_complete]
+        width *= 2
+
+
+def _leading_bytes(arr, starts, width):
+    """ Array of shape (len(starts), width) storing the ``width`` bytes of ``arr``
+    beginning at each of the sorted positions ``starts``, padded with zeros past the end.
+    """
+    window = np.zeros((len(starts), width), dtype=arr.dtype)
+    num_inside = int(np.searchsorted(starts, len(arr) - width, side='right'))
+    if num_inside > 0:
+        strided = np.lib.stride_tricks.as_strided(arr,
+            shape=(len(arr) - width + 1, width), strides=(arr.strides[0], arr.strides[0]))
+        window[:num_inside] = strided[starts[:num_inside]]
+    if num_inside < len(starts):
+        first = starts[num_inside]
+        tail = np.zeros(len(arr) - first + width, dtype=arr.dtype)
+        tail[:len(arr) - first] = arr[first:]
+        strided = np.lib.stride_tricks.as_strided(tail,
+            shape=(len(tail) - width + 1, width), strides=(tail.strides[0], tail.strides[0]))
+        window[num_inside:] = strided[starts[num_inside:] - first]
+    return window
+
+
+def tree_aligned_byte_ranges(f, num_ranges, search_size=2**20):
+    """ Cut the data section of an uncompressed Consistent Trees file into
+    byte ranges of roughly equal size that begin and end on tree boundaries.
+
+    Rather than scanning the entire file, the function seeks to each of the
+    ``num_ranges - 1`` equally spaced cut points and searches forward for the next
+    '#tree' line, so the cost scales with the number of ranges, not the file size.
+
+    Parameters
+    ----------
+    f : file object
+        Uncompressed tree file opened in binary mode
+
+    num_ranges : int
+        Desired number of byte ranges. Fewer ranges are returned
+        when the file stores too few trees.
+
+    search_size : int, optional
+        Number of bytes read at a time while searching for the next '#tree' line.
+        Default is 2**20.
+
+    Returns
+    -------
+    byte_ranges : list
+        List of (start, stop) byte offsets. Each range begins with a '#tree' line,
+        and the ranges cover the entire data section of the file without overlap.
+    """
+    f.seek(0)
+    __ = skip_tree_file_header(f)
+    data_start = f.tell()
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+
+    boundaries = [data_start]
+    cut_points = np.linspace(data_start, file_size, num_ranges + 1)[1:-1].astype('i8')
+    for cut_point in cut_points:
+        if cut_point <= boundaries[-1]:
+            continue
+        tree_start = _find_next_tree_line(f, cut_point, search_size)
+        if tree_start >= file_size:
+            break
+        if tree_start > boundaries[-1]:
+            boundaries.append(tree_start)
+    boundaries.append(file_size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def read_byte_range(f, start, stop):
+    """ Read the bytes between ``start`` and ``stop`` of the binary file object ``f``,
+    returning a block that always ends with a newline character.
+    """
+    f.seek(start)
+    block = f.read(stop - start)
+    if block[-1:] != b'\n':
+        block += b'\n'
+    return block
+
+
+def _find_next_tree_line(f, offset, search_size):
+    """ Byte offset of the first '#tree' line beginning after ``offset``,
+    or the size of the file if there is none.
+    """
+    f.seek(offset - 1)
+    pos = offset - 1
+    carry = b''
+    while True:
+        data = f.read(search_size)
+        if not data:
+            return pos + len(carry)
+        data = carry + data
+        idx = data.find(b'\n#')
+        if idx != -1:
+            return pos + idx + 1
+        carry = data[-1:]
+        pos += len(data) - 1
@@ -0,0 +1,131 @@
+""" Module storing functions used to keep track of the tree files that have
+already been converted by `write_full_tree_memmaps`, so that an interrupted
+conversion can be resumed and new columns can be added to an existing conversion.
+"""
+import os
+import json
+import numpy as np
+
+
+__all__ = ('load_conversion_manifest', 'conversion_manifest_fname')
+
+
+def conversion_manifest_fname(output_root_dirname):
+    """ Filename of the manifest stored in ``output_root_dirname``.
+    """
+    return os.path.join(output_root_dirname, 'manifest.json')
+
+
+def load_conversion_manifest(output_root_dirname):
+    """ Load the manifest of a conversion carried out by `write_full_tree_memmaps`.
+
+    Parameters
+    ----------
+    output_root_dirname : string
+        Directory storing the ``subvol_X_Y_Z`` subdirectories
+
+    Returns
+    -------
+    manifest : dict
+        Dictionary with one entry per converted tree file, keyed by the absolute path
+        of the file. Each entry is a dictionary storing the ``size`` and ``mtime``
+        of the tree file at the time of the conversion, the ``subvol_dirname``,
+        the ``columns`` stored on disk with their column number, dtype and shape,
+        whether the ``indexing_arrays`` and the ``tree_index`` were stored,
+        the names of the columns used to build the ``snapshot_index``, the
+        ``halo_id_index`` and the ``row_pointers``, or None for those that were not built,
+        ``num_rows``, ``num_trees``, and the ``status`` of the conversion,
+        which is 'complete' only for files whose conversion finished successfully.
+        The dictionary is empty if no manifest exists yet.
+    """
+    fname = conversion_manifest_fname(output_root_dirname)
+    if not os.path.isfile(fname):
+        return {}
+    with open(fname) as f:
+        return json.load(f)['files']
+
+
+def _save_conversion_manifest(output_root_dirname, manifest):
+    """ Store the manifest, replacing the previous version in a single rename
+    so that an interruption never leaves a truncated manifest behind.
+    """
+    fname = conversion_manifest_fname(output_root_dirname)
+    tmp_fname = fname + '.tmp'
+    with open(tmp_fname, 'w') as f:
+        json.dump(dict(files=manifest), f, indent=1, sort_keys=True)
+    try:
+        os.replace(tmp_fname, fname)
+    except AttributeError:
+        #  Python 2 has no os.replace
+        if os.path.isfile(fname):
+            os.remove(fname)
+        os.rename(tmp_fname, fname)
+
+
+def _column_specs(desired_columns_dtype, colnums_to_yield):
+    """ Description of each requested column in the format stored in the manifest.
+    """
+    dt = np.dtype(desired_columns_dtype)
+    return dict((name, dict(colnum=int(colnum), dtype=dt[name].base.str,
+            shape=list(dt[name].shape)))
+        for name, colnum in zip(dt.names, colnums_to_yield))
+
+
+def _source_stats(tree_fname):
+    """ Size and modification time of a tree file.
+    """
+    stat = os.stat(tree_fname)
+    return stat.st_size, stat.st_mtime
+
+
+def _plan_conversion(entry, tree_fname, column_specs,
+        write_indexing_arrays_to_disk, write_tree_index, derived_data=None):
+    """ Determine what remains to be done to convert ``tree_fname``.
+
+    The ``derived_data`` dictionary maps the name of each index or set of columns
+    built from the stored columns, such as 'snapshot_index', to the name
+    of the column it is built from, or to a list of names.
+
+    Returns
+    -------
+    colnames : list
+        Names of the columns that must be parsed from the tree file, empty if the file
+        does not need to be parsed
+
+    write_indexing_arrays_to_disk, write_tree_index : bool
+        Whether the indexing arrays and the tree index must be written
+
+    derived_data : dict
+        Subset of the input ``derived_data`` that must be built
+
+    is_fresh : bool
+        True if the subvolume must be converted from scratch, because the
+        previous conversion is missing, partial or older than the tree file
+    """
+    size, mtime = _source_stats(tree_fname)
+    is_fresh = ((entry is None) or (entry['status'] != 'complete') or
+        (entry['size'] != size) or (entry['mtime'] != mtime))
+    if derived_data is None:
+        derived_data = {}
+    if is_fresh:
+        return (sorted(column_specs), write_indexing_arrays_to_disk, write_tree_index,
+            dict(derived_data), True)
+
+    colnames = sorted(name for name, spec in column_specs.items()
+        if entry['columns'].get(name) != spec)
+    write_indexing_arrays_to_disk = write_indexing_arrays_to_disk and not entry['indexing_arrays']
+    write_tree_index = write_tree_index and not entry['tree_index']
+    derived_data = dict((name, source) for name, source in derived_data.items()
+        if (entry.get(name, None) != source) or
+        any(colname in colnames for colname in _source_colnames(source)))
+    if (len(colnames) == 0) and (write_indexing_arrays_to_disk or write_tree_index):
+        #  The indexing arrays are built while parsing, which requires at least one column
+        colnames = sorted(column_specs)[:1]
+    #  The derived data alone is built from the stored columns, without parsing the file
+    return colnames, write_indexing_arrays_to_disk, write_tree_index, derived_data, False
+
+
+def _source_colnames(source):
+    """ List of the names of the columns an entry of ``derived_data`` is built from.
+    """
+    return list(source) if isinstance(source, list) else [source]
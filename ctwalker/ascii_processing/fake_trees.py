@@ -0,0 +1,223 @@
+""" Module storing functions used to generate synthetic ASCII data
+formatted in the same way as the tree files written by Consistent Trees.
+The synthetic files are used to test and benchmark the ascii_processing functions
+without depending on any simulation data being present on disk.
+"""
+import os
+import numpy as np
+
+from ..utils.simulation_column_dtype import simulation_column_dtype
+
+
+__all__ = ('write_fake_tree_file', 'fake_tree_columns_dtype')
+
+
+_bolplanck_columns_fname = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'data', 'bolplanck_columns.dat')
+
+
+def fake_tree_columns_dtype():
+    """ Numpy dtype of the columns of the synthetic tree files,
+    which follow the column layout stored in ``ctwalker/data/bolplanck_columns.dat``.
+
+    Returns
+    -------
+    dt : `numpy.dtype`
+    """
+    return simulation_column_dtype(_bolplanck_columns_fname)
+
+
+def write_fake_tree_file(fname, num_trees=10, num_snapshots=20, seed=43,
+        first_halo_id=0, Lbox=250.):
+    """ Write an ASCII file with the same format as a Consistent Trees tree file.
+
+    Each tree is grown backwards in time from a root halo at the final snapshot.
+    Every halo has a main progenitor, and occasionally a few minor progenitors,
+    until either the first snapshot or a minimum mass is reached.
+    Halos are written in depth-first order, main progenitor first,
+    and all the depth-first bookkeeping columns are self-consistent.
+
+    Parameters
+    ----------
+    fname : string
+        Absolute path to the output file. If ``fname`` ends in ``.gz``,
+        the file will be gzip-compressed.
+
+    num_trees : int, optional
+        Number of independent trees in the file. Default is 10.
+
+    num_snapshots : int, optional
+        Number of snapshots of the fake simulation. Default is 20.
+
+    seed : int, optional
+        Random number seed. Default is 43.
+
+    first_halo_id : int, optional
+        Smallest halo ID in the file. Use different values for different files
+        to keep halo IDs unique across a fake simulation. Default is 0.
+
+    Lbox : float, optional
+        Size of the fake simulation box. Default is 250.
+
+    Returns
+    -------
+    num_halos : int
+        Total number of halos written to the file
+    """
+    rng = np.random.RandomState(seed)
+    dt = fake_tree_columns_dtype()
+    scales = np.linspace(0.1, 1, num_snapshots)
+
+    header_lines = ['#' + ' '.join('{0}({1})'.format(name, i) for i, name in enumerate(dt.names)),
+        '#Omega_M = 0.307115; Omega_L = 0.692885; h0 = 0.677700',
+        '#Full box size = {0:.6f} Mpc/h'.format(Lbox),
+        '#Fake tree file written by ctwalker.ascii_processing.fake_trees',
+        str(num_trees)]
+
+    fmts = ['%d' if dt[name].kind == 'i' else '%.6g' for name in dt.names]
+    row_fmt = ' '.join(fmts) + '\n'
+
+    if fname.endswith('.gz'):
+        import gzip
+        f = gzip.open(fname, 'wb')
+    else:
+        f = open(fname, 'wb')
+
+    num_halos = 0
+    next_halo_id = first_halo_id
+    with f:
+        f.write(('\n'.join(header_lines) + '\n').encode())
+        for __ in range(num_trees):
+            tree = _fake_tree(rng, dt, scales, next_halo_id, num_halos, Lbox)
+            next_halo_id += len(tree)
+            num_halos += len(tree)
+
+            lines = ['#tree {0}\n'.format(tree['halo_id'][0])]
+            lines.extend(row_fmt % row for row in tree.tolist())
+            f.write(''.join(lines).encode())
+
+    return num_halos
+
+
+def _fake_tree(rng, dt, scales, first_halo_id, first_depthfirst_id, Lbox,
+        min_mass=10**9.5):
+    """ Generate a single fake tree in depth-first order.
+    """
+    root_snap = len(scales) - 1
+    root_mass = 10**rng.uniform(10.5, 13)
+
+    #  Grow the tree with a stack so that the main progenitor of each halo
+    #  immediately follows it, which is the depth-first ordering of Consistent Trees
+    snap_num, mass, desc_idx, is_mmp = [], [], [], []
+    stack = [(root_snap, root_mass, -1, 1)]
+    while len(stack) > 0:
+        snap, m, desc, mmp = stack.pop()
+        idx = len(snap_num)
+        snap_num.append(snap)
+        mass.append(m)
+        desc_idx.append(desc)
+        is_mmp.append(mmp)
+        if snap > 0 and m > min_mass:
+            prog_masses = [m*rng.uniform(0.75, 0.97)]
+            prog_masses.extend(m*rng.uniform(0.02, 0.3, rng.poisson(0.3)))
+            for iprog in range(len(prog_masses)-1, -1, -1):
+                stack.append((snap-1, prog_masses[iprog], idx, int(iprog == 0)))
+
+    num_halos = len(snap_num)
+    snap_num = np.array(snap_num)
+    mass = np.array(mass)
+    desc_idx = np.array(desc_idx)
+    is_mmp = np.array(is_mmp)
+    has_desc = desc_idx >= 0
+
+    #  Depth-first bookkeeping, children always appear after their descendant
+    last_prog_idx = np.arange(num_halos)
+    last_mainleaf_idx = np.arange(num_halos)
+    for idx in range(num_halos-1, 0, -1):
+        desc = desc_idx[idx]
+        last_prog_idx[desc] = max(last_prog_idx[desc], last_prog_idx[idx])
+        if is_mmp[idx]:
+            last_mainleaf_idx[desc] = last_mainleaf_idx[idx]
+
+    next_coprog_idx = np.zeros(num_halos, dtype='i8') - 1
+    previous_child = {}
+    for idx in range(1, num_halos):
+        desc = desc_idx[idx]
+        if desc in previous_child:
+            next_coprog_idx[previous_child[desc]] = idx
+        previous_child[desc] = idx
+
+    halo_id = first_halo_id + rng.permutation(num_halos)
+    depth_first_id = first_depthfirst_id + np.arange(num_halos)
+    breadth_first_order = np.lexsort((np.arange(num_halos), -snap_num))
+    breadth_first_id = np.empty(num_halos, dtype='i8')
+    breadth_first_id[breadth_first_order] = first_depthfirst_id + np.arange(num_halos)
+
+    #  Some minor progenitors are subhalos of the main progenitor of their descendant
+    mmp_idx_of_desc = np.zeros(num_halos, dtype='i8') - 1
+    mmp_idx_of_desc[desc_idx[is_mmp.astype(bool) & has_desc]] = np.flatnonzero(
+        is_mmp.astype(bool) & has_desc)
+    is_sub = (~is_mmp.astype(bool)) & has_desc & (rng.uniform(size=num_halos) < 0.5)
+    pid = np.zeros(num_halos, dtype='i8') - 1
+    pid[is_sub] = halo_id[mmp_idx_of_desc[desc_idx[is_sub]]]
+
+    tree = np.zeros(num_halos, dtype=dt)
+    tree['scale_factor'] = scales[snap_num]
+    tree['halo_id'] = halo_id
+    tree['desc_scale'][has_desc] = scales[snap_num[has_desc]+1]
+    tree['desc_id'] = np.where(has_desc, halo_id[desc_idx], -1)
+    tree['num_prog'] = np.bincount(desc_idx[has_desc], minlength=num_halos)
+    tree['pid'] = pid
+    tree['upid'] = pid
+    tree['desc_pid'] = np.where(has_desc, pid[desc_idx], -1)
+    tree['phantom'] = 0
+    tree['mvir'] = mass
+    tree['sam_mvir'] = mass
+    tree['mvir_all'] = mass*rng.uniform(1, 1.1, num_halos)
+    tree['m200b'] = mass*rng.uniform(0.9, 1.1, num_halos)
+    tree['m200c'] = mass*rng.uniform(0.7, 0.9, num_halos)
+    tree['m500c'] = mass*rng.uniform(0.5, 0.7, num_halos)
+    tree['m2500c'] = mass*rng.uniform(0.2, 0.4, num_halos)
+    tree['m_pe_behroozi'] = mass*rng.uniform(0.8, 1.2, num_halos)
+    tree['m_pe_diemer'] = mass*rng.uniform(0.8, 1.2, num_halos)
+    tree['rvir'] = 300*(mass/1e12)**(1/3.)*scales[snap_num]
+    tree['rs'] = tree['rvir']/rng.uniform(3, 15, num_halos)
+    tree['rs_klypin'] = tree['rs']*rng.uniform(0.9, 1.1, num_halos)
+    tree['vmax'] = 200*(mass/1e12)**(1/3.)*rng.uniform(0.9, 1.2, num_halos)
+    tree['vrms'] = tree['vmax']*rng.uniform(0.9, 1.1, num_halos)
+    tree['mmp'] = is_mmp
+    tree['scale_of_last_mm'] = scales[rng.randint(0, snap_num+1)]
+
+    pos = rng.uniform(0, Lbox, 3)
+    for i, key in enumerate(('x', 'y', 'z')):
+        displacement = np.cumsum(rng.normal(scale=0.1, size=num_halos))
+        tree[key] = (pos[i] + displacement - displacement[0]) % Lbox
+    for key in ('vx', 'vy', 'vz'):
+        tree[key] = rng.normal(scale=300, size=num_halos)
+    for key in ('jx', 'jy', 'jz'):
+        tree[key] = rng.normal(scale=1e12, size=num_halos)
+    tree['spin'] = rng.lognormal(np.log(0.035), 0.5, num_halos)
+    tree['spin_bullock'] = tree['spin']*rng.uniform(0.9, 1.1, num_halos)
+
+    tree['breadth_first_id'] = breadth_first_id
+    tree['depth_first_id'] = depth_first_id
+    tree['tree_root_id'] = halo_id[0]
+    tree['orig_halo_id'] = halo_id
+    tree['snap_num'] = snap_num
+    tree['next_coprogenitor_depthfirst_id'] = np.where(
+        next_coprog_idx >= 0, first_depthfirst_id + next_coprog_idx, -1)
+    tree['last_progenitor_depthfirst_id'] = first_depthfirst_id + last_prog_idx
+    tree['last_mainleaf_depthfirst_id'] = first_depthfirst_id + last_mainleaf_idx
+
+    tree['xoff'] = tree['rvir']*rng.uniform(0, 0.1, num_halos)
+    tree['voff'] = tree['vmax']*rng.uniform(0, 0.1, num_halos)
+    for key in ('b_to_a', 'b_to_a(500c)'):
+        tree[key] = rng.uniform(0.5, 1, num_halos)
+    for key in ('c_to_a', 'c_to_a(500c)'):
+        tree[key] = tree[key.replace('c_to_a', 'b_to_a')]*rng.uniform(0.5, 1, num_halos)
+    for key in ('a[x]', 'a[y]', 'a[z]', 'a[x](500c)', 'a[y](500c)', 'a[z](500c)'):
+        tree[key] = rng.normal(scale=50, size=num_halos)
+    tree['t/|u|'] = rng.uniform(0.5, 1, num_halos)
+
+    return tree
@@ -2,20 +2,172 @@
 """
 import numpy as np
 import os
+import shutil
+import multiprocessing
+from collections import deque
+from itertools import islice
+from time import time
+from traceback import format_exc
+from warnings import warn
 
 from .hlist_ascii_utils import get_subvolID_from_fname
-from ..utils import _compression_safe_opener
-from ..utils.np_memmap_utils import memmap_structured_array
+from .block_parsing import skip_tree_file_header, ascii_block_generator, parse_ascii_block
+from .block_parsing import tree_aligned_byte_ranges, read_byte_range, locate_tree_headers
+from .tree_index import _TreeIndexAccumulator, _open_for_sequential_scan
+from .conversion_manifest import load_conversion_manifest, _save_conversion_manifest
+from .conversion_manifest import _column_specs, _plan_conversion, _source_stats
+from ..utils import robust_open, detect_compression
+from ..utils.np_memmap_utils import StructuredArrayMemmapWriter, load_memmap_column
+from ..utils.snapshot_index import write_snapshot_index, snapshot_index_dirname
+from ..utils.snapshot_index import snapshot_key_colnames
+from ..utils.halo_id_index import write_halo_id_index, halo_id_index_dirname
+from ..tree_walking.row_pointers import write_row_pointers
 
 
-__all__ = ('write_full_tree_memmaps', )
+__all__ = ('write_full_tree_memmaps', 'full_tree_chunk_generator')
 
 
 def write_full_tree_memmaps(tree_fname_sequence, output_root_dirname,
         desired_columns_dtype, *colnums_to_yield, **kwargs):
-    """
+    """ Convert a sequence of ASCII Consistent Trees files into memory-mapped binaries,
+    one subdirectory of ``output_root_dirname`` per subvolume.
+
+    Each file is streamed through `full_tree_chunk_generator` and every chunk
+    is appended to the binaries on disk as soon as it is parsed, so that the
+    memory footprint is set by ``memory_budget`` rather than by the size of the file.
+    Different files can be converted concurrently by a pool of processes,
+    each of which owns the ``subvol_X_Y_Z`` directory of the file it converts.
+
+    The progress of the conversion is recorded in ``output_root_dirname/manifest.json``,
+    see `load_conversion_manifest`. When the function is called again with the same
+    ``output_root_dirname``, files whose conversion already completed are skipped,
+    unless the tree file has changed since. Files whose conversion is missing, partial
+    or stale are converted again, and for files that were already converted,
+    only the columns that are not yet stored are parsed and written,
+    so that new columns can be added to an existing conversion.
+
+    Parameters
+    ----------
+    tree_fname_sequence : sequence of strings
+        Absolute paths to the ASCII tree files. Each basename must store
+        a unique triplet of integers providing the subvolume ID.
+
+    output_root_dirname : string
+        Directory where the ``subvol_X_Y_Z`` subdirectories will be written
+
+    desired_columns_dtype : `numpy.dtype`
+        Structured dtype of the stored data.
+        Must have the same length as ``colnums_to_yield``.
+
+    *colnums_to_yield : sequence of integers
+        Sequence determines which columns of the tree files will be stored
+
+    write_indexing_arrays_to_disk : bool, optional
+        Whether to also store `tree_root_ids` and `tree_root_indices`. Default is True.
+
+    memory_budget : int, optional
+        Approximate number of bytes used to buffer data while converting a file.
+        With multiple workers, the budget applies to each worker. Default is 2**28.
+
+    num_workers : int, optional
+        Number of processes converting files concurrently. Default is 1,
+        in which case the files are converted serially in the calling process.
+
+    executor : object, optional
+        Any pool object with a ``map`` method, such as a `multiprocessing.Pool`
+        or a `concurrent.futures.ProcessPoolExecutor`, used instead of
+        creating a pool of ``num_workers`` processes.
+
+    num_workers_per_file : int, optional
+        Number of processes parsing each uncompressed file concurrently,
+        see `full_tree_chunk_generator`. Useful when a few very large files dominate
+        the run time. Worker processes cannot start pools of their own, so this option
+        requires the files themselves to be converted serially. Default is 1.
+
+    write_tree_index : bool, optional
+        Whether to store the per-tree byte-offset index of each tree file in its
+        subvolume directory, along with the access-point index of gzip-compressed files.
+        The indexes are built during the conversion at no extra pass over the data,
+        and are used by `read_trees` with ``index_dirname`` set to the subvolume directory.
+        Default is False.
+
+    compression : string or dict, optional
+        Codec used to store the columns in compressed chunks, 'zlib' or 'lzma',
+        or a dictionary mapping column names to codecs,
+        see `~ctwalker.utils.np_memmap_utils.StructuredArrayMemmapWriter`.
+        Compressed columns are read back with
+        `~ctwalker.utils.np_memmap_utils.load_memmap_column`.
+        Default is None, in which case every column is stored as an uncompressed
+        ``.npy`` file that can be memory-mapped.
+
+    chunk_size : int, optional
+        Number of rows per compressed chunk. Default is 2**16.
+
+    zone_map_size : int, optional
+        Number of rows per block of the zone map stored next to each column,
+        used by the ``select_rows`` methods of the readers in
+        `ctwalker.memmap_processing` to skip the blocks that cannot match a selection.
+        If None, no zone maps are stored. Default is 2**12.
+
+    write_snapshot_index : bool, optional
+        Whether to store the per-snapshot index of each subvolume, which lists the rows
+        of the halos of every snapshot, see `~ctwalker.utils.snapshot_index.SnapshotIndex`.
+        The index is built from the ``snap_num`` column, or from the ``scale_factor``
+        column when ``snap_num`` is not in ``desired_columns_dtype``, and no index
+        is stored when neither column is. The index is used by the ``read_snapshot``
+        methods of the readers in `ctwalker.memmap_processing`. Default is True.
+
+    write_halo_id_index : bool, optional
+        Whether to store the index translating the ``halo_id`` of any halo in
+        the subvolume into its row, see `~ctwalker.utils.halo_id_index.HaloIDIndex`.
+        The index is only built when ``halo_id`` is in ``desired_columns_dtype``,
+        and is used by the ``rows_from_halo_ids`` methods of the readers
+        in `ctwalker.memmap_processing`. Default is True.
+
+    write_row_pointers : bool, optional
+        Whether to store the int32 ``desc_row`` and ``mmp_row`` columns, which store
+        the row of the descendant and of the main progenitor of each halo in its
+        subvolume, or -1 for none, see `~ctwalker.tree_walking.compute_row_pointers`.
+        The columns are only computed when both ``halo_id`` and ``desc_id`` are in
+        ``desired_columns_dtype``. Default is True.
+
+    resume : bool, optional
+        Whether to use the manifest of previous calls to skip the work that is
+        already done. If False, every file is converted from scratch, and the
+        manifest entries of the other files are kept. Default is True.
+
+    Returns
+    -------
+    summary : list of dicts
+        One dictionary per input file, in the order of ``tree_fname_sequence``,
+        with keys ``fname``, ``subvol_dirname``, ``num_rows``, ``num_trees``,
+        ``num_bytes``, ``runtime``, ``error`` and ``skipped``. The ``error`` value is None
+        for files that were converted successfully, and otherwise stores the traceback
+        of the exception raised while converting the file. The ``skipped`` value is True
+        for files that required no work because their conversion was already complete.
     """
     write_indexing_arrays_to_disk = kwargs.get('write_indexing_arrays_to_disk', True)
+    memory_budget = kwargs.get('memory_budget', 2**28)
+    num_workers = kwargs.get('num_workers', 1)
+    executor = kwargs.get('executor', None)
+    num_workers_per_file = kwargs.get('num_workers_per_file', 1)
+    write_tree_index = kwargs.get('write_tree_index', False)
+    resume = kwargs.get('resume', True)
+    compression = kwargs.get('compression', None)
+    chunk_size = kwargs.get('chunk_size', 2**16)
+    zone_map_size = kwargs.get('zone_map_size', 2**12)
+    derived_data = {}
+    if kwargs.get('write_snapshot_index', True):
+        for colname in snapshot_key_colnames:
+            if colname in np.dtype(desired_columns_dtype).names:
+                derived_data['snapshot_index'] = colname
+                break
+    if kwargs.get('write_halo_id_index', True):
+        if 'halo_id' in np.dtype(desired_columns_dtype).names:
+            derived_data['halo_id_index'] = 'halo_id'
+    if kwargs.get('write_row_pointers', True):
+        if set(('halo_id', 'desc_id')) <= set(np.dtype(desired_columns_dtype).names):
+            derived_data['row_pointers'] = ['halo_id', 'desc_id']
 
     # Before beginning the data reduction, verify that we can parse each fname
     tree_fname_sequence = list(tree_fname_sequence)
@@ -25,42 +177,229 @@ def write_full_tree_memmaps(tree_fname_sequence, output_root_dirname,
     msg = ("Input ``desired_columns_dtype`` must have same length as ``colnums_to_yield``")
     assert len(desired_columns_dtype) == len(colnums_to_yield), msg
 
-    for tree_fname in tree_fname_sequence:
-        subvolID = get_subvolID_from_fname(tree_fname)
-        subvol_string = '_'.join(str(i) for i in subvolID)
-        subvol_dirname = os.path.join(output_root_dirname, 'subvol_' + subvol_string)
-
-        data_gen_kwargs = {}
-        data_gen_kwargs['write_indexing_arrays_to_disk'] = write_indexing_arrays_to_disk
-        data_gen_kwargs['dirname_for_indexing_arrays'] = subvol_dirname
-        result = list(full_tree_row_generator(tree_fname, *colnums_to_yield))
-
-        tree_root_indices = result.pop()
-        tree_root_ids = result.pop()
-        if write_indexing_arrays_to_disk:
-            #  Convert tree_root_indices to structured array and memmap
-            dt_tree_root_indices = np.dtype([('tree_root_indices', 'i8')])
-            tree_root_indices = tree_root_indices.astype(dt_tree_root_indices)
-            memmap_structured_array(tree_root_indices, subvol_dirname)
-            #  Convert tree_root_ids to structured array and memmap
-            dt_tree_root_ids = np.dtype([('tree_root_ids', 'i8')])
-            tree_root_ids = tree_root_ids.astype(dt_tree_root_ids)
-            memmap_structured_array(tree_root_ids, subvol_dirname)
-
-        #  Convert string data to structured array and memmap
-        arr = np.array(result, dtype=desired_columns_dtype)
-        memmap_structured_array(arr, subvol_dirname)
-
-
-def full_tree_row_generator(ascii_tree_fname, *colnums_to_yield):
+    if num_workers_per_file > 1 and (num_workers > 1 or executor is not None):
+        msg = ("Input ``num_workers_per_file`` cannot be used together with "
+            "``num_workers`` or ``executor``")
+        raise ValueError(msg)
+
+    try:
+        os.makedirs(output_root_dirname)
+    except OSError:
+        pass
+    manifest = load_conversion_manifest(output_root_dirname)
+    desired_columns_dtype = np.dtype(desired_columns_dtype)
+    column_specs = _column_specs(desired_columns_dtype, colnums_to_yield)
+
+    # Determine the work remaining for each file from the manifest of previous runs
+    summary = list(None for __ in tree_fname_sequence)
+    position = {}
+    planned_work = {}
+    task_sequence = []
+    for i, tree_fname in enumerate(tree_fname_sequence):
+        key = os.path.abspath(tree_fname)
+        subvol_dirname = _subvol_dirname(output_root_dirname, tree_fname)
+        entry = manifest.get(key, None) if resume else None
+        colnames, write_indexing, write_index, derived, is_fresh = _plan_conversion(
+            entry, tree_fname, column_specs, write_indexing_arrays_to_disk, write_tree_index,
+            derived_data)
+
+        if (len(colnames) == 0) and (len(derived) == 0):
+            summary[i] = dict(fname=tree_fname, subvol_dirname=subvol_dirname,
+                num_rows=entry['num_rows'], num_trees=entry['num_trees'], num_bytes=0,
+                runtime=0., error=None, skipped=True)
+            continue
+
+        if is_fresh:
+            _remove_column_files(subvol_dirname)
+            size, mtime = _source_stats(tree_fname)
+            manifest[key] = dict(size=size, mtime=mtime, subvol_dirname=subvol_dirname,
+                columns={}, indexing_arrays=False, tree_index=False, snapshot_index=None,
+                halo_id_index=None, row_pointers=None, num_rows=0, num_trees=0, status='in_progress')
+
+        position[key] = i
+        planned_work[key] = (colnames, write_indexing, write_index, derived)
+        dt = np.dtype(list((name, desired_columns_dtype[name]) for name in colnames))
+        colnums = tuple(column_specs[name]['colnum'] for name in colnames)
+        conversion_options = dict(write_indexing_arrays_to_disk=write_indexing,
+            memory_budget=memory_budget, num_workers_per_file=num_workers_per_file,
+            write_tree_index=write_index, compression=compression, chunk_size=chunk_size,
+            zone_map_size=zone_map_size, derived_data=derived)
+        task_sequence.append((tree_fname, output_root_dirname, dt, colnums, conversion_options))
+    _save_conversion_manifest(output_root_dirname, manifest)
+
+    pool = None
+    if executor is not None:
+        results = executor.map(_write_subvolume_memmaps, task_sequence)
+    elif num_workers > 1 and len(task_sequence) > 1:
+        pool = multiprocessing.Pool(min(num_workers, len(task_sequence)))
+        results = pool.imap_unordered(_write_subvolume_memmaps, task_sequence, chunksize=1)
+    else:
+        results = (_write_subvolume_memmaps(task) for task in task_sequence)
+
+    # Record each file in the manifest as soon as its conversion completes
+    try:
+        for result in results:
+            key = os.path.abspath(result['fname'])
+            summary[position[key]] = result
+            entry = manifest[key]
+            if result['error'] is None:
+                colnames, write_indexing, write_index, derived = planned_work[key]
+                entry['columns'].update((name, column_specs[name]) for name in colnames)
+                entry['indexing_arrays'] = entry['indexing_arrays'] or write_indexing
+                entry['tree_index'] = entry['tree_index'] or write_index
+                entry.update(derived)
+                if len(colnames) == 0:
+                    #  Only the derived data was built, so the file was not parsed
+                    result.update(num_rows=entry['num_rows'], num_trees=entry['num_trees'])
+                entry.update(num_rows=result['num_rows'], num_trees=result['num_trees'],
+                    status='complete')
+            elif entry['status'] != 'complete':
+                entry['status'] = 'failed'
+            _save_conversion_manifest(output_root_dirname, manifest)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    failures = list(s['fname'] for s in summary if s['error'] is not None)
+    if len(failures) > 0:
+        msg = ("The following {0} tree files could not be converted:\n{1}\n"
+            "See the ``error`` entries of the returned summary for the tracebacks".format(
+                len(failures), '\n'.join(failures)))
+        warn(msg)
+
+    return summary
+
+
+def _subvol_dirname(output_root_dirname, tree_fname):
+    """ Directory storing the binaries of the subvolume of ``tree_fname``.
+    """
+    subvolID = get_subvolID_from_fname(tree_fname)
+    subvol_string = '_'.join(str(i) for i in subvolID)
+    return os.path.join(output_root_dirname, 'subvol_' + subvol_string)
+
+
+def _remove_column_files(subvol_dirname):
+    """ Delete the binaries of every column of a subvolume whose tree file
+    is about to be converted from scratch, including the columns added
+    after a previous conversion, such as main-branch reductions.
+    """
+    basenames = os.listdir(subvol_dirname) if os.path.isdir(subvol_dirname) else []
+    for basename in basenames:
+        fname = os.path.join(subvol_dirname, basename)
+        if basename.endswith(('.npy', '.zcol')) and os.path.isfile(fname):
+            os.remove(fname)
+    for dirname in (snapshot_index_dirname(subvol_dirname), halo_id_index_dirname(subvol_dirname)):
+        if os.path.isdir(dirname):
+            shutil.rmtree(dirname)
+
+
+_derived_index_writers = {'snapshot_index': write_snapshot_index,
+    'halo_id_index': write_halo_id_index}
+
+
+def _write_derived_data(subvol_dirname, name, source_colnames):
+    """ Build the index or the columns ``name`` from the stored columns of a subvolume.
+    """
+    if name == 'row_pointers':
+        write_row_pointers(subvol_dirname)
+    else:
+        keys = np.asarray(load_memmap_column(subvol_dirname, source_colnames))
+        _derived_index_writers[name](subvol_dirname, keys, source_colnames)
+
+
+def _write_subvolume_memmaps(task):
+    """ Convert a single ASCII tree file into the binaries of its subvolume directory.
+    Exceptions are caught and reported in the returned summary so that one bad file
+    does not abort the conversion of an entire simulation.
+    """
+    tree_fname, output_root_dirname, desired_columns_dtype, colnums_to_yield, options = task
+
+    subvol_dirname = _subvol_dirname(output_root_dirname, tree_fname)
+
+    summary = dict(fname=tree_fname, subvol_dirname=subvol_dirname,
+        num_rows=0, num_trees=0, num_bytes=0, runtime=0., error=None, skipped=False)
+    start = time()
+    try:
+        num_rows, num_trees, num_bytes = _stream_tree_file_to_memmaps(
+            tree_fname, subvol_dirname, desired_columns_dtype, colnums_to_yield, **options)
+        summary.update(num_rows=num_rows, num_trees=num_trees, num_bytes=num_bytes)
+    except Exception:
+        summary['error'] = format_exc()
+    summary['runtime'] = time() - start
+    return summary
+
+
+def _stream_tree_file_to_memmaps(tree_fname, subvol_dirname, desired_columns_dtype,
+        colnums_to_yield, write_indexing_arrays_to_disk, memory_budget, num_workers_per_file,
+        write_tree_index, compression, chunk_size, zone_map_size, derived_data):
+    """ Stream the chunks of a tree file into the binaries stored in ``subvol_dirname``,
+    returning the number of rows, trees and bytes written to disk.
+    """
+    #  The ASCII block, its parsed copy and the tokenizer buffers
+    #  are all alive at the same time, so each gets a fraction of the budget.
+    #  In parallel mode, two blocks per worker are in flight.
+    block_size = max(memory_budget // (4*(1 + 2*(num_workers_per_file-1))), 2**16)
+
+    if (len(colnums_to_yield) == 0) and not (write_indexing_arrays_to_disk or write_tree_index):
+        #  Only the derived data is missing, which is built from the stored columns
+        for name, source_colnames in sorted(derived_data.items()):
+            _write_derived_data(subvol_dirname, name, source_colnames)
+        return 0, 0, 0
+
+    dt_tree_root_indices = np.dtype([('tree_root_indices', 'i8')])
+    dt_tree_root_ids = np.dtype([('tree_root_ids', 'i8')])
+
+    chunk_gen = full_tree_chunk_generator(tree_fname, desired_columns_dtype,
+        *colnums_to_yield, block_size=block_size, num_workers=num_workers_per_file,
+        index_dirname=subvol_dirname if write_tree_index else None)
+
+    writers = [StructuredArrayMemmapWriter(subvol_dirname, desired_columns_dtype,
+        compression=compression, chunk_size=chunk_size, zone_map_size=zone_map_size)]
+    if write_indexing_arrays_to_disk:
+        writers.append(StructuredArrayMemmapWriter(subvol_dirname, dt_tree_root_indices,
+            zone_map_size=None))
+        writers.append(StructuredArrayMemmapWriter(subvol_dirname, dt_tree_root_ids,
+            zone_map_size=None))
+
+    num_trees = 0
+    try:
+        for chunk, chunk_root_ids, chunk_root_indices in chunk_gen:
+            if write_indexing_arrays_to_disk:
+                writers[1].append(
+                    (chunk_root_indices + writers[0].num_rows).astype(dt_tree_root_indices))
+                writers[2].append(chunk_root_ids.astype(dt_tree_root_ids))
+            writers[0].append(chunk)
+            num_trees += len(chunk_root_ids)
+    finally:
+        for writer in writers:
+            writer.close()
+
+    #  The secondary indexes and the row pointers are built
+    #  from the stored columns once they are complete
+    for name, source_colnames in sorted(derived_data.items()):
+        _write_derived_data(subvol_dirname, name, source_colnames)
+
+    num_bytes = sum(writer.num_bytes for writer in writers)
+    return writers[0].num_rows, num_trees, num_bytes
+
+
+def full_tree_row_generator(ascii_tree_fname, *colnums_to_yield, **kwargs):
     """ Iterate over an input ASCII Consistent Trees file yielding
     all rows of the desired columns.
 
-    Each yielded row will contain a list of strings
+    Each yielded row will contain a tuple of bytes
     with length equal to len(colnums_to_yield).
     The final two elements yielded by the iterator are
     `tree_root_ids` and `tree_root_indices`.
 
+    The file is read as raw bytes in large blocks, and lines are never
+    decoded to text, so the yielded rows are identical for compressed
+    and uncompressed inputs under both Python 2 and Python 3.
+
+    Each line is only split up to the highest column in ``colnums_to_yield``,
+    so the remaining columns of the line are never tokenized.
+
     Parameters
     ----------
     ascii_tree_fname : string
@@ -69,11 +408,15 @@ def full_tree_row_generator(ascii_tree_fname, *colnums_to_yield):
     *colnums_to_yield : sequence of integers
         Sequence determines which columns the iterator will yield
 
+    block_size : int, optional
+        Number of bytes read from the file at a time. Default is 2**20.
+
     Returns
     -------
     string_data : tuple
         Tuple storing a row of requested column data.
-        Each column of the yielded row has its data stored as a string.
+        Each column of the yielded row has its data stored as bytes,
+        which `numpy.array` converts directly into numerical types.
 
     tree_root_ids : ndarray
         Integer array of shape (num_roots, ) storing the tree_root_ID of
@@ -83,6 +426,10 @@ def full_tree_row_generator(ascii_tree_fname, *colnums_to_yield):
         Integer array of shape (num_roots, ) storing the indices of
         the output `string_data` where each new tree starts.
 
+    See also
+    --------
+    full_tree_chunk_generator : much faster iteration over typed chunks of rows
+
     Examples
     --------
     The following toy example illustrates
@@ -93,7 +440,7 @@ def full_tree_row_generator(ascii_tree_fname, *colnums_to_yield):
     >>> tree_root_ids = result.pop()  # doctest: +SKIP
 
     The first element of ``result`` stores the first row of data in the tree file.
-    This element is a tuple of strings, which in this case will have four elements
+    This element is a tuple of bytes, which in this case will have four elements
     corresponding to the data stored in columns 0, 1, 2, and 10 of the tree file.
 
     >>> first_row_first_tree = result[0]  # doctest: +SKIP
@@ -116,38 +463,182 @@ def full_tree_row_generator(ascii_tree_fname, *colnums_to_yield):
 
     >>> assert tree_root_ids[1] == int(first_row_second_tree[1])  # doctest: +SKIP
     """
-    opener = _compression_safe_opener(ascii_tree_fname)
-    with opener(ascii_tree_fname, 'r') as f:
+    block_size = kwargs.get('block_size', 2**20)
 
-        # Skip the header, extracting num_trees
-        while True:
-            raw_header_line = next(f)
-            if raw_header_line[0] != '#':
-                break
+    with robust_open(ascii_tree_fname) as f:
 
-        num_trees = int(raw_header_line)
+        # Skip the header, extracting num_trees
+        num_trees = skip_tree_file_header(f)
         tree_root_indices = np.zeros(num_trees, dtype='i8')
         tree_root_ids = np.zeros(num_trees, dtype='i8')
         current_index = 0
         trunk_counter = 0
-        # Iterate over remaining ascii lines
-        while True:
-            try:
-                raw_line = next(f)
+        # Stop splitting each line after the highest requested column
+        maxsplit = max(colnums_to_yield) + 1 if len(colnums_to_yield) > 0 else 0
+        # Iterate over remaining ascii lines one block at a time
+        for block in ascii_block_generator(f, block_size):
+            for raw_line in block.splitlines():
                 current_index += 1
 
-                if raw_line[0] == '#':
+                if raw_line[:1] == b'#':
                     trunk_counter += 1
-                    current_trunk_id = raw_line.strip().split()[-1]
-                    tree_root_ids[trunk_counter-1] = current_trunk_id
+                    current_trunk_id = raw_line.split()[-1]
+                    tree_root_ids[trunk_counter-1] = int(current_trunk_id)
                     tree_root_indices[trunk_counter-1] = current_index - trunk_counter
                 else:
-                    list_of_strings = raw_line.strip().split()
-                    string_data = tuple(list_of_strings[idx] for idx in colnums_to_yield)
+                    list_of_bytes = raw_line.split(None, maxsplit)
+                    string_data = tuple(list_of_bytes[idx] for idx in colnums_to_yield)
                     yield string_data
 
-            except StopIteration:
-                break
-
     yield tree_root_ids
     yield tree_root_indices
+
+
+def full_tree_chunk_generator(ascii_tree_fname, desired_columns_dtype, *colnums_to_yield, **kwargs):
+    """ Iterate over an input ASCII Consistent Trees file yielding
+    the desired columns in typed chunks of many rows at a time.
+
+    Rather than splitting each line in Python, `full_tree_chunk_generator` reads
+    large blocks of lines and converts each block directly into a structured array
+    with dtype ``desired_columns_dtype``. The bookkeeping of `full_tree_row_generator`
+    is preserved on a per-chunk basis.
+
+    Parameters
+    ----------
+    ascii_tree_fname : string
+        Absolute path to ascii output of Consistent Trees
+
+    desired_columns_dtype : `numpy.dtype`
+        Structured dtype of the yielded chunks.
+        Must have the same length as ``colnums_to_yield``.
+
+    *colnums_to_yield : sequence of integers
+        Sequence determines which columns the iterator will yield
+
+    block_size : int, optional
+        Number of bytes of ASCII data read to build each chunk. Default is 2**24.
+
+    num_workers : int, optional
+        Number of processes parsing the file concurrently. Default is 1.
+        When ``num_workers`` > 1, the data section of the file is cut into byte ranges
+        aligned to tree boundaries and each range is parsed by a worker process.
+        The chunks are still yielded in file order, with identical bookkeeping.
+        Compressed files do not support random access, and so are always parsed serially.
+
+    index_dirname : string, optional
+        If passed, the per-tree byte-offset index of the file is built while parsing
+        and stored in ``index_dirname`` once the whole file has been read,
+        see `build_tree_index`. For gzip files, the access-point index of
+        `~ctwalker.utils.gzip_index.build_gzip_index` is built in the same pass.
+        Default is None, in which case no index is built.
+
+    Returns
+    -------
+    chunk : ndarray
+        Structured array with dtype ``desired_columns_dtype``
+        storing the next rows of the tree file
+
+    chunk_tree_root_ids : ndarray
+        Integer array storing the tree_root_ID of each tree beginning in ``chunk``
+
+    chunk_tree_root_indices : ndarray
+        Integer array storing the indices of ``chunk`` where each of these trees begins.
+        Adding the number of rows of all previously yielded chunks converts these into the
+        `tree_root_indices` returned by `full_tree_row_generator`.
+
+    Examples
+    --------
+    >>> dt = np.dtype([('scale_factor', 'f4'), ('halo_id', 'i8')])
+    >>> num_rows = 0
+    >>> for chunk, chunk_root_ids, chunk_root_indices in full_tree_chunk_generator(ascii_tree_fname, dt, 0, 1):  # doctest: +SKIP
+    ...     tree_root_indices = chunk_root_indices + num_rows
+    ...     num_rows += len(chunk)
+    """
+    block_size = kwargs.get('block_size', 2**24)
+    num_workers = kwargs.get('num_workers', 1)
+    index_dirname = kwargs.get('index_dirname', None)
+
+    desired_columns_dtype = np.dtype(desired_columns_dtype)
+    msg = ("Input ``desired_columns_dtype`` must have same length as ``colnums_to_yield``")
+    assert len(desired_columns_dtype) == len(colnums_to_yield), msg
+
+    if index_dirname is None:
+        tree_index_accumulator = None
+    else:
+        tree_index_accumulator = _TreeIndexAccumulator()
+
+    if num_workers > 1 and detect_compression(ascii_tree_fname) is None:
+        chunk_gen = _parallel_chunk_generator(ascii_tree_fname, desired_columns_dtype,
+            colnums_to_yield, block_size, num_workers, tree_index_accumulator)
+        for result in chunk_gen:
+            yield result
+    else:
+        f, indexing_reader = _open_for_sequential_scan(ascii_tree_fname, index_dirname is not None)
+        with f:
+            __ = skip_tree_file_header(f)
+            position = f.tell()
+
+            for block in ascii_block_generator(f, block_size):
+                tree_headers = None
+                if tree_index_accumulator is not None:
+                    tree_headers = locate_tree_headers(block)
+                    tree_root_ids, tree_root_indices, num_rows, tree_byte_offsets = tree_headers
+                    tree_index_accumulator.add(tree_root_ids, tree_root_indices, num_rows,
+                        tree_byte_offsets + position, position + len(block))
+                    position += len(block)
+                yield parse_ascii_block(block, desired_columns_dtype, colnums_to_yield,
+                    tree_headers=tree_headers)
+
+            if indexing_reader is not None:
+                indexing_reader.save(index_dirname)
+
+    if tree_index_accumulator is not None:
+        tree_index_accumulator.save(ascii_tree_fname, index_dirname)
+
+
+def _parallel_chunk_generator(ascii_tree_fname, desired_columns_dtype, colnums_to_yield,
+        block_size, num_workers, tree_index_accumulator=None):
+    """ Parse tree-aligned byte ranges of an uncompressed file in a pool of processes,
+    yielding the parsed chunks in file order.
+
+    At most two ranges per worker are in flight at any time,
+    so that memory stays bounded even when the consumer is slower than the workers.
+    """
+    with open(ascii_tree_fname, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        num_ranges = max(4*num_workers, int(np.ceil(f.tell()/float(block_size))))
+        byte_ranges = tree_aligned_byte_ranges(f, num_ranges)
+
+    task_iter = iter(list((ascii_tree_fname, start, stop, desired_columns_dtype, colnums_to_yield)
+        for start, stop in byte_ranges))
+
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        pending = deque(pool.apply_async(_parse_byte_range, (task, ))
+            for task in islice(task_iter, 2*num_workers))
+        while len(pending) > 0:
+            chunk, chunk_root_ids, chunk_root_indices, tree_byte_offsets, stop = (
+                pending.popleft().get())
+            for task in islice(task_iter, 1):
+                pending.append(pool.apply_async(_parse_byte_range, (task, )))
+            if tree_index_accumulator is not None:
+                tree_index_accumulator.add(chunk_root_ids, chunk_root_indices, len(chunk),
+                    tree_byte_offsets, stop)
+            yield chunk, chunk_root_ids, chunk_root_indices
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _parse_byte_range(task):
+    """ Parse the rows stored between two byte offsets of an uncompressed tree file,
+    also returning the byte offsets of its trees for the tree index.
+    """
+    ascii_tree_fname, start, stop, desired_columns_dtype, colnums_to_yield = task
+    with open(ascii_tree_fname, 'rb') as f:
+        block = read_byte_range(f, start, stop)
+    tree_headers = locate_tree_headers(block)
+    chunk, chunk_root_ids, chunk_root_indices = parse_ascii_block(
+        block, desired_columns_dtype, colnums_to_yield, tree_headers=tree_headers)
+    tree_byte_offsets = tree_headers[3] + start
+    return chunk, chunk_root_ids, chunk_root_indices, tree_byte_offsets, stop
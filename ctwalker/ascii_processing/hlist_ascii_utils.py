@@ -1,9 +1,11 @@
 """
 """
 import os
-import gzip
 from itertools import product
 
+from .block_parsing import skip_tree_file_header
+from ..utils import robust_open
+
 
 __all__ = ('get_subvolID_from_fname', )
 
@@ -55,27 +57,8 @@ def count_num_trees_in_hlist_file(fname):
     The algorithm used here will fail if the Consistent Trees
     header is formatted differently.
     """
-    opener = _compression_safe_opener(fname)
-    with opener(fname, 'r') as f:
-        current_char = '#'
-        while current_char == '#':
-            current_char = next(f)[0]
-    return int(current_char)
-
-
-def _compression_safe_opener(fname):
-    """ Determine whether to use *open* or *gzip.open* to read
-    the input file, depending on whether or not the file is compressed.
-    """
-    f = gzip.open(fname, 'r')
-    try:
-        f.read(1)
-        opener = gzip.open
-    except IOError:
-        opener = open
-    finally:
-        f.close()
-    return opener
+    with robust_open(fname) as f:
+        return skip_tree_file_header(f)
 
 
 def _parse_fname_into_substrings(fname):
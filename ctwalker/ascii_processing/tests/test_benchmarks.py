@@ -0,0 +1,28 @@
+"""
+"""
+import os
+import pytest
+
+from ..benchmarks import run_parser_benchmarks, compare_benchmark_results, _main
+
+
+__all__ = ('test_parser_benchmarks', 'test_compare_requires_output_fname')
+
+
+def test_parser_benchmarks(tmpdir):
+    output_fname = os.path.join(str(tmpdir), 'results.json')
+    results = run_parser_benchmarks(output_fname, num_trees_sequence=(3, ),
+        column_projections={'narrow': (1, 31)}, tmp_dirname=str(tmpdir))
+    assert len(results['runs']) == 6
+    for run in results['runs']:
+        assert run['rows_per_sec'] > 0
+        assert run['mb_per_sec'] > 0
+
+    comparison = compare_benchmark_results(output_fname, output_fname)
+    assert len(comparison) == 6
+    assert all(result['speedup'] == 1 for result in comparison)
+
+
+def test_compare_requires_output_fname(tmpdir):
+    with pytest.raises(SystemExit):
+        _main(['--compare', os.path.join(str(tmpdir), 'reference.json')])
@@ -0,0 +1,157 @@
+"""
+"""
+import os
+import json
+import numpy as np
+
+from ..full_tree import write_full_tree_memmaps
+from ..fake_trees import write_fake_tree_file
+from ..conversion_manifest import load_conversion_manifest, conversion_manifest_fname
+from ...utils.np_memmap_utils import load_memmap_column
+from ...memmap_processing import TreeCatalog
+from ...tree_walking import write_main_branch_reduction
+
+
+__all__ = ('test_resume_conversion', 'test_add_columns', 'test_add_derived_data',
+    'test_reconvert_after_adding_columns', 'test_reconvert_without_resume')
+
+
+def _write_fake_files(dirname, num_files):
+    fname_list = list(os.path.join(dirname, 'tree_0_0_{0}.dat'.format(i)) for i in range(num_files))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=4, seed=i)
+    return fname_list
+
+
+def test_resume_conversion(tmpdir):
+    fname_list = _write_fake_files(str(tmpdir), 3)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4')])
+
+    summary = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+    assert not any(s['skipped'] for s in summary)
+    manifest = load_conversion_manifest(output_dirname)
+    assert all(manifest[os.path.abspath(fname)]['status'] == 'complete' for fname in fname_list)
+
+    summary2 = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+    assert all(s['skipped'] for s in summary2)
+    assert list(s['num_rows'] for s in summary) == list(s['num_rows'] for s in summary2)
+
+    #  Simulate a modified tree file and a conversion interrupted part way through
+    write_fake_tree_file(fname_list[0], num_trees=6, seed=10)
+    manifest[os.path.abspath(fname_list[1])]['status'] = 'in_progress'
+    with open(conversion_manifest_fname(output_dirname), 'w') as f:
+        json.dump(dict(files=manifest), f)
+
+    summary3 = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+    assert list(s['skipped'] for s in summary3) == [False, False, True]
+    assert summary3[0]['num_trees'] == 6
+    reconverted = load_memmap_column(summary3[0]['subvol_dirname'], 'tree_root_ids')
+    assert len(reconverted) == 6
+
+    summary4 = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10, resume=False)
+    assert not any(s['skipped'] for s in summary4)
+
+
+def test_add_columns(tmpdir):
+    fname_list = _write_fake_files(str(tmpdir), 2)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4')])
+    summary = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+    halo_id_fname = os.path.join(summary[0]['subvol_dirname'], 'halo_id.npy')
+    os.utime(halo_id_fname, (0, 0))
+
+    dt2 = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('snap_num', 'i4')])
+    summary2 = write_full_tree_memmaps(fname_list, output_dirname, dt2, 1, 10, 31)
+    assert not any(s['skipped'] for s in summary2)
+    assert summary2[0]['num_bytes'] == 4*summary[0]['num_rows']
+    assert os.path.getmtime(halo_id_fname) == 0
+
+    snap_num = load_memmap_column(summary[0]['subvol_dirname'], 'snap_num')
+    assert len(snap_num) == summary[0]['num_rows']
+    assert snap_num[0] == 19
+
+    entry = load_conversion_manifest(output_dirname)[os.path.abspath(fname_list[0])]
+    assert sorted(entry['columns']) == ['halo_id', 'mvir', 'snap_num']
+    assert entry['columns']['snap_num'] == dict(colnum=31, dtype='<i4', shape=[])
+    assert entry['snapshot_index'] == 'snap_num'
+    assert entry['halo_id_index'] == 'halo_id'
+    assert os.path.isfile(os.path.join(
+        summary[0]['subvol_dirname'], 'snapshot_index', 'rows.npy'))
+
+    summary3 = write_full_tree_memmaps(fname_list, output_dirname, dt2, 1, 10, 31)
+    assert all(s['skipped'] for s in summary3)
+
+
+def test_add_derived_data(tmpdir):
+    fname_list = _write_fake_files(str(tmpdir), 2)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4')])
+    summary = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10,
+        write_halo_id_index=False)
+    halo_id_fname = os.path.join(summary[0]['subvol_dirname'], 'halo_id.npy')
+    os.utime(halo_id_fname, (0, 0))
+
+    #  The missing index is built from the stored columns without parsing the tree files
+    summary2 = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+    assert not any(s['skipped'] for s in summary2)
+    assert all(s['num_bytes'] == 0 for s in summary2)
+    assert list(s['num_rows'] for s in summary2) == list(s['num_rows'] for s in summary)
+    assert list(s['num_trees'] for s in summary2) == list(s['num_trees'] for s in summary)
+    assert os.path.getmtime(halo_id_fname) == 0
+    assert os.path.isdir(os.path.join(summary[0]['subvol_dirname'], 'halo_id_index'))
+
+    entry = load_conversion_manifest(output_dirname)[os.path.abspath(fname_list[0])]
+    assert entry['halo_id_index'] == 'halo_id'
+    assert entry['num_rows'] == summary[0]['num_rows']
+
+    summary3 = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+    assert all(s['skipped'] for s in summary3)
+
+
+def test_reconvert_after_adding_columns(tmpdir):
+    fname_list = _write_fake_files(str(tmpdir), 2)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('depth_first_id', 'i8'),
+        ('last_mainleaf_depthfirst_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10, 28, 34)
+    __ = write_main_branch_reduction(TreeCatalog(output_dirname), 'mpeak', 'mvir', 'max')
+
+    #  Columns added after the conversion are stale once the tree file changes
+    write_fake_tree_file(fname_list[0], num_trees=12, seed=10)
+    summary = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10, 28, 34)
+    assert list(s['skipped'] for s in summary) == [False, True]
+    assert not os.path.isfile(os.path.join(summary[0]['subvol_dirname'], 'mpeak.npy'))
+
+    catalog = TreeCatalog(output_dirname)
+    assert 'mpeak' not in catalog.colnames
+    __ = write_main_branch_reduction(catalog, 'mpeak', 'mvir', 'max')
+    assert len(TreeCatalog(output_dirname)['mpeak']) == len(catalog['halo_id'])
+
+
+def test_reconvert_without_resume(tmpdir):
+    fname_list = _write_fake_files(str(tmpdir), 2)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('depth_first_id', 'i8'),
+        ('last_mainleaf_depthfirst_id', 'i8')])
+    summary = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10, 28, 34)
+    __ = write_main_branch_reduction(TreeCatalog(output_dirname), 'mpeak', 'mvir', 'max')
+
+    #  Converting a single file from scratch removes its added columns
+    #  and keeps the manifest entry of the other file
+    summary2 = write_full_tree_memmaps(fname_list[:1], output_dirname, dt, 1, 10, 28, 34,
+        resume=False)
+    assert not summary2[0]['skipped']
+    assert not os.path.isfile(os.path.join(summary[0]['subvol_dirname'], 'mpeak.npy'))
+    assert os.path.isfile(os.path.join(summary[1]['subvol_dirname'], 'mpeak.npy'))
+
+    manifest = load_conversion_manifest(output_dirname)
+    assert set(manifest) == set(os.path.abspath(fname) for fname in fname_list)
+    assert all(entry['status'] == 'complete' for entry in manifest.values())
+
+    summary3 = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10, 28, 34)
+    assert all(s['skipped'] for s in summary3)
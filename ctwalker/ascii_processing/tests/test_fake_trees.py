@@ -1,38 +1,36 @@
 """
 """
 import os
-import shutil
 import numpy as np
 
 from .. import write_full_tree_memmaps
+from ..fake_trees import write_fake_tree_file
 from ...utils.directory_tree_iterators import fname_generator
 
 
-fake_tree_dirname = "/Users/aphearin/work/sims/bolplanck/fake_small_trees"
-if os.path.isdir(fake_tree_dirname):
-    HAS_FAKE_TREES = True
-else:
-    HAS_FAKE_TREES = False
+__all__ = ('test1', )
 
 
-__all__ = ('test1', )
+def test1(tmpdir):
+    fake_tree_dirname = os.path.join(str(tmpdir), 'fake_small_trees')
+    os.makedirs(fake_tree_dirname)
+    for i, suffix in enumerate(('.dat', '.dat', '.dat.gz')):
+        basename = 'tree_0_0_{0}{1}'.format(i, suffix)
+        write_fake_tree_file(os.path.join(fake_tree_dirname, basename),
+            num_trees=3, seed=i, first_halo_id=10**6*i)
 
+    filepat = "tree_*.dat*"
+    fname_list = list(fname_generator(fake_tree_dirname, filepat))
+    assert len(fname_list) == 3
 
-def test1():
-    if HAS_FAKE_TREES:
-        filepat = "tree_*.dat*"
-        fname_list = list(fname_generator(fake_tree_dirname, filepat))
+    output_dirname = os.path.join(str(tmpdir), "test_fake_small_trees")
+    os.makedirs(output_dirname)
 
-        output_dirname = os.path.join(os.path.dirname(fake_tree_dirname),
-                "test_fake_small_trees")
-        try:
-            shutil.rmtree(output_dirname)
-        except OSError:
-            pass
-        os.makedirs(output_dirname)
+    desired_columns_dtype = np.dtype([('scale_factor', 'f4'), ('halo_id', 'i8')])
+    colnums_to_yield = (0, 1)
 
-        desired_columns_dtype = np.dtype([('scale_factor', 'f4'), ('halo_id', 'i8')])
-        colnums_to_yield = (0, 1)
+    summary = write_full_tree_memmaps(fname_list, output_dirname,
+            desired_columns_dtype, *colnums_to_yield)
+    assert all(file_summary['error'] is None for file_summary in summary)
+    assert len(list(fname_generator(output_dirname, 'halo_id.npy'))) == 3
 
-        write_full_tree_memmaps(fname_list, output_dirname,
-                desired_columns_dtype, *colnums_to_yield)
@@ -0,0 +1,145 @@
+"""
+"""
+import os
+import numpy as np
+
+from ..full_tree import full_tree_row_generator, full_tree_chunk_generator
+from ..block_parsing import tree_aligned_byte_ranges, parse_ascii_block
+from ..fake_trees import write_fake_tree_file
+
+
+__all__ = ('test_chunk_generator_agrees_with_row_generator', 'test_chunk_generator_gzip',
+    'test_parallel_chunk_generator', 'test_row_generator_bytes',
+    'test_leading_column_projection')
+
+
+def _concatenate_chunks(chunk_gen):
+    chunks, tree_root_ids, tree_root_indices = [], [], []
+    num_rows = 0
+    for chunk, chunk_root_ids, chunk_root_indices in chunk_gen:
+        chunks.append(chunk)
+        tree_root_ids.append(chunk_root_ids)
+        tree_root_indices.append(chunk_root_indices + num_rows)
+        num_rows += len(chunk)
+    return (np.concatenate(chunks), np.concatenate(tree_root_ids),
+        np.concatenate(tree_root_indices))
+
+
+def test_chunk_generator_agrees_with_row_generator(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_0_0_0.dat')
+    num_halos = write_fake_tree_file(fname, num_trees=25)
+
+    dt = np.dtype([('mvir', 'f4'), ('scale_factor', 'f4'), ('halo_id', 'i8')])
+    colnums_to_yield = (10, 0, 1)
+
+    result = list(full_tree_row_generator(fname, *colnums_to_yield))
+    correct_tree_root_indices = result.pop()
+    correct_tree_root_ids = result.pop()
+    correct_arr = np.array(result, dtype=dt)
+
+    for block_size in (100, 5000, 2**24):
+        chunk_gen = full_tree_chunk_generator(fname, dt, *colnums_to_yield, block_size=block_size)
+        arr, tree_root_ids, tree_root_indices = _concatenate_chunks(chunk_gen)
+        assert len(arr) == num_halos
+        assert np.all(arr == correct_arr)
+        assert np.all(tree_root_ids == correct_tree_root_ids)
+        assert np.all(tree_root_indices == correct_tree_root_indices)
+        assert np.all(arr['halo_id'][tree_root_indices] == tree_root_ids)
+
+
+def test_chunk_generator_gzip(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_0_0_0.dat')
+    write_fake_tree_file(fname, num_trees=5)
+    gzip_fname = os.path.join(str(tmpdir), 'tree_0_0_1.dat.gz')
+    write_fake_tree_file(gzip_fname, num_trees=5)
+
+    dt = np.dtype([('halo_id', 'i8'), ('snap_num', 'i4')])
+    arr, tree_root_ids, tree_root_indices = _concatenate_chunks(
+        full_tree_chunk_generator(fname, dt, 1, 31, block_size=1000))
+    arr2, tree_root_ids2, tree_root_indices2 = _concatenate_chunks(
+        full_tree_chunk_generator(gzip_fname, dt, 1, 31, block_size=1000))
+    assert np.all(arr == arr2)
+    assert np.all(tree_root_ids == tree_root_ids2)
+    assert np.all(tree_root_indices == tree_root_indices2)
+
+
+def test_parallel_chunk_generator(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_0_0_0.dat')
+    write_fake_tree_file(fname, num_trees=40)
+
+    with open(fname, 'rb') as f:
+        byte_ranges = tree_aligned_byte_ranges(f, 7)
+        assert len(byte_ranges) == 7
+        for start, stop in byte_ranges:
+            f.seek(start)
+            assert f.read(6) == b'#tree '
+        assert byte_ranges[-1][1] == f.seek(0, 2)
+
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('depth_first_id', 'i8')])
+    serial_result = _concatenate_chunks(full_tree_chunk_generator(fname, dt, 1, 10, 28))
+    for block_size in (1000, 2**20):
+        parallel_result = _concatenate_chunks(full_tree_chunk_generator(
+            fname, dt, 1, 10, 28, num_workers=3, block_size=block_size))
+        for a, b in zip(serial_result, parallel_result):
+            assert np.all(a == b)
+
+
+def test_row_generator_bytes(tmpdir):
+    """ Rows are yielded as bytes regardless of whether the input is compressed.
+    """
+    fname = os.path.join(str(tmpdir), 'tree_0_0_0.dat')
+    write_fake_tree_file(fname, num_trees=5)
+    gzip_fname = os.path.join(str(tmpdir), 'tree_0_0_1.dat.gz')
+    write_fake_tree_file(gzip_fname, num_trees=5)
+
+    result = list(full_tree_row_generator(fname, 1, 10, block_size=500))
+    result2 = list(full_tree_row_generator(gzip_fname, 1, 10))
+    assert all(isinstance(value, bytes) for value in result[0])
+    assert result[:-2] == result2[:-2]
+    for a, b in zip(result[-2:], result2[-2:]):
+        assert np.all(a == b)
+
+
+def test_leading_column_projection():
+    """ Parsing only the leading columns of a block agrees with the full parse,
+    even when the fields following the last requested column are malformed or missing.
+    """
+    num_trees, num_halos_per_tree, num_trailing = 20, 50, 40
+    lines = []
+    for itree in range(num_trees):
+        lines.append('#tree {0}'.format(1000 + itree).encode())
+        for ihalo in range(num_halos_per_tree):
+            halo_id = 1000*itree + ihalo
+            leading = '{0:.4f} {1} {2} {3:.6e}'.format(0.1 + ihalo/100., halo_id, itree, 1e10*(1 + ihalo))
+            trailing = ' '.join('{0:.8e}'.format(halo_id*0.5 + i) for i in range(num_trailing))
+            lines.append('{0} {1}'.format(leading, trailing).encode())
+    block = b'\n'.join(lines) + b'\n'
+
+    full_dt = np.dtype([('c{0}'.format(i), 'f8') for i in range(4 + num_trailing)])
+    colnums_to_yield = (3, 1)
+    dt = np.dtype([('mvir', 'f8'), ('halo_id', 'i8')])
+    full_chunk, tree_root_ids, tree_root_indices = parse_ascii_block(
+        block, full_dt, tuple(range(4 + num_trailing)))
+    chunk, tree_root_ids2, tree_root_indices2 = parse_ascii_block(block, dt, colnums_to_yield)
+    assert np.all(chunk['mvir'] == full_chunk['c3'])
+    assert np.all(chunk['halo_id'] == full_chunk['c1'])
+    assert np.all(tree_root_ids == tree_root_ids2)
+    assert np.all(tree_root_indices == tree_root_indices2)
+
+    #  Corrupt or truncate the trailing fields of some of the halos
+    damaged_lines = []
+    for i, line in enumerate(block.split(b'\n')[:-1]):
+        if line.startswith(b'#'):
+            damaged_lines.append(line)
+        elif i % 7 == 0:
+            damaged_lines.append(b' '.join(line.split()[:4]))
+        elif i % 7 == 3:
+            damaged_lines.append(b' '.join(line.split()[:6]) + b' not-a-number 1e')
+        else:
+            damaged_lines.append(line)
+    damaged_block = b'\n'.join(damaged_lines) + b'\n'
+    chunk2, tree_root_ids2, tree_root_indices2 = parse_ascii_block(
+        damaged_block, dt, colnums_to_yield)
+    assert np.all(chunk2 == chunk)
+    assert np.all(tree_root_ids == tree_root_ids2)
+    assert np.all(tree_root_indices == tree_root_indices2)
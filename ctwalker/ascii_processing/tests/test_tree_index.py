@@ -0,0 +1,116 @@
+"""
+"""
+import os
+import pytest
+import numpy as np
+
+from ..full_tree import full_tree_row_generator, write_full_tree_memmaps
+from ..tree_index import build_tree_index, load_tree_index, read_trees, tree_index_fname
+from ..fake_trees import write_fake_tree_file
+from ...utils.gzip_index import HAS_LIBZ, gzip_index_fname
+
+
+__all__ = ('test_tree_index_bookkeeping', 'test_read_trees',
+    'test_tree_index_written_during_conversion')
+
+
+def _correct_result(fname, dt, colnums_to_yield):
+    result = list(full_tree_row_generator(fname, *colnums_to_yield))
+    tree_root_indices = result.pop()
+    tree_root_ids = result.pop()
+    return np.array(result, dtype=dt), tree_root_ids, tree_root_indices
+
+
+def test_tree_index_bookkeeping(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_0_0_0.dat')
+    num_halos = write_fake_tree_file(fname, num_trees=30)
+    arr, tree_root_ids, tree_root_indices = _correct_result(fname, [('halo_id', 'i8')], (1, ))
+
+    tree_index = build_tree_index(fname, block_size=1000)
+    assert os.path.isfile(tree_index_fname(fname))
+    assert np.all(tree_index['tree_root_id'] == tree_root_ids)
+    assert np.all(tree_index['first_row'] == tree_root_indices)
+    assert tree_index['num_halos'].sum() == num_halos
+    assert np.all(load_tree_index(fname) == tree_index)
+
+    with open(fname, 'rb') as f:
+        for byte_offset, tree_root_id in zip(tree_index['byte_offset'], tree_root_ids):
+            f.seek(byte_offset)
+            assert f.readline() == '#tree {0}\n'.format(tree_root_id).encode()
+
+    index_dirname = os.path.join(str(tmpdir), 'index_dir')
+    os.makedirs(index_dirname)
+    __ = build_tree_index(fname, index_dirname=index_dirname)
+    assert os.path.isfile(tree_index_fname(fname, index_dirname))
+
+    #  A rewrite of the same size is detected from the modification time
+    stat = os.stat(fname)
+    os.utime(fname, (stat.st_atime, stat.st_mtime + 10))
+    with pytest.raises(ValueError):
+        __ = load_tree_index(fname)
+
+    __ = build_tree_index(fname)
+    with open(fname, 'ab') as f:
+        f.write(b'#tree 1000000\n')
+    with pytest.raises(ValueError):
+        __ = load_tree_index(fname)
+
+
+def test_read_trees(tmpdir):
+    dt = np.dtype([('mvir', 'f4'), ('halo_id', 'i8')])
+    colnums_to_yield = (10, 1)
+    for basename in ('tree_0_0_0.dat', 'tree_0_0_1.dat.gz'):
+        fname = os.path.join(str(tmpdir), basename)
+        write_fake_tree_file(fname, num_trees=30)
+        arr, tree_root_ids, tree_root_indices = _correct_result(
+            fname.replace('_1.dat.gz', '_0.dat'), dt, colnums_to_yield)
+        tree_root_stops = np.append(tree_root_indices[1:], len(arr))
+
+        requested = np.array([17, 3, 4, 5, 29, 0, 3])
+        result, result_ids, result_indices = read_trees(fname, dt, *colnums_to_yield,
+            tree_indices=requested)
+        assert np.all(result_ids == tree_root_ids[requested])
+        for itree, istart in zip(requested, result_indices):
+            num_halos = tree_root_stops[itree] - tree_root_indices[itree]
+            correct_tree = arr[tree_root_indices[itree]:tree_root_stops[itree]]
+            assert np.all(result[istart:istart+num_halos] == correct_tree)
+        assert len(result) == sum(tree_root_stops[requested] - tree_root_indices[requested])
+
+        result2 = read_trees(fname, dt, *colnums_to_yield,
+            tree_root_ids=tree_root_ids[requested])[0]
+        assert np.all(result == result2)
+
+        #  Reads of adjacent trees are split to respect max_read_bytes
+        for max_read_bytes in (1, 2000):
+            result3 = read_trees(fname, dt, *colnums_to_yield, tree_indices=requested,
+                max_read_bytes=max_read_bytes)[0]
+            assert np.all(result == result3)
+
+    with pytest.raises(KeyError):
+        __ = read_trees(fname, dt, *colnums_to_yield, tree_root_ids=[-5])
+
+
+@pytest.mark.skipif('not HAS_LIBZ')
+def test_tree_index_written_during_conversion(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_0_0_0.dat')
+    write_fake_tree_file(fname, num_trees=30)
+    gzip_fname = os.path.join(str(tmpdir), 'tree_0_0_1.dat.gz')
+    write_fake_tree_file(gzip_fname, num_trees=30)
+
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('mvir', 'f4'), ('halo_id', 'i8')])
+    write_full_tree_memmaps([fname, gzip_fname], output_dirname, dt, 10, 1,
+        write_tree_index=True, memory_budget=2**17)
+
+    correct_tree_index = build_tree_index(fname)
+    for tree_fname, subvol in zip((fname, gzip_fname), ('subvol_0_0_0', 'subvol_0_0_1')):
+        index_dirname = os.path.join(output_dirname, subvol)
+        tree_index = load_tree_index(tree_fname, index_dirname)
+        assert np.all(tree_index == correct_tree_index)
+
+        result = read_trees(tree_fname, dt, 10, 1, tree_indices=[20, 3],
+            index_dirname=index_dirname)
+        correct_result = read_trees(fname, dt, 10, 1, tree_indices=[20, 3])
+        for a, b in zip(result, correct_result):
+            assert np.all(a == b)
+    assert os.path.isfile(gzip_index_fname(gzip_fname, os.path.join(output_dirname, 'subvol_0_0_1')))
@@ -0,0 +1,73 @@
+"""
+"""
+import os
+import warnings
+import numpy as np
+
+from ..full_tree import full_tree_row_generator, write_full_tree_memmaps
+from ..fake_trees import write_fake_tree_file
+from ...utils.np_memmap_utils import load_memmap_column
+
+
+__all__ = ('test_streaming_writer_agrees_with_row_generator',
+    'test_parallel_conversion_summary')
+
+
+def test_streaming_writer_agrees_with_row_generator(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_1_2_3.dat')
+    write_fake_tree_file(fname, num_trees=20)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+
+    dt = np.dtype([('scale_factor', 'f4'), ('halo_id', 'i8'), ('mvir', 'f4')])
+    colnums_to_yield = (0, 1, 10)
+    write_full_tree_memmaps([fname], output_dirname, dt, *colnums_to_yield,
+        memory_budget=1000)
+
+    result = list(full_tree_row_generator(fname, *colnums_to_yield))
+    correct_tree_root_indices = result.pop()
+    correct_tree_root_ids = result.pop()
+    correct_arr = np.array(result, dtype=dt)
+
+    subvol_dirname = os.path.join(output_dirname, 'subvol_1_2_3')
+    for colname in dt.names:
+        arr = load_memmap_column(subvol_dirname, colname)
+        assert arr.dtype == dt[colname]
+        assert np.all(arr == correct_arr[colname])
+
+    tree_root_indices = load_memmap_column(subvol_dirname, 'tree_root_indices')
+    assert np.all(tree_root_indices == correct_tree_root_indices)
+    tree_root_ids = load_memmap_column(subvol_dirname, 'tree_root_ids')
+    assert np.all(tree_root_ids == correct_tree_root_ids)
+
+
+def test_parallel_conversion_summary(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(3))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=5, seed=i)
+    bad_fname = os.path.join(str(tmpdir), 'tree_1_1_1.dat')
+    with open(bad_fname, 'w') as f:
+        f.write('#header\n2\n#tree 4\n1 2 3\nnot a number\n')
+    fname_list.append(bad_fname)
+
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4')])
+    serial_dirname = os.path.join(str(tmpdir), 'serial')
+    parallel_dirname = os.path.join(str(tmpdir), 'parallel')
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        serial_summary = write_full_tree_memmaps(fname_list, serial_dirname, dt, 1, 10)
+        parallel_summary = write_full_tree_memmaps(fname_list, parallel_dirname, dt, 1, 10,
+            num_workers=2)
+    assert len(w) == 2
+    assert bad_fname in str(w[0].message)
+
+    assert list(s['fname'] for s in parallel_summary) == fname_list
+    for s1, s2 in zip(serial_summary[:-1], parallel_summary[:-1]):
+        assert s1['error'] is None
+        assert s2['error'] is None
+        assert s1['num_rows'] == s2['num_rows'] > 0
+        assert s1['num_trees'] == s2['num_trees'] == 5
+        assert s1['num_bytes'] == s2['num_bytes'] == s1['num_rows']*dt.itemsize + 5*8*2
+        arr1 = load_memmap_column(s1['subvol_dirname'], 'mvir')
+        arr2 = load_memmap_column(s2['subvol_dirname'], 'mvir')
+        assert np.all(arr1 == arr2)
+    assert 'ValueError' in parallel_summary[-1]['error']
@@ -0,0 +1,336 @@
+""" Module storing functions used to build a persistent index of the
+byte offset of every tree in an ASCII Consistent Trees file,
+and to use this index to parse individual trees without scanning the entire file.
+"""
+import io
+import os
+import numpy as np
+
+from .block_parsing import skip_tree_file_header, ascii_block_generator
+from .block_parsing import locate_tree_headers, parse_ascii_block, read_byte_range
+from ..utils import robust_open, detect_compression
+from ..utils.array_utils import ragged_ranges
+from ..utils.gzip_index import HAS_LIBZ, GzipIndexingReader, open_gzip_indexed
+
+
+__all__ = ('build_tree_index', 'load_tree_index', 'read_trees', 'tree_index_fname')
+
+
+tree_index_dtype = np.dtype([('tree_root_id', 'i8'), ('byte_offset', 'i8'),
+    ('num_bytes', 'i8'), ('first_row', 'i8'), ('num_halos', 'i8')])
+
+
+def tree_index_fname(ascii_tree_fname, index_dirname=None):
+    """ Filename of the tree index of ``ascii_tree_fname``.
+
+    By default, the index is stored next to the tree file,
+    e.g., the index of 'some/path/tree_0_1_2.dat' is 'some/path/tree_0_1_2.dat.tree_index.npz'.
+    """
+    if index_dirname is None:
+        index_dirname = os.path.dirname(os.path.abspath(ascii_tree_fname))
+    return os.path.join(index_dirname, os.path.basename(ascii_tree_fname) + '.tree_index.npz')
+
+
+def build_tree_index(ascii_tree_fname, index_dirname=None, block_size=2**24):
+    """ Scan an ASCII Consistent Trees file once, recording the byte offset,
+    the tree root ID and the number of halos of every tree, and store the result on disk.
+
+    For gzip-compressed files, the access-point index of
+    `~ctwalker.utils.gzip_index.build_gzip_index` is built during the same pass
+    and stored in the same directory, so that `read_trees` can later seek
+    into the compressed file without decompressing it from the beginning.
+
+    Parameters
+    ----------
+    ascii_tree_fname : string
+        Absolute path to ascii output of Consistent Trees
+
+    index_dirname : string, optional
+        Directory where the index will be stored,
+        e.g., the ``subvol_X_Y_Z`` directory of the converted file.
+        Default is to store the index in the same directory as the tree file.
+
+    block_size : int, optional
+        Number of bytes of ASCII data read at a time. Default is 2**24.
+
+    Returns
+    -------
+    tree_index : ndarray
+        Structured array of shape (num_trees, ) with fields ``tree_root_id``,
+        ``byte_offset``, ``num_bytes``, ``first_row`` and ``num_halos``.
+        For compressed files, byte offsets refer to the decompressed data.
+    """
+    tree_index_accumulator = _TreeIndexAccumulator()
+
+    f, indexing_reader = _open_for_sequential_scan(ascii_tree_fname, True)
+    with f:
+        __ = skip_tree_file_header(f)
+        position = f.tell()
+
+        for block in ascii_block_generator(f, block_size):
+            tree_index_accumulator.add_block(block, position)
+            position += len(block)
+
+        if indexing_reader is not None:
+            indexing_reader.save(index_dirname)
+
+    return tree_index_accumulator.save(ascii_tree_fname, index_dirname)
+
+
+def load_tree_index(ascii_tree_fname, index_dirname=None):
+    """ Load the tree index of ``ascii_tree_fname`` stored by `build_tree_index`.
+
+    Parameters
+    ----------
+    ascii_tree_fname : string
+        Absolute path to ascii output of Consistent Trees
+
+    index_dirname : string, optional
+        Directory where the index is stored. Default is the directory of the tree file.
+
+    Returns
+    -------
+    tree_index : ndarray
+        Structured array returned by `build_tree_index`
+    """
+    index_fname = tree_index_fname(ascii_tree_fname, index_dirname)
+    with np.load(index_fname) as data:
+        tree_index = data['tree_index']
+        source_size = int(data['source_size'])
+        source_mtime = float(data['source_mtime']) if 'source_mtime' in data.files else None
+
+    stat = os.stat(ascii_tree_fname)
+    is_stale = ((source_size != stat.st_size) or
+        ((source_mtime is not None) and (source_mtime != stat.st_mtime)))
+    if is_stale:
+        msg = ("The tree index {0} is stale: ``{1}`` has changed since the index was built.\n"
+            "Rebuild the index with build_tree_index".format(index_fname, ascii_tree_fname))
+        raise ValueError(msg)
+    return tree_index
+
+
+def read_trees(ascii_tree_fname, desired_columns_dtype, *colnums_to_yield, **kwargs):
+    """ Parse only the requested trees of an ASCII Consistent Trees file,
+    seeking directly to each of them with the index built by `build_tree_index`.
+
+    Trees that are adjacent in the file are read with a single read of at most
+    ``max_read_bytes`` bytes, so that fetching a set of trees costs a few seeks
+    rather than a full pass, without loading the entire file into memory.
+
+    Parameters
+    ----------
+    ascii_tree_fname : string
+        Absolute path to ascii output of Consistent Trees
+
+    desired_columns_dtype : `numpy.dtype`
+        Structured dtype of the returned data.
+        Must have the same length as ``colnums_to_yield``.
+
+    *colnums_to_yield : sequence of integers
+        Sequence determines which columns will be returned
+
+    tree_root_ids : sequence of integers, optional
+        Tree root IDs of the requested trees
+
+    tree_indices : sequence of integers, optional
+        Positions in the file of the requested trees, i.e., 0 for the first tree.
+        Exactly one of ``tree_root_ids`` or ``tree_indices`` must be passed.
+
+    index_dirname : string, optional
+        Directory where the index is stored. Default is the directory of the tree file.
+        If no index exists yet, it will be built and stored there.
+
+    max_read_bytes : int, optional
+        Maximum number of bytes of adjacent trees read at once.
+        Trees larger than ``max_read_bytes`` are read alone. Default is 2**26.
+
+    Returns
+    -------
+    arr : ndarray
+        Structured array with dtype ``desired_columns_dtype`` storing the rows of the
+        requested trees, in the order in which the trees were requested
+
+    tree_root_ids : ndarray
+        Integer array storing the tree_root_ID of each requested tree
+
+    tree_root_indices : ndarray
+        Integer array storing the indices of ``arr`` where each requested tree begins
+
+    Examples
+    --------
+    >>> __ = build_tree_index(ascii_tree_fname)  # doctest: +SKIP
+    >>> dt = np.dtype([('scale_factor', 'f4'), ('mvir', 'f4')])
+    >>> arr, root_ids, root_indices = read_trees(ascii_tree_fname, dt, 0, 10, tree_root_ids=[3060299107, 3060312953])  # doctest: +SKIP
+    """
+    requested_root_ids = kwargs.get('tree_root_ids', None)
+    requested_indices = kwargs.get('tree_indices', None)
+    index_dirname = kwargs.get('index_dirname', None)
+    max_read_bytes = kwargs.get('max_read_bytes', 2**26)
+
+    msg = "Must pass exactly one of the ``tree_root_ids`` or ``tree_indices`` keyword arguments"
+    assert (requested_root_ids is None) != (requested_indices is None), msg
+
+    desired_columns_dtype = np.dtype(desired_columns_dtype)
+    msg = ("Input ``desired_columns_dtype`` must have same length as ``colnums_to_yield``")
+    assert len(desired_columns_dtype) == len(colnums_to_yield), msg
+
+    try:
+        tree_index = load_tree_index(ascii_tree_fname, index_dirname)
+    except IOError:
+        tree_index = build_tree_index(ascii_tree_fname, index_dirname)
+
+    if requested_indices is None:
+        requested_indices = _tree_indices_from_root_ids(tree_index, requested_root_ids)
+    requested_indices = np.atleast_1d(requested_indices).astype('i8')
+
+    #  Parse each distinct tree once, in file order, merging adjacent trees into one read
+    unique_indices, inverse = np.unique(requested_indices, return_inverse=True)
+    reads = _merged_reads(tree_index['num_bytes'][unique_indices], unique_indices, max_read_bytes)
+
+    chunks = []
+    with _open_for_random_access(ascii_tree_fname, index_dirname) as f:
+        for istart, istop in reads:
+            first, last = tree_index[unique_indices[istart]], tree_index[unique_indices[istop-1]]
+            block = read_byte_range(f, first['byte_offset'],
+                last['byte_offset'] + last['num_bytes'])
+            chunk = parse_ascii_block(block, desired_columns_dtype, colnums_to_yield)[0]
+            if len(chunk) != last['first_row'] + last['num_halos'] - first['first_row']:
+                msg = ("The tree index of ``{0}`` does not match the file.\n"
+                    "Rebuild the index with build_tree_index".format(ascii_tree_fname))
+                raise ValueError(msg)
+            chunks.append(chunk)
+
+    #  Rearrange the trees into the requested order
+    num_halos = tree_index['num_halos'][unique_indices]
+    unique_starts = np.cumsum(num_halos) - num_halos
+    requested_num_halos = num_halos[inverse]
+    __, rows = ragged_ranges(unique_starts[inverse], unique_starts[inverse] + requested_num_halos)
+    if len(chunks) > 0:
+        arr = np.concatenate(chunks)[rows]
+    else:
+        arr = np.zeros(0, dtype=desired_columns_dtype)
+
+    tree_root_ids = tree_index['tree_root_id'][requested_indices]
+    tree_root_indices = np.cumsum(requested_num_halos) - requested_num_halos
+    return arr, tree_root_ids, tree_root_indices
+
+
+def _merged_reads(num_bytes, tree_indices, max_read_bytes):
+    """ List of (istart, istop) pairs of positions in the sorted array ``tree_indices``,
+    each spanning consecutive trees storing at most ``max_read_bytes`` bytes, or a single tree.
+    """
+    run_edges = np.flatnonzero(np.diff(tree_indices) != 1) + 1
+    run_starts = np.append(0, run_edges)
+    run_stops = np.append(run_edges, len(tree_indices))
+    cumulative_bytes = np.cumsum(num_bytes)
+
+    reads = []
+    for istart, istop in zip(run_starts, run_stops):
+        while istart < istop:
+            first_byte = cumulative_bytes[istart] - num_bytes[istart]
+            inext = np.searchsorted(cumulative_bytes, first_byte + max_read_bytes, side='right')
+            inext = min(max(int(inext), istart + 1), istop)
+            reads.append((istart, inext))
+            istart = inext
+    return reads
+
+
+def _tree_indices_from_root_ids(tree_index, tree_root_ids):
+    """ Positions in the file of the trees with the input root IDs.
+    """
+    tree_root_ids = np.atleast_1d(tree_root_ids).astype('i8')
+    idx_sorted = np.argsort(tree_index['tree_root_id'])
+    sorted_ids = tree_index['tree_root_id'][idx_sorted]
+    pos = np.searchsorted(sorted_ids, tree_root_ids)
+
+    is_missing = pos == len(sorted_ids)
+    is_missing[~is_missing] = sorted_ids[pos[~is_missing]] != tree_root_ids[~is_missing]
+    if np.any(is_missing):
+        msg = "The following tree root IDs do not appear in the tree file:\n{0}"
+        raise KeyError(msg.format(tree_root_ids[is_missing]))
+    return idx_sorted[pos]
+
+
+class _TreeIndexAccumulator(object):
+    """ Collect the tree index of a file from consecutive blocks of its data section.
+    """
+
+    def __init__(self):
+        self.tree_root_ids, self.first_rows, self.byte_offsets = [], [], []
+        self.num_rows = 0
+        self.end_position = 0
+
+    def add(self, tree_root_ids, tree_root_indices, num_rows, tree_byte_offsets, end_position):
+        """ Add the trees beginning in the next block of the file.
+
+        Parameters
+        ----------
+        tree_root_ids, tree_root_indices, num_rows
+            Bookkeeping of the block, as returned by `locate_tree_headers`
+
+        tree_byte_offsets : ndarray
+            Byte offsets of the '#tree' lines of the block with respect to the start of the file
+
+        end_position : int
+            Byte offset of the end of the block with respect to the start of the file
+        """
+        self.tree_root_ids.append(tree_root_ids)
+        self.first_rows.append(tree_root_indices + self.num_rows)
+        self.byte_offsets.append(tree_byte_offsets)
+        self.num_rows += num_rows
+        self.end_position = end_position
+
+    def add_block(self, block, position):
+        """ Add the trees of the block of data beginning at byte offset ``position``.
+        """
+        tree_root_ids, tree_root_indices, num_rows, tree_byte_offsets = locate_tree_headers(block)
+        self.add(tree_root_ids, tree_root_indices, num_rows,
+            tree_byte_offsets + position, position + len(block))
+
+    def save(self, ascii_tree_fname, index_dirname=None):
+        """ Store the tree index of ``ascii_tree_fname`` and return it.
+        """
+        tree_index = np.zeros(sum(len(ids) for ids in self.tree_root_ids), dtype=tree_index_dtype)
+        if len(tree_index) > 0:
+            tree_index['tree_root_id'] = np.concatenate(self.tree_root_ids)
+            tree_index['first_row'] = np.concatenate(self.first_rows)
+            tree_index['byte_offset'] = np.concatenate(self.byte_offsets)
+        tree_index['num_halos'] = np.diff(np.append(tree_index['first_row'], self.num_rows))
+        tree_index['num_bytes'] = np.diff(np.append(tree_index['byte_offset'], self.end_position))
+
+        stat = os.stat(ascii_tree_fname)
+        np.savez(tree_index_fname(ascii_tree_fname, index_dirname), tree_index=tree_index,
+            source_size=stat.st_size, source_mtime=stat.st_mtime)
+        return tree_index
+
+
+def _open_for_sequential_scan(ascii_tree_fname, build_gzip_index):
+    """ Open a tree file for one sequential pass in binary mode.
+
+    When ``build_gzip_index`` is True and the file is gzip-compressed, the file is read
+    through a `~ctwalker.utils.gzip_index.GzipIndexingReader` that is also returned,
+    so that its access-point index can be saved at the end of the pass.
+    Otherwise the second returned value is None.
+    """
+    is_gzip = detect_compression(ascii_tree_fname) == 'gzip'
+    if build_gzip_index and is_gzip and HAS_LIBZ:
+        indexing_reader = GzipIndexingReader(ascii_tree_fname)
+        return io.BufferedReader(indexing_reader, 2**20), indexing_reader
+    else:
+        return robust_open(ascii_tree_fname), None
+
+
+def _open_for_random_access(ascii_tree_fname, index_dirname=None):
+    """ Open a tree file in binary mode for seeking, using the access-point index
+    of gzip-compressed files when one is available and up to date.
+    """
+    compression = detect_compression(ascii_tree_fname)
+    if compression is None:
+        return open(ascii_tree_fname, 'rb')
+
+    if compression == 'gzip':
+        try:
+            return open_gzip_indexed(ascii_tree_fname, index_dirname=index_dirname)
+        except (IOError, ImportError, ValueError):
+            pass
+    return robust_open(ascii_tree_fname)
@@ -0,0 +1,7 @@
+"""
+Subpackage storing readers of the memory-mapped binaries
+written by `~ctwalker.ascii_processing.write_full_tree_memmaps`.
+"""
+from .subvol_reader import *
+from .catalog import *
+from .tree_generators import *
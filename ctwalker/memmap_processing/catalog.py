@@ -0,0 +1,454 @@
+""" Module storing the virtual catalog spanning every subvolume
+written by `~ctwalker.ascii_processing.write_full_tree_memmaps`.
+"""
+import os
+import numpy as np
+
+from .subvol_reader import SubvolMemmapReader
+from ..ascii_processing.hlist_ascii_utils import get_subvolID_from_fname
+from ..utils.directory_tree_iterators import subdirname_generator
+from ..utils.halo_id_index import write_halo_id_index, load_halo_id_index
+from ..utils.np_memmap_utils import _column_memmap_fname
+from ..utils.chunked_column import chunked_column_fname
+from ..utils.array_utils import normalize_row_index
+
+
+__all__ = ('TreeCatalog', 'VirtualColumn')
+
+
+class TreeCatalog(object):
+    """ Class providing a single view of all the ``subvol_X_Y_Z`` directories
+    of a converted simulation.
+
+    The subvolumes are ordered by subvolume ID, and the catalog stores the
+    cumulative number of rows and trees of each subvolume in the ``row_offsets``
+    and ``tree_offsets`` arrays. Each column is exposed as a `VirtualColumn` spanning
+    the entire box, whose global indices are translated into indices into the
+    memmap of the relevant subvolume, so that no data is ever concatenated.
+
+    Examples
+    --------
+    >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+    >>> mvir = catalog['mvir']  # doctest: +SKIP
+    >>> num_halos = len(mvir)  # doctest: +SKIP
+    >>> last_halos = mvir[-1000:]  # doctest: +SKIP
+    >>> tree = catalog.read_tree('mvir', 'scale_factor', tree_index=123456)  # doctest: +SKIP
+    """
+
+    def __init__(self, output_root_dirname):
+        """
+        Parameters
+        ----------
+        output_root_dirname : string
+            Directory storing the ``subvol_X_Y_Z`` subdirectories
+        """
+        self.output_root_dirname = output_root_dirname
+
+        subvol_dirnames = list(subdirname_generator(output_root_dirname, 'subvol_*',
+            recursive=False))
+        if len(subvol_dirnames) == 0:
+            msg = "No ``subvol_X_Y_Z`` directories in ``{0}``".format(output_root_dirname)
+            raise IOError(msg)
+        subvol_dirnames.sort(key=lambda dirname: get_subvolID_from_fname(
+            os.path.basename(dirname)))
+
+        self.subvol_ids = list(get_subvolID_from_fname(os.path.basename(dirname))
+            for dirname in subvol_dirnames)
+        self.subvols = list(SubvolMemmapReader(dirname) for dirname in subvol_dirnames)
+        self.row_offsets = np.cumsum([0] + list(subvol.num_rows for subvol in self.subvols))
+        self.tree_offsets = np.cumsum([0] + list(subvol.num_trees for subvol in self.subvols))
+
+        self._columns = {}
+        self._root_id_sorting = None
+        self._halo_id_index = None
+        self._halo_id_index_is_loaded = False
+
+    @property
+    def num_rows(self):
+        """ Total number of halos in the box.
+        """
+        return int(self.row_offsets[-1])
+
+    @property
+    def num_trees(self):
+        """ Total number of trees in the box.
+        """
+        return int(self.tree_offsets[-1])
+
+    @property
+    def colnames(self):
+        """ Names of the columns stored in every subvolume.
+        """
+        colnames = set(self.subvols[0].colnames)
+        for subvol in self.subvols[1:]:
+            colnames &= set(subvol.colnames)
+        return tuple(sorted(colnames))
+
+    def __getitem__(self, colname):
+        """ `VirtualColumn` spanning all subvolumes.
+        """
+        try:
+            return self._columns[colname]
+        except KeyError:
+            column = VirtualColumn(self, colname)
+            self._columns[colname] = column
+            return column
+
+    def reload_column(self, colname):
+        """ Discard the `VirtualColumn` of ``colname`` and the memmaps of the column
+        cached by every subvolume, see `SubvolMemmapReader.reload_column`.
+        """
+        self._columns.pop(colname, None)
+        for subvol in self.subvols:
+            subvol.reload_column(colname)
+
+    def locate_rows(self, rows):
+        """ Translate global row indices into subvolume indices and local row indices.
+
+        Parameters
+        ----------
+        rows : int or ndarray
+            Global row indices, between 0 and ``num_rows``
+
+        Returns
+        -------
+        subvol_indices : int or ndarray
+            Position of the subvolume storing each row in ``subvols``
+
+        local_rows : int or ndarray
+            Indices of the rows in the memmaps of their subvolume
+        """
+        subvol_indices = np.searchsorted(self.row_offsets, rows, side='right') - 1
+        return subvol_indices, rows - self.row_offsets[subvol_indices]
+
+    def select_rows(self, *predicates):
+        """ Global indices of the rows satisfying all of the input predicates.
+
+        Each subvolume is filtered with `SubvolMemmapReader.select_rows`,
+        which uses the zone maps of the columns to skip the blocks of rows
+        that cannot match.
+
+        Parameters
+        ----------
+        *predicates : sequence of tuples
+            Each predicate is a tuple (colname, op, value), where ``op`` is one of
+            '==', '!=', '<', '<=', '>', '>=', e.g., ('mvir', '>', 1e12).
+
+        Returns
+        -------
+        rows : ndarray
+            Sorted integer array storing the global indices of the matching rows
+        """
+        return np.concatenate(list(subvol.select_rows(*predicates) + offset
+            for subvol, offset in zip(self.subvols, self.row_offsets)))
+
+    @property
+    def tree_root_ids(self):
+        """ Integer array storing the tree_root_ID of every tree in the box.
+        """
+        return np.concatenate(list(subvol.tree_root_ids for subvol in self.subvols))
+
+    @property
+    def tree_root_indices(self):
+        """ Integer array storing the global row where every tree in the box begins.
+        """
+        return np.concatenate(list(subvol.tree_root_indices + offset
+            for subvol, offset in zip(self.subvols, self.row_offsets)))
+
+    def tree_index_from_root_id(self, tree_root_id):
+        """ Global position of the tree with the input tree_root_ID.
+        A `KeyError` is raised if the tree is not stored in any subvolume.
+        """
+        if self._root_id_sorting is None:
+            tree_root_ids = self.tree_root_ids
+            idx_sorted = np.argsort(tree_root_ids, kind='mergesort')
+            self._root_id_sorting = (tree_root_ids[idx_sorted], idx_sorted)
+        sorted_root_ids, idx_sorted = self._root_id_sorting
+
+        i = np.searchsorted(sorted_root_ids, tree_root_id)
+        if (i == len(sorted_root_ids)) or (sorted_root_ids[i] != tree_root_id):
+            msg = "Tree root ID {0} is not stored in ``{1}``".format(
+                tree_root_id, self.output_root_dirname)
+            raise KeyError(msg)
+        return int(idx_sorted[i])
+
+    def _locate_tree(self, tree_index=None, tree_root_id=None):
+        """ Subvolume index and local tree index of a single tree.
+        """
+        msg = "Must pass exactly one of the ``tree_index`` or ``tree_root_id`` arguments"
+        assert (tree_index is None) != (tree_root_id is None), msg
+
+        if tree_root_id is not None:
+            tree_index = self.tree_index_from_root_id(tree_root_id)
+        elif not -self.num_trees <= tree_index < self.num_trees:
+            msg = "Tree index {0} is out of range for {1} trees".format(tree_index, self.num_trees)
+            raise IndexError(msg)
+        tree_index = tree_index % self.num_trees
+
+        isubvol = int(np.searchsorted(self.tree_offsets, tree_index, side='right') - 1)
+        return isubvol, int(tree_index - self.tree_offsets[isubvol])
+
+    def tree_slice(self, tree_index=None, tree_root_id=None):
+        """ Global slice of the rows of a single tree.
+
+        Parameters
+        ----------
+        tree_index : int, optional
+            Global position of the tree, i.e., 0 for the first tree of the first subvolume.
+
+        tree_root_id : int, optional
+            Tree root ID of the tree.
+            Exactly one of ``tree_index`` or ``tree_root_id`` must be passed.
+
+        Returns
+        -------
+        s : slice
+            Slice of the rows of every `VirtualColumn` storing the tree
+        """
+        isubvol, local_tree_index = self._locate_tree(tree_index, tree_root_id)
+        s = self.subvols[isubvol].tree_slice(tree_index=local_tree_index)
+        offset = int(self.row_offsets[isubvol])
+        return slice(s.start + offset, s.stop + offset)
+
+    def read_tree(self, *colnames, **kwargs):
+        """ Copy the requested columns of a single tree into a structured array,
+        reading only the rows of the tree from the memmaps of its subvolume.
+
+        Parameters
+        ----------
+        *colnames : sequence of strings, optional
+            Names of the returned columns. Default is all columns.
+
+        tree_index : int, optional
+            Global position of the tree, i.e., 0 for the first tree of the first subvolume.
+
+        tree_root_id : int, optional
+            Tree root ID of the tree.
+            Exactly one of ``tree_index`` or ``tree_root_id`` must be passed.
+
+        Returns
+        -------
+        tree : ndarray
+            Structured array storing the requested columns of the tree
+        """
+        isubvol, local_tree_index = self._locate_tree(
+            kwargs.get('tree_index', None), kwargs.get('tree_root_id', None))
+        if len(colnames) == 0:
+            colnames = self.colnames
+        return self.subvols[isubvol].read_tree(*colnames, tree_index=local_tree_index)
+
+    def snapshot_rows(self, snapshot):
+        """ Sorted global indices of the rows of the halos of the input snapshot,
+        looked up in the snapshot index of each subvolume,
+        see `SubvolMemmapReader.snapshot_rows`.
+        """
+        return np.concatenate(list(subvol.snapshot_rows(snapshot) + offset
+            for subvol, offset in zip(self.subvols, self.row_offsets)))
+
+    def read_snapshot(self, snapshot, *colnames):
+        """ Copy the requested columns of all the halos in the box at a single snapshot
+        into a structured array, ordered by subvolume and then by row.
+
+        Parameters
+        ----------
+        snapshot : scalar
+            Value of the ``snap_num`` column of the snapshot, or of the
+            ``scale_factor`` column if the index was built from scale factors
+
+        *colnames : sequence of strings, optional
+            Names of the returned columns. Default is all columns.
+
+        Returns
+        -------
+        halos : ndarray
+            Structured array storing the requested columns of the halos
+
+        Examples
+        --------
+        >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+        >>> halos = catalog.read_snapshot(214, 'halo_id', 'mvir', 'x', 'y', 'z')  # doctest: +SKIP
+        """
+        if len(colnames) == 0:
+            colnames = self.colnames
+        rows = list(subvol.snapshot_rows(snapshot) for subvol in self.subvols)
+        offsets = np.cumsum([0] + list(len(r) for r in rows))
+
+        dt = np.dtype(list((colname, self[colname].dtype, self[colname].shape[1:])
+            for colname in colnames))
+        halos = np.zeros(offsets[-1], dtype=dt)
+        for subvol, subvol_rows, first, last in zip(self.subvols, rows, offsets[:-1], offsets[1:]):
+            if last > first:
+                for colname in colnames:
+                    halos[colname][first:last] = subvol[colname][subvol_rows]
+        return halos
+
+    @property
+    def halo_id_index(self):
+        """ `~ctwalker.utils.halo_id_index.HaloIDIndex` of the entire box stored in
+        ``output_root_dirname`` by `write_halo_id_index`, or None if there is none.
+        An index that is older than the ``halo_id`` column of any subvolume is ignored.
+        The index is loaded and checked once, and then cached by the catalog.
+        """
+        if not self._halo_id_index_is_loaded:
+            self._halo_id_index = self._load_halo_id_index()
+            self._halo_id_index_is_loaded = True
+        return self._halo_id_index
+
+    def _load_halo_id_index(self):
+        """ Load the index of the entire box, or return None if it is missing or stale.
+        """
+        index = load_halo_id_index(self.output_root_dirname)
+        if index is None:
+            return None
+        elif index.num_rows != self.num_rows:
+            return None
+
+        index_mtime = os.path.getmtime(os.path.join(index.dirname, 'metadata.json'))
+        for subvol in self.subvols:
+            for fname in (_column_memmap_fname(subvol.subvol_dirname, 'halo_id'),
+                    chunked_column_fname(subvol.subvol_dirname, 'halo_id')):
+                if os.path.isfile(fname) and (os.path.getmtime(fname) > index_mtime):
+                    return None
+        return index
+
+    def write_halo_id_index(self):
+        """ Store the index translating the ``halo_id`` of any halo in the box into
+        its global row in ``output_root_dirname``, so that `rows_from_halo_ids`
+        requires a single search regardless of the number of subvolumes.
+
+        Returns
+        -------
+        index : `~ctwalker.utils.halo_id_index.HaloIDIndex`
+        """
+        self._halo_id_index = write_halo_id_index(self.output_root_dirname,
+            np.array(self['halo_id']))
+        self._halo_id_index_is_loaded = True
+        return self._halo_id_index
+
+    def rows_from_halo_ids(self, halo_ids):
+        """ Global rows of the halos with the input IDs, with -1 for IDs not stored in the box.
+
+        The IDs are looked up in the index of the entire box stored by
+        `write_halo_id_index` when it is up to date. Otherwise, each subvolume
+        is searched in turn with `SubvolMemmapReader.rows_from_halo_ids`,
+        for the IDs that were not found in the previous subvolumes.
+
+        Parameters
+        ----------
+        halo_ids : int or ndarray
+            Halo IDs to locate, e.g., the ``desc_id`` or ``upid`` column
+
+        Returns
+        -------
+        rows : int or ndarray
+            Global row of each input ID, -1 where the ID is not found
+
+        Examples
+        --------
+        >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+        >>> host_rows = catalog.rows_from_halo_ids(catalog['upid'][:])  # doctest: +SKIP
+        """
+        index = self.halo_id_index
+        if index is not None:
+            return index.lookup(halo_ids)
+
+        halo_ids = np.asarray(halo_ids)
+        if halo_ids.ndim == 0:
+            return int(self.rows_from_halo_ids(halo_ids.reshape(1))[0])
+
+        rows = np.zeros(halo_ids.shape, dtype='i8') - 1
+        flat_ids, flat_rows = halo_ids.reshape(-1), rows.reshape(-1)
+        remaining = np.arange(len(flat_ids))
+        for subvol, offset in zip(self.subvols, self.row_offsets):
+            if len(remaining) == 0:
+                break
+            local_rows = subvol.rows_from_halo_ids(flat_ids[remaining])
+            found = local_rows != -1
+            flat_rows[remaining[found]] = local_rows[found] + offset
+            remaining = remaining[~found]
+        return rows
+
+    def __repr__(self):
+        return "{0}('{1}')".format(type(self).__name__, self.output_root_dirname)
+
+
+class VirtualColumn(object):
+    """ Read-only array-like view of a single column spanning all subvolumes of a `TreeCatalog`.
+
+    Integers, slices and integer arrays are interpreted as global row indices.
+    Each request is split among the subvolumes it touches and the rows are copied
+    directly from the memmap of each subvolume into the returned array.
+    """
+
+    def __init__(self, catalog, colname):
+        self.catalog = catalog
+        self.colname = colname
+
+        first_column = catalog.subvols[0][colname]
+        self.dtype = first_column.dtype
+        self.shape = (catalog.num_rows, ) + tuple(first_column.shape[1:])
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def subvol_column(self, isubvol):
+        """ Memmap of the column in the subvolume ``catalog.subvols[isubvol]``.
+        """
+        return self.catalog.subvols[isubvol][self.colname]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows = self[key[0]]
+            if isinstance(key[0], (int, np.integer)):
+                return rows[key[1:]]
+            else:
+                return rows[(slice(None), ) + key[1:]]
+
+        indices = normalize_row_index(key, len(self))
+        if isinstance(indices, int):
+            isubvol, local_row = self.catalog.locate_rows(indices)
+            return self.subvol_column(isubvol)[local_row]
+        elif isinstance(indices, slice):
+            return self._contiguous_rows(indices.start, indices.stop)
+
+        result = np.empty(indices.shape + self.shape[1:], dtype=self.dtype)
+        subvol_indices, local_rows = self.catalog.locate_rows(indices.reshape(-1))
+
+        #  Group the indices by subvolume with a single sort,
+        #  and scatter each group back through the sort permutation
+        order = np.argsort(subvol_indices, kind='mergesort')
+        unique_subvols, group_starts = np.unique(subvol_indices[order], return_index=True)
+        group_stops = np.append(group_starts[1:], len(order))
+        flat_result = result.reshape((-1, ) + self.shape[1:])
+        for isubvol, first, last in zip(unique_subvols, group_starts, group_stops):
+            group = order[first:last]
+            flat_result[group] = self.subvol_column(isubvol)[local_rows[group]]
+        return result
+
+    def _contiguous_rows(self, start, stop):
+        """ Copy of the global rows between ``start`` and ``stop``.
+        """
+        result = np.empty((max(stop - start, 0), ) + self.shape[1:], dtype=self.dtype)
+        if stop <= start:
+            return result
+        row_offsets = self.catalog.row_offsets
+        first_subvol = self.catalog.locate_rows(start)[0]
+        last_subvol = self.catalog.locate_rows(stop - 1)[0]
+        for isubvol in range(first_subvol, last_subvol + 1):
+            lo = max(start, row_offsets[isubvol])
+            hi = min(stop, row_offsets[isubvol+1])
+            local = slice(lo - row_offsets[isubvol], hi - row_offsets[isubvol])
+            result[lo-start:hi-start] = self.subvol_column(isubvol)[local]
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self._contiguous_rows(0, len(self))
+        return arr if dtype is None else arr.astype(dtype)
+
+    def __repr__(self):
+        return "{0}('{1}', shape={2}, dtype={3})".format(
+            type(self).__name__, self.colname, self.shape, self.dtype.str)
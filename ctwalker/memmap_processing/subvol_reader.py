@@ -0,0 +1,419 @@
+""" Module storing the reader of the ``subvol_X_Y_Z`` directories
+written by `~ctwalker.ascii_processing.write_full_tree_memmaps`.
+"""
+import os
+import numpy as np
+
+from ..utils.np_memmap_utils import load_memmap_column
+from ..utils.array_utils import ragged_ranges, intersect_ranges
+from ..utils.zone_maps import load_zone_map, candidate_row_ranges, comparison_operators
+from ..utils.snapshot_index import load_snapshot_index, snapshot_key_colnames
+from ..utils.halo_id_index import load_halo_id_index, lookup_sorted_ids
+
+
+__all__ = ('SubvolMemmapReader', )
+
+
+_indexing_colnames = ('tree_root_indices', 'tree_root_ids')
+
+
+class SubvolMemmapReader(object):
+    """ Class providing lazy, read-only access to the columns of a converted subvolume.
+
+    Each column is memory-mapped the first time it is accessed, so that
+    columns that are never used are never read from disk. Columns stored in
+    compressed chunks are opened as a `~ctwalker.utils.chunked_column.ChunkedColumn`,
+    which supports the same slicing. The ``tree_root_indices``
+    and ``tree_root_ids`` arrays are loaded into memory once, the first time
+    they are needed, after which the rows of any tree are located in constant time.
+
+    Examples
+    --------
+    >>> reader = SubvolMemmapReader('some/path/subvol_0_1_2')  # doctest: +SKIP
+    >>> mvir = reader['mvir']  # doctest: +SKIP
+    >>> first_tree = reader.read_tree('scale_factor', 'mvir', tree_index=0)  # doctest: +SKIP
+    >>> same_tree = reader.read_tree('scale_factor', 'mvir', tree_root_id=reader.tree_root_ids[0])  # doctest: +SKIP
+    """
+
+    def __init__(self, subvol_dirname):
+        """
+        Parameters
+        ----------
+        subvol_dirname : string
+            Absolute path to a ``subvol_X_Y_Z`` directory
+        """
+        if not os.path.isdir(subvol_dirname):
+            msg = "Subvolume directory ``{0}`` does not exist".format(subvol_dirname)
+            raise IOError(msg)
+        self.subvol_dirname = subvol_dirname
+
+        self._columns = {}
+        self._colnames = None
+        self._tree_root_indices = None
+        self._tree_root_ids = None
+        self._tree_stops = None
+        self._tree_index_by_root_id = None
+        self._zone_maps = {}
+        self._snapshot_index = None
+        self._halo_id_index = None
+        self._in_memory_halo_id_index = None
+
+    @property
+    def colnames(self):
+        """ Sorted tuple of the names of the halo columns stored in the subvolume.
+        The directory is only listed at the first access, and again after
+        a call to `reload_column`.
+        """
+        if self._colnames is not None:
+            return self._colnames
+
+        colnames = []
+        for basename in os.listdir(self.subvol_dirname):
+            path = os.path.join(self.subvol_dirname, basename)
+            if basename.endswith('.zonemap.npy'):
+                continue
+            elif basename.endswith(('.npy', '.zcol')) and os.path.isfile(path):
+                colname = os.path.splitext(basename)[0]
+            elif os.path.isfile(os.path.join(path, 'shape.npy')):
+                colname = basename
+            else:
+                continue
+            if colname not in _indexing_colnames:
+                colnames.append(colname)
+        self._colnames = tuple(sorted(colnames))
+        return self._colnames
+
+    def __getitem__(self, colname):
+        """ Read-only memmap of the column ``colname``.
+        """
+        try:
+            return self._columns[colname]
+        except KeyError:
+            pass
+
+        try:
+            arr = load_memmap_column(self.subvol_dirname, colname, mode='r')
+        except IOError:
+            msg = "Column ``{0}`` is not stored in ``{1}``".format(colname, self.subvol_dirname)
+            raise KeyError(msg)
+        self._columns[colname] = arr
+        return arr
+
+    def __contains__(self, colname):
+        return colname in self.colnames
+
+    def reload_column(self, colname):
+        """ Discard the memmap and the zone map of the column ``colname``
+        cached by the reader, so that the column is opened again at its next access.
+        Must be called before the column is written again on disk, so that the reader
+        does not keep a memmap of a file that is being overwritten,
+        and after a new column is written, so that it appears in `colnames`.
+        """
+        self._columns.pop(colname, None)
+        self._zone_maps.pop(colname, None)
+        self._colnames = None
+
+    @property
+    def num_rows(self):
+        """ Total number of halos stored in the subvolume,
+        or zero if the subvolume does not store any halo column.
+        """
+        colnames = self.colnames
+        if len(colnames) == 0:
+            return 0
+        return len(self[colnames[0]])
+
+    @property
+    def tree_root_indices(self):
+        """ Integer array storing the row where each tree begins.
+        """
+        if self._tree_root_indices is None:
+            self._tree_root_indices = np.array(
+                load_memmap_column(self.subvol_dirname, 'tree_root_indices'))
+        return self._tree_root_indices
+
+    @property
+    def tree_root_ids(self):
+        """ Integer array storing the tree_root_ID of each tree.
+        """
+        if self._tree_root_ids is None:
+            self._tree_root_ids = np.array(
+                load_memmap_column(self.subvol_dirname, 'tree_root_ids'))
+        return self._tree_root_ids
+
+    @property
+    def num_trees(self):
+        """ Total number of trees stored in the subvolume.
+        """
+        return len(self.tree_root_indices)
+
+    def tree_slice(self, tree_index=None, tree_root_id=None):
+        """ Slice of the rows of a single tree.
+
+        Parameters
+        ----------
+        tree_index : int, optional
+            Position of the tree in the subvolume, i.e., 0 for the first tree.
+            Negative values count from the last tree.
+
+        tree_root_id : int, optional
+            Tree root ID of the tree.
+            Exactly one of ``tree_index`` or ``tree_root_id`` must be passed.
+
+        Returns
+        -------
+        s : slice
+            Slice of the rows of every column storing the tree
+        """
+        msg = "Must pass exactly one of the ``tree_index`` or ``tree_root_id`` arguments"
+        assert (tree_index is None) != (tree_root_id is None), msg
+
+        if tree_root_id is not None:
+            tree_index = self.tree_index_from_root_id(tree_root_id)
+        elif not -self.num_trees <= tree_index < self.num_trees:
+            msg = "Tree index {0} is out of range for {1} trees".format(tree_index, self.num_trees)
+            raise IndexError(msg)
+
+        if self._tree_stops is None:
+            self._tree_stops = np.append(self.tree_root_indices[1:], self.num_rows)
+        return slice(int(self.tree_root_indices[tree_index]), int(self._tree_stops[tree_index]))
+
+    def tree_index_from_root_id(self, tree_root_id):
+        """ Position in the subvolume of the tree with the input tree_root_ID.
+        A `KeyError` is raised if the tree is not stored in the subvolume.
+        """
+        if self._tree_index_by_root_id is None:
+            self._tree_index_by_root_id = dict(
+                (root_id, i) for i, root_id in enumerate(self.tree_root_ids.tolist()))
+        try:
+            return self._tree_index_by_root_id[int(tree_root_id)]
+        except KeyError:
+            msg = "Tree root ID {0} is not stored in ``{1}``".format(
+                tree_root_id, self.subvol_dirname)
+            raise KeyError(msg)
+
+    def read_tree(self, *colnames, **kwargs):
+        """ Copy the requested columns of a single tree into a structured array.
+        Only the rows of the tree are read from disk.
+
+        Parameters
+        ----------
+        *colnames : sequence of strings, optional
+            Names of the returned columns. Default is all columns.
+
+        tree_index : int, optional
+            Position of the tree in the subvolume, i.e., 0 for the first tree.
+
+        tree_root_id : int, optional
+            Tree root ID of the tree.
+            Exactly one of ``tree_index`` or ``tree_root_id`` must be passed.
+
+        Returns
+        -------
+        tree : ndarray
+            Structured array storing the requested columns of the tree
+        """
+        s = self.tree_slice(kwargs.get('tree_index', None), kwargs.get('tree_root_id', None))
+        return self._read_rows(s, s.stop - s.start, *colnames)
+
+    @property
+    def snapshot_index(self):
+        """ `~ctwalker.utils.snapshot_index.SnapshotIndex` of the subvolume,
+        or None if no index was stored.
+        """
+        if self._snapshot_index is None:
+            self._snapshot_index = load_snapshot_index(self.subvol_dirname)
+        return self._snapshot_index
+
+    def snapshot_rows(self, snapshot):
+        """ Sorted indices of the rows of the halos of the input snapshot.
+
+        The rows are looked up in the snapshot index when one is stored, and
+        are otherwise selected with `select_rows` on the ``snap_num`` or
+        ``scale_factor`` column.
+
+        Parameters
+        ----------
+        snapshot : scalar
+            Value of the ``snap_num`` column of the snapshot, or of the
+            ``scale_factor`` column if the index was built from scale factors
+
+        Returns
+        -------
+        rows : ndarray
+            Sorted integer array
+        """
+        if self.snapshot_index is not None:
+            return self.snapshot_index.rows_of(snapshot)
+
+        stored_keys = list(key for key in snapshot_key_colnames if key in self.colnames)
+        if len(stored_keys) == 0:
+            msg = "Subvolume ``{0}`` stores no snapshot index and none of the {1} columns"
+            raise KeyError(msg.format(self.subvol_dirname, snapshot_key_colnames))
+        return self.select_rows((stored_keys[0], '==', snapshot))
+
+    def read_snapshot(self, snapshot, *colnames):
+        """ Copy the requested columns of all the halos of a single snapshot
+        into a structured array, in the order in which they are stored.
+
+        The rows are gathered from each column in increasing order,
+        so that reading a snapshot proceeds through each file in a single forward pass.
+
+        Parameters
+        ----------
+        snapshot : scalar
+            Snapshot of the halos, see `snapshot_rows`
+
+        *colnames : sequence of strings, optional
+            Names of the returned columns. Default is all columns.
+
+        Returns
+        -------
+        halos : ndarray
+            Structured array storing the requested columns of the halos
+
+        Examples
+        --------
+        >>> reader = SubvolMemmapReader('some/path/subvol_0_1_2')  # doctest: +SKIP
+        >>> halos = reader.read_snapshot(214, 'halo_id', 'mvir', 'upid')  # doctest: +SKIP
+        """
+        rows = self.snapshot_rows(snapshot)
+        return self._read_rows(rows, len(rows), *colnames)
+
+    @property
+    def halo_id_index(self):
+        """ `~ctwalker.utils.halo_id_index.HaloIDIndex` of the subvolume,
+        or None if no index was stored.
+        """
+        if self._halo_id_index is None:
+            self._halo_id_index = load_halo_id_index(self.subvol_dirname)
+        return self._halo_id_index
+
+    def rows_from_halo_ids(self, halo_ids):
+        """ Rows of the halos with the input IDs, with -1 for IDs not stored in the subvolume.
+
+        The rows are looked up in the halo ID index when one is stored.
+        Otherwise the ``halo_id`` column is sorted in memory the first time
+        this method is called.
+
+        Parameters
+        ----------
+        halo_ids : int or ndarray
+            Halo IDs to locate, e.g., the ``desc_id`` or ``upid`` column
+
+        Returns
+        -------
+        rows : int or ndarray
+            Row of each input ID, -1 where the ID is not found
+
+        Examples
+        --------
+        >>> reader = SubvolMemmapReader('some/path/subvol_0_1_2')  # doctest: +SKIP
+        >>> desc_rows = reader.rows_from_halo_ids(reader['desc_id'])  # doctest: +SKIP
+        """
+        if self.halo_id_index is not None:
+            return self.halo_id_index.lookup(halo_ids)
+
+        if self._in_memory_halo_id_index is None:
+            halo_id = np.asarray(self['halo_id'])
+            idx_sorted = np.argsort(halo_id, kind='mergesort')
+            self._in_memory_halo_id_index = _InMemoryHaloIDIndex(halo_id[idx_sorted], idx_sorted)
+        return self._in_memory_halo_id_index.lookup(halo_ids)
+
+    def _read_rows(self, rows, num_rows, *colnames):
+        """ Copy the requested columns of the rows selected by a slice
+        or an array of indices into a structured array.
+        """
+        if len(colnames) == 0:
+            colnames = self.colnames
+
+        columns = list(self[colname] for colname in colnames)
+        dt = np.dtype(list((colname, col.dtype, col.shape[1:])
+            for colname, col in zip(colnames, columns)))
+        result = np.zeros(num_rows, dtype=dt)
+        if num_rows > 0:
+            for colname, col in zip(colnames, columns):
+                result[colname] = col[rows]
+        return result
+
+    def zone_map(self, colname):
+        """ Zone map of the column ``colname``, or None if none was stored.
+        See `~ctwalker.utils.zone_maps.load_zone_map`.
+        """
+        try:
+            return self._zone_maps[colname]
+        except KeyError:
+            zone_map = load_zone_map(self.subvol_dirname, colname)
+            self._zone_maps[colname] = zone_map
+            return zone_map
+
+    def select_rows(self, *predicates):
+        """ Indices of the rows satisfying all of the input predicates.
+
+        The zone map of each column in the predicates is used to skip the
+        blocks of rows that cannot match, so that only the remaining blocks
+        are read from disk. Columns without a zone map are scanned entirely.
+
+        Parameters
+        ----------
+        *predicates : sequence of tuples
+            Each predicate is a tuple (colname, op, value), where ``op`` is one of
+            '==', '!=', '<', '<=', '>', '>=', e.g., ('upid', '==', -1).
+
+        Returns
+        -------
+        rows : ndarray
+            Sorted integer array storing the indices of the matching rows
+
+        Examples
+        --------
+        >>> reader = SubvolMemmapReader('some/path/subvol_0_1_2')  # doctest: +SKIP
+        >>> rows = reader.select_rows(('snap_num', '==', 214), ('mvir', '>', 1e12))  # doctest: +SKIP
+        >>> mpeak = reader['mpeak'][rows]  # doctest: +SKIP
+        """
+        starts, stops = self.candidate_row_ranges(*predicates)
+        rows = ragged_ranges(starts, stops)[1]
+        for colname, op, value in predicates:
+            if len(rows) == 0:
+                break
+            rows = rows[comparison_operators[op](self[colname][rows], value)]
+        return rows
+
+    def candidate_row_ranges(self, *predicates):
+        """ Ranges of rows that may satisfy all of the input predicates
+        according to the zone maps, see `select_rows`.
+
+        Returns
+        -------
+        starts, stops : ndarray
+            Integer arrays storing the first and one past the last row of each range
+        """
+        starts, stops = np.zeros(1, dtype='i8'), np.zeros(1, dtype='i8') + self.num_rows
+        for colname, op, value in predicates:
+            if op not in comparison_operators:
+                msg = "Comparison operator ``{0}`` must be one of {1}".format(
+                    op, sorted(comparison_operators))
+                raise ValueError(msg)
+            if self[colname].ndim != 1:
+                msg = "Predicates can only be applied to one-dimensional columns"
+                raise ValueError(msg)
+            zone_map = self.zone_map(colname)
+            if zone_map is not None:
+                starts, stops = intersect_ranges(
+                    starts, stops, *candidate_row_ranges(zone_map, op, value))
+        return starts, stops
+
+    def __repr__(self):
+        return "{0}('{1}')".format(type(self).__name__, self.subvol_dirname)
+
+
+class _InMemoryHaloIDIndex(object):
+    """ Halo ID index of a subvolume converted without one.
+    """
+
+    def __init__(self, sorted_ids, rows):
+        self.sorted_ids = sorted_ids
+        self.rows = rows
+
+    def lookup(self, halo_ids):
+        return lookup_sorted_ids(self.sorted_ids, self.rows, halo_ids)
@@ -0,0 +1,159 @@
+"""
+"""
+import os
+import pytest
+import numpy as np
+
+from ..catalog import TreeCatalog
+from ...ascii_processing import write_full_tree_memmaps
+from ...ascii_processing.fake_trees import write_fake_tree_file
+from ...utils.np_memmap_utils import load_memmap_column
+
+
+__all__ = ('test_tree_catalog', 'test_select_rows', 'test_read_snapshot',
+    'test_rows_from_halo_ids')
+
+
+def test_tree_catalog(tmpdir):
+    subvol_ids = ((1, 0, 0), (0, 0, 1), (0, 0, 0))
+    fname_list = list(os.path.join(str(tmpdir), 'tree_{0}_{1}_{2}.dat'.format(*subvol_id))
+        for subvol_id in subvol_ids)
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=4 + i, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4')])
+    summary = write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+
+    #  Subvolumes are ordered by subvolume ID
+    summary = summary[::-1]
+    correct_halo_id = np.concatenate(list(
+        load_memmap_column(s['subvol_dirname'], 'halo_id') for s in summary))
+    correct_tree_root_ids = np.concatenate(list(
+        load_memmap_column(s['subvol_dirname'], 'tree_root_ids') for s in summary))
+
+    catalog = TreeCatalog(output_dirname)
+    assert catalog.subvol_ids == sorted(subvol_ids)
+    assert catalog.colnames == ('halo_id', 'mvir')
+    assert catalog.num_rows == len(correct_halo_id)
+    assert catalog.num_trees == 15
+    assert np.all(catalog.tree_root_ids == correct_tree_root_ids)
+
+    halo_id = catalog['halo_id']
+    assert len(halo_id) == len(correct_halo_id)
+    assert np.all(np.array(halo_id) == correct_halo_id)
+    boundary = catalog.row_offsets[1]
+    for s in (slice(boundary - 5, boundary + 5), slice(None, None, 13), slice(-3, None),
+            slice(0, catalog.row_offsets[2] + 1)):
+        assert np.all(halo_id[s] == correct_halo_id[s])
+    indices = np.random.RandomState(43).randint(-len(halo_id), len(halo_id), 100)
+    assert np.all(halo_id[indices] == correct_halo_id[indices])
+    assert np.all(halo_id[indices.reshape(10, 10)] == correct_halo_id[indices].reshape(10, 10))
+    assert halo_id[boundary] == correct_halo_id[boundary]
+    with pytest.raises(IndexError):
+        halo_id[len(halo_id)]
+
+    assert np.all(halo_id[catalog.tree_root_indices] == catalog.tree_root_ids)
+    for tree_index in (0, 3, 4, 14):
+        s = catalog.tree_slice(tree_index=tree_index)
+        tree = catalog.read_tree(tree_root_id=correct_tree_root_ids[tree_index])
+        assert np.all(tree['halo_id'] == correct_halo_id[s])
+        assert np.all(tree['mvir'] == catalog['mvir'][s])
+    with pytest.raises(KeyError):
+        catalog.tree_slice(tree_root_id=-1)
+
+
+def test_select_rows(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(2))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=5, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('upid', 'i8'), ('mvir', 'f4')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 6, 10, zone_map_size=64)
+
+    catalog = TreeCatalog(output_dirname)
+    assert 'mvir.zonemap' not in catalog.colnames
+    halo_id, upid, mvir = (np.array(catalog[name]) for name in ('halo_id', 'upid', 'mvir'))
+
+    mvir_cut = np.median(mvir)
+    rows = catalog.select_rows(('upid', '==', -1), ('mvir', '>', mvir_cut))
+    assert np.all(rows == np.flatnonzero((upid == -1) & (mvir > mvir_cut)))
+    rows = catalog.select_rows(('halo_id', '<', 10**6 + 100))
+    assert np.all(rows == np.flatnonzero(halo_id < 10**6 + 100))
+    rows = catalog.select_rows(('upid', '!=', -1))
+    assert np.all(rows == np.flatnonzero(upid != -1))
+    assert len(catalog.select_rows(('mvir', '<', -1))) == 0
+
+    #  Halo IDs increase within each subvolume, so most blocks are pruned
+    subvol = catalog.subvols[1]
+    starts, stops = subvol.candidate_row_ranges(('halo_id', '<', 10**6 + 100))
+    assert np.sum(stops - starts) < subvol.num_rows/2
+
+    with pytest.raises(ValueError):
+        catalog.select_rows(('mvir', '=~', 0))
+
+
+def test_read_snapshot(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(2))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=5, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('scale_factor', 'f4'), ('halo_id', 'i8'), ('snap_num', 'i4')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 0, 1, 31)
+
+    catalog = TreeCatalog(output_dirname)
+    assert catalog.colnames == ('halo_id', 'scale_factor', 'snap_num')
+    index = catalog.subvols[0].snapshot_index
+    assert index.key_colname == 'snap_num'
+    assert np.sum(index.counts) == catalog.subvols[0].num_rows
+
+    snap_num, halo_id = np.array(catalog['snap_num']), np.array(catalog['halo_id'])
+    for snapshot in (0, 7, 19, 100):
+        rows = catalog.snapshot_rows(snapshot)
+        assert np.all(rows == np.flatnonzero(snap_num == snapshot))
+        halos = catalog.read_snapshot(snapshot, 'halo_id', 'snap_num')
+        assert np.all(halos['halo_id'] == halo_id[rows])
+        assert np.all(halos['snap_num'] == snapshot)
+
+    #  Without snap_num, the index is built from the scale factors
+    output_dirname2 = os.path.join(str(tmpdir), 'memmaps2')
+    dt2 = np.dtype([('scale_factor', 'f4'), ('halo_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname2, dt2, 0, 1)
+    catalog2 = TreeCatalog(output_dirname2)
+    assert catalog2.subvols[0].snapshot_index.key_colname == 'scale_factor'
+    final_scale_factor = catalog2['scale_factor'][0]
+    halos = catalog2.read_snapshot(final_scale_factor)
+    assert np.all(halos['halo_id'] == halo_id[snap_num == 19])
+
+
+def test_rows_from_halo_ids(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(3))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=4, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('desc_id', 'i8'), ('upid', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 3, 6)
+
+    catalog = TreeCatalog(output_dirname)
+    halo_id, desc_id = np.array(catalog['halo_id']), np.array(catalog['desc_id'])
+    subvol = catalog.subvols[1]
+    assert subvol.halo_id_index is not None
+    local_desc_id = np.array(subvol['desc_id'])
+    desc_rows = subvol.rows_from_halo_ids(local_desc_id)
+    assert np.all(desc_rows[local_desc_id == -1] == -1)
+    assert np.all(np.array(subvol['halo_id'])[desc_rows[desc_rows != -1]] ==
+        local_desc_id[desc_rows != -1])
+    assert subvol.rows_from_halo_ids(subvol['halo_id'][7]) == 7
+
+    indices = np.random.RandomState(43).randint(0, len(halo_id), 200)
+    queries = np.append(halo_id[indices], [-1, 10**9])
+    correct_rows = np.append(indices, [-1, -1])
+    assert catalog.halo_id_index is None
+    assert np.all(catalog.rows_from_halo_ids(queries) == correct_rows)
+    catalog.write_halo_id_index()
+    assert catalog.halo_id_index is not None
+    assert catalog.halo_id_index is catalog.halo_id_index
+    assert TreeCatalog(output_dirname).halo_id_index is not None
+    assert np.all(catalog.rows_from_halo_ids(queries) == correct_rows)
+    assert np.all(catalog.rows_from_halo_ids(queries.reshape(2, -1)) == correct_rows.reshape(2, -1))
+    assert np.all(halo_id[catalog.rows_from_halo_ids(desc_id[desc_id != -1])] ==
+        desc_id[desc_id != -1])
@@ -0,0 +1,85 @@
+"""
+"""
+import os
+import pytest
+import numpy as np
+
+from ..subvol_reader import SubvolMemmapReader
+from ...ascii_processing import write_full_tree_memmaps
+from ...ascii_processing.full_tree import full_tree_row_generator
+from ...ascii_processing.fake_trees import write_fake_tree_file
+from ...utils.np_memmap_utils import StructuredArrayMemmapWriter
+
+
+__all__ = ('test_subvol_reader', 'test_compressed_subvol_reader')
+
+
+def test_subvol_reader(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_0_1_2.dat')
+    write_fake_tree_file(fname, num_trees=12)
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('scale_factor', 'f4')])
+    summary = write_full_tree_memmaps([fname], str(tmpdir), dt, 1, 10, 0)
+
+    result = list(full_tree_row_generator(fname, 1, 10, 0))
+    correct_tree_root_indices = result.pop()
+    correct_tree_root_ids = result.pop()
+    correct_arr = np.array(result, dtype=dt)
+
+    reader = SubvolMemmapReader(summary[0]['subvol_dirname'])
+    assert reader.colnames == ('halo_id', 'mvir', 'scale_factor')
+    assert reader.num_rows == len(correct_arr)
+    assert reader.num_trees == 12
+    assert 'mvir' not in reader._columns
+
+    assert np.all(reader['mvir'] == correct_arr['mvir'])
+    assert reader['mvir'] is reader['mvir']
+    with pytest.raises(ValueError):
+        reader['mvir'][0] = 0.
+    assert 'scale_factor' not in reader._columns
+
+    assert np.all(reader.tree_root_ids == correct_tree_root_ids)
+    for i in (0, 5, 11, -1):
+        tree = reader.read_tree(tree_index=i)
+        start = correct_tree_root_indices[i]
+        assert tree['halo_id'][0] == correct_tree_root_ids[i]
+        assert np.all(tree == correct_arr[start:start+len(tree)])
+        tree2 = reader.read_tree('scale_factor', tree_root_id=correct_tree_root_ids[i])
+        assert np.all(tree2['scale_factor'] == tree['scale_factor'])
+    assert reader.tree_slice(tree_index=11).stop == reader.num_rows
+
+    with pytest.raises(KeyError):
+        reader.tree_slice(tree_root_id=-5)
+    with pytest.raises(IndexError):
+        reader.tree_slice(tree_index=12)
+    with pytest.raises(KeyError):
+        reader['vmax']
+
+    #  New columns appear in the cached column names once the reader is told about them
+    vmax = np.zeros(reader.num_rows, dtype=[('vmax', 'f4')])
+    with StructuredArrayMemmapWriter(reader.subvol_dirname, vmax.dtype) as writer:
+        writer.append(vmax)
+    assert 'vmax' not in reader.colnames
+    reader.reload_column('vmax')
+    assert reader.colnames == ('halo_id', 'mvir', 'scale_factor', 'vmax')
+
+    empty_dirname = os.path.join(str(tmpdir), 'subvol_9_9_9')
+    os.mkdir(empty_dirname)
+    assert SubvolMemmapReader(empty_dirname).num_rows == 0
+
+
+def test_compressed_subvol_reader(tmpdir):
+    fname = os.path.join(str(tmpdir), 'tree_0_1_2.dat')
+    write_fake_tree_file(fname, num_trees=12)
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('snap_num', 'i4')])
+    summary = write_full_tree_memmaps([fname], os.path.join(str(tmpdir), 'plain'), dt, 1, 10, 31)
+    summary2 = write_full_tree_memmaps([fname], os.path.join(str(tmpdir), 'compressed'),
+        dt, 1, 10, 31, compression={'halo_id': 'zlib', 'snap_num': 'zlib'}, chunk_size=100)
+    assert summary2[0]['num_bytes'] < summary[0]['num_bytes']
+
+    reader = SubvolMemmapReader(summary[0]['subvol_dirname'])
+    reader2 = SubvolMemmapReader(summary2[0]['subvol_dirname'])
+    assert reader.colnames == reader2.colnames
+    for i in (0, 7, 11):
+        tree = reader.read_tree(tree_index=i)
+        tree2 = reader2.read_tree(tree_root_id=reader.tree_root_ids[i])
+        assert np.all(tree == tree2)
@@ -0,0 +1,50 @@
+"""
+"""
+import os
+import threading
+import pytest
+import numpy as np
+
+from ..catalog import TreeCatalog
+from ..tree_generators import tree_batch_generator, tree_generator
+from ...ascii_processing import write_full_tree_memmaps
+from ...ascii_processing.fake_trees import write_fake_tree_file
+
+
+__all__ = ('test_tree_generators', )
+
+
+def test_tree_generators(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(3))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=4 + i, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10)
+    catalog = TreeCatalog(output_dirname)
+    num_threads = threading.active_count()
+
+    for max_rows in (1, 500, 10**6):
+        for num_prefetch in (0, 1, 3):
+            trees = list(tree_generator(catalog, 'halo_id', 'mvir',
+                max_rows=max_rows, num_prefetch=num_prefetch))
+            assert len(trees) == catalog.num_trees
+            for itree, tree in enumerate(trees):
+                assert np.all(tree == catalog.read_tree('halo_id', 'mvir', tree_index=itree))
+
+    batches = list(tree_batch_generator(catalog, max_rows=500))
+    assert all(len(halos) <= 500 or len(root_ids) == 1 for root_ids, __, halos in batches)
+    assert np.all(np.concatenate(list(b[0] for b in batches)) == catalog.tree_root_ids)
+    assert sum(len(b[2]) for b in batches) == catalog.num_rows
+    assert batches[0][2].dtype.names == catalog.colnames
+
+    #  Stopping early releases the read-ahead thread
+    subvol_trees = tree_generator(catalog.subvols[0], 'halo_id', max_rows=1)
+    first_tree = next(subvol_trees)
+    assert np.all(first_tree['halo_id'] == catalog.subvols[0].read_tree(
+        'halo_id', tree_index=0)['halo_id'])
+    subvol_trees.close()
+    assert threading.active_count() == num_threads
+
+    with pytest.raises(KeyError):
+        next(tree_generator(catalog, 'not_a_column'))
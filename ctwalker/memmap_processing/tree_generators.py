@@ -0,0 +1,183 @@
+""" Module storing generators yielding the trees of converted subvolumes one batch at a time.
+
+Each batch is a contiguous range of rows spanning consecutive trees,
+so that it is read from each column in a single sequential read.
+A background thread reads the following batches while the calling code
+processes the current one, so that computation and I/O overlap.
+"""
+import threading
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+__all__ = ('tree_batch_generator', 'tree_generator')
+
+
+def tree_batch_generator(tree_data, *colnames, **kwargs):
+    """ Iterate over batches of consecutive trees, yielding the requested columns
+    of every halo of each batch as a structured array.
+
+    Parameters
+    ----------
+    tree_data : object
+        `SubvolMemmapReader` or `TreeCatalog`
+
+    *colnames : sequence of strings, optional
+        Names of the yielded columns. Default is all columns.
+
+    max_rows : int, optional
+        Maximum number of rows of each batch. Trees with more rows
+        are yielded alone. Default is 2**20.
+
+    num_prefetch : int, optional
+        Number of batches read ahead by a background thread. If 0, each batch is
+        read by the calling thread when it is requested. Default is 2.
+
+    Yields
+    ------
+    tree_root_ids : ndarray
+        Integer array of shape (num_trees, ) storing the tree_root_ID of each tree of the batch
+
+    offsets : ndarray
+        Integer array of shape (num_trees+1, ). The halos of the i^th tree
+        are ``halos[offsets[i]:offsets[i+1]]``.
+
+    halos : ndarray
+        Structured array storing the requested columns of every halo of the batch
+
+    Examples
+    --------
+    >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+    >>> for root_ids, offsets, halos in tree_batch_generator(catalog, 'mvir', 'scale_factor'):  # doctest: +SKIP
+    ...     process(root_ids, offsets, halos)  # doctest: +SKIP
+    """
+    max_rows = kwargs.get('max_rows', 2**20)
+    num_prefetch = kwargs.get('num_prefetch', 2)
+    if len(colnames) == 0:
+        colnames = tree_data.colnames
+
+    columns = list(tree_data[colname] for colname in colnames)
+    dt = np.dtype(list((colname, col.dtype, col.shape[1:])
+        for colname, col in zip(colnames, columns)))
+
+    tree_starts = np.asarray(tree_data.tree_root_indices, dtype='i8')
+    tree_stops = np.append(tree_starts[1:], tree_data.num_rows)
+    tree_root_ids = np.asarray(tree_data.tree_root_ids)
+    batches = _tree_batches(tree_starts, tree_stops, max_rows)
+
+    def read_batch(first_tree, last_tree):
+        lo, hi = tree_starts[first_tree], tree_stops[last_tree-1]
+        halos = np.zeros(hi - lo, dtype=dt)
+        for colname, col in zip(colnames, columns):
+            halos[colname] = col[lo:hi]
+        offsets = np.append(tree_starts[first_tree:last_tree], hi) - lo
+        return tree_root_ids[first_tree:last_tree], offsets, halos
+
+    if num_prefetch == 0:
+        for first_tree, last_tree in batches:
+            yield read_batch(first_tree, last_tree)
+    else:
+        for result in _prefetching_generator(read_batch, batches, num_prefetch):
+            yield result
+
+
+def tree_generator(tree_data, *colnames, **kwargs):
+    """ Iterate over the trees of a converted subvolume or of an entire box,
+    yielding the requested columns of each tree as a structured array.
+
+    The trees are read in batches with `tree_batch_generator`, so that
+    the rows of many small trees are read at once, and the next batches
+    are read ahead by a background thread.
+
+    Parameters
+    ----------
+    tree_data : object
+        `SubvolMemmapReader` or `TreeCatalog`
+
+    *colnames : sequence of strings, optional
+        Names of the yielded columns. Default is all columns.
+
+    max_rows : int, optional
+        Maximum number of rows read at once. Default is 2**20.
+
+    num_prefetch : int, optional
+        Number of batches read ahead by a background thread. Default is 2.
+
+    Yields
+    ------
+    tree : ndarray
+        Structured array storing the requested columns of a single tree
+
+    Examples
+    --------
+    >>> reader = SubvolMemmapReader('some/path/subvol_0_1_2')  # doctest: +SKIP
+    >>> tree_masses = list(tree['mvir'].sum() for tree in tree_generator(reader, 'mvir'))  # doctest: +SKIP
+    """
+    for __, offsets, halos in tree_batch_generator(tree_data, *colnames, **kwargs):
+        for first, last in zip(offsets[:-1], offsets[1:]):
+            yield halos[first:last]
+
+
+def _tree_batches(tree_starts, tree_stops, max_rows):
+    """ List of (first_tree, last_tree) pairs of consecutive trees
+    storing at most ``max_rows`` rows, or a single tree.
+    """
+    batches = []
+    first_tree, num_trees = 0, len(tree_starts)
+    while first_tree < num_trees:
+        last_tree = np.searchsorted(tree_stops, tree_starts[first_tree] + max_rows, side='right')
+        last_tree = max(int(last_tree), first_tree + 1)
+        batches.append((first_tree, last_tree))
+        first_tree = last_tree
+    return batches
+
+
+_end_of_batches = object()
+
+
+def _prefetching_generator(read_batch, batches, num_prefetch):
+    """ Yield ``read_batch(*batch)`` for each batch, reading up to ``num_prefetch``
+    batches ahead in a background thread. Exceptions raised by the thread
+    are raised again in the calling thread.
+    """
+    results = queue.Queue(maxsize=num_prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read_ahead():
+        try:
+            for batch in batches:
+                if not put((None, read_batch(*batch))):
+                    return
+        except Exception as err:
+            put((err, None))
+            return
+        put((None, _end_of_batches))
+
+    thread = threading.Thread(target=read_ahead)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            err, result = results.get()
+            if err is not None:
+                raise err
+            elif result is _end_of_batches:
+                return
+            yield result
+    finally:
+        #  Release the thread when the caller stops iterating early
+        stop.set()
+        thread.join()
@@ -0,0 +1,10 @@
+"""
+Subpackage storing vectorized functions that walk through the merger trees
+stored in depth-first order, either in memory or in the memory-mapped binaries
+written by `~ctwalker.ascii_processing.write_full_tree_memmaps`.
+"""
+from .main_branches import *
+from .subtrees import *
+from .row_pointers import *
+from .branch_reductions import *
+from .histories import *
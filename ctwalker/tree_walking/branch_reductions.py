@@ -0,0 +1,272 @@
+""" Module storing segmented reductions of a column along the main branches of halos,
+used to compute quantities such as the peak mass, the scale factor of the peak
+mass or the half-mass formation time of every halo at once.
+
+The main branch of each halo is a contiguous range of rows, see `main_branch_ranges`,
+so the values along all branches are gathered into a single ragged array
+that is reduced with `numpy.ufunc.reduceat`, without any loop over halos.
+"""
+import numpy as np
+
+from .main_branches import main_branch_ranges
+from ..utils.array_utils import ragged_ranges
+from ..utils.np_memmap_utils import StructuredArrayMemmapWriter
+
+
+__all__ = ('reduce_main_branches', 'write_main_branch_reduction')
+
+
+available_reductions = ('max', 'argmax', 'min', 'argmin', 'sum', 'first_crossing')
+_row_reductions = ('argmax', 'argmin', 'first_crossing')
+
+
+def reduce_main_branches(tree_data, colname, reduction, rows=None, **kwargs):
+    """ Reduce the values of a column along the main branch of each input halo.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order,
+        see `~ctwalker.tree_walking.main_branch_ranges`
+
+    colname : string
+        Name of the one-dimensional column that is reduced, e.g., 'mvir'
+
+    reduction : string
+        One of ``available_reductions``:
+
+        * 'max' and 'min' : extreme value along the main branch, e.g., Mpeak.
+          NaN values are ignored.
+
+        * 'argmax' and 'argmin' : row of the extreme value, e.g., the halo at the
+          time of Mpeak. When several halos share the extreme value,
+          the latest one is returned.
+
+        * 'sum' : sum of the values along the main branch,
+          from the main leaf up to the halo itself. NaN values are ignored.
+
+        * 'first_crossing' : row of the first main progenitor whose value is
+          smaller than a threshold, going back in time from the halo itself, e.g.,
+          the halo at the half-mass formation time when the threshold is half
+          the mass of the halo. The result is -1 for halos whose branch
+          never falls below the threshold.
+
+    rows : ndarray, optional
+        Rows of the halos whose main branches are reduced.
+        Default is every row of ``tree_data``.
+
+    threshold : float or ndarray, optional
+        Threshold of the 'first_crossing' reduction, either a scalar or
+        an array with one value per row
+
+    fraction : float, optional
+        Alternative to ``threshold``, in which case the threshold of each halo
+        is ``fraction`` times the value of its own column. For example, the half-mass
+        formation time is computed with ``colname='mvir'`` and ``fraction=0.5``.
+
+    max_rows : int, optional
+        Maximum total length of the main branches reduced at once. The values
+        along the branches of each batch are gathered into a single array,
+        so ``max_rows`` bounds the memory used by the calculation regardless of
+        the length of the branches. A branch longer than ``max_rows`` is reduced alone.
+        Default is 2**22.
+
+    Returns
+    -------
+    result : ndarray
+        Array of shape (len(rows), ) storing the reduction of each main branch.
+        The 'argmax', 'argmin' and 'first_crossing' reductions return rows of ``tree_data``.
+
+    Examples
+    --------
+    >>> from ctwalker.memmap_processing import SubvolMemmapReader  # doctest: +SKIP
+    >>> reader = SubvolMemmapReader('some/path/subvol_0_1_2')  # doctest: +SKIP
+    >>> mpeak = reduce_main_branches(reader, 'mvir', 'max')  # doctest: +SKIP
+    >>> mpeak_scale = reader['scale_factor'][reduce_main_branches(reader, 'mvir', 'argmax')]  # doctest: +SKIP
+    >>> half_mass_row = reduce_main_branches(reader, 'mvir', 'first_crossing', fraction=0.5)  # doctest: +SKIP
+    """
+    if reduction not in available_reductions:
+        msg = "Input ``reduction`` = {0} must be one of {1}".format(reduction, available_reductions)
+        raise ValueError(msg)
+    column = tree_data[colname]
+    if column.ndim != 1:
+        raise ValueError("Main-branch reductions require a one-dimensional column")
+
+    if rows is None:
+        rows = np.arange(len(column), dtype='i8')
+    else:
+        rows = np.atleast_1d(rows).astype('i8')
+
+    threshold = None
+    if reduction == 'first_crossing':
+        if ('threshold' in kwargs) == ('fraction' in kwargs):
+            msg = ("The 'first_crossing' reduction requires exactly one of "
+                "``threshold`` or ``fraction``")
+            raise ValueError(msg)
+        threshold = kwargs.get('threshold', None)
+        if threshold is not None:
+            threshold = np.zeros(len(rows)) + threshold
+
+    result = np.zeros(len(rows), dtype=_result_dtype(column.dtype, reduction))
+    starts, stops = main_branch_ranges(tree_data, rows)
+    max_rows = kwargs.get('max_rows', 2**22)
+    for first, last in _branch_batches(stops - starts, max_rows):
+        batch = slice(first, last)
+        if reduction == 'first_crossing':
+            if threshold is None:
+                batch_threshold = kwargs['fraction']*_values_at(column, rows[batch])
+            else:
+                batch_threshold = threshold[batch]
+        else:
+            batch_threshold = None
+        result[batch] = _reduce_batch(column, starts[batch], stops[batch], reduction,
+            batch_threshold)
+    return result
+
+
+def write_main_branch_reduction(tree_data, output_colname, colname, reduction, **kwargs):
+    """ Reduce a column along the main branch of every halo with `reduce_main_branches`,
+    and store the result as a new column of each subvolume.
+
+    Parameters
+    ----------
+    tree_data : object
+        `~ctwalker.memmap_processing.SubvolMemmapReader` or
+        `~ctwalker.memmap_processing.TreeCatalog` of the converted subvolumes
+
+    output_colname : string
+        Name of the new column, e.g., 'mpeak'
+
+    colname : string
+        Name of the column that is reduced, e.g., 'mvir'
+
+    reduction : string
+        One of ``available_reductions``. The rows returned by the 'argmax', 'argmin'
+        and 'first_crossing' reductions are stored as int32 rows of the subvolume,
+        with the same convention as the ``desc_row`` and ``mmp_row`` columns.
+
+    **kwargs : optional
+        Keyword arguments passed to `reduce_main_branches`, along with ``compression``,
+        ``chunk_size`` and ``zone_map_size``, passed to
+        `~ctwalker.utils.np_memmap_utils.StructuredArrayMemmapWriter`.
+        An array ``threshold`` stores one value per row of ``tree_data``,
+        and is split among the subvolumes.
+
+    Returns
+    -------
+    num_bytes : int
+        Number of bytes written to disk
+
+    Examples
+    --------
+    >>> from ctwalker.memmap_processing import TreeCatalog  # doctest: +SKIP
+    >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+    >>> __ = write_main_branch_reduction(catalog, 'mpeak', 'mvir', 'max')  # doctest: +SKIP
+    >>> __ = write_main_branch_reduction(catalog, 'vpeak', 'vmax', 'max')  # doctest: +SKIP
+    >>> mpeak = catalog['mpeak']  # doctest: +SKIP
+    """
+    subvols = getattr(tree_data, 'subvols', [tree_data])
+    writer_kwargs = dict((key, kwargs[key])
+        for key in ('compression', 'chunk_size', 'zone_map_size') if key in kwargs)
+    reduction_kwargs = dict((key, value) for key, value in kwargs.items()
+        if key not in writer_kwargs)
+
+    threshold = reduction_kwargs.get('threshold', None)
+    if np.ndim(threshold) > 0:
+        row_offsets = getattr(tree_data, 'row_offsets', [0, tree_data.num_rows])
+        threshold = np.asarray(threshold)
+        if threshold.shape != (row_offsets[-1], ):
+            msg = ("Input ``threshold`` must be a scalar or an array with "
+                "one value per row of ``tree_data``")
+            raise ValueError(msg)
+
+    num_bytes = 0
+    for isubvol, subvol in enumerate(subvols):
+        if np.ndim(threshold) > 0:
+            reduction_kwargs['threshold'] = threshold[row_offsets[isubvol]:row_offsets[isubvol+1]]
+        result = reduce_main_branches(subvol, colname, reduction, **reduction_kwargs)
+        if reduction in _row_reductions:
+            result = result.astype('i4')
+        dt = np.dtype([(output_colname, result.dtype)])
+        #  Release the memmap of a column that is about to be overwritten
+        subvol.reload_column(output_colname)
+        with StructuredArrayMemmapWriter(subvol.subvol_dirname, dt, **writer_kwargs) as writer:
+            writer.append(result.view(dt))
+        subvol.reload_column(output_colname)
+        num_bytes += writer.num_bytes
+    if hasattr(tree_data, 'subvols'):
+        tree_data.reload_column(output_colname)
+    return num_bytes
+
+
+def _result_dtype(column_dtype, reduction):
+    if reduction in ('max', 'min'):
+        return column_dtype
+    elif reduction == 'sum':
+        return np.dtype('f8') if column_dtype.kind == 'f' else np.dtype('i8')
+    else:
+        return np.dtype('i8')
+
+
+def _values_at(column, rows):
+    """ Values of the column at the input rows.
+    """
+    return np.asarray(column[rows]) if len(rows) > 0 else np.zeros(0, dtype=column.dtype)
+
+
+def _branch_batches(branch_lengths, max_rows):
+    """ List of (first, last) pairs of consecutive branches
+    storing at most ``max_rows`` rows in total, or a single branch.
+    """
+    cumulative_lengths = np.cumsum(branch_lengths)
+    batches = []
+    first, num_branches = 0, len(branch_lengths)
+    while first < num_branches:
+        first_row = cumulative_lengths[first] - branch_lengths[first]
+        last = np.searchsorted(cumulative_lengths, first_row + max_rows, side='right')
+        last = max(int(last), first + 1)
+        batches.append((first, last))
+        first = last
+    return batches
+
+
+def _reduce_batch(column, starts, stops, reduction, threshold):
+    """ Reduce the main branches stored in the input ranges of rows.
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype=_result_dtype(column.dtype, reduction))
+    offsets, branch_rows = ragged_ranges(starts, stops)
+    lengths = np.diff(offsets)
+    segment_starts = offsets[:-1]
+
+    #  Branches of nearby halos overlap, so a single slice covering all of them
+    #  is cheaper to read than the individual rows unless the halos are far apart
+    lo, hi = starts.min(), stops.max()
+    if hi - lo <= 4*len(branch_rows):
+        values = np.asarray(column[lo:hi])[branch_rows - lo]
+    else:
+        values = _values_at(column, branch_rows)
+
+    if reduction in ('max', 'min'):
+        ufunc = np.fmax if reduction == 'max' else np.fmin
+        return ufunc.reduceat(values, segment_starts)
+    elif reduction == 'sum':
+        if values.dtype.kind == 'f':
+            values = np.where(np.isnan(values), 0., values)
+        return np.add.reduceat(values.astype(_result_dtype(column.dtype, reduction)),
+            segment_starts)
+
+    positions = np.arange(len(values), dtype='i8')
+    if reduction in ('argmax', 'argmin'):
+        ufunc = np.fmax if reduction == 'argmax' else np.fmin
+        extremes = np.repeat(ufunc.reduceat(values, segment_starts), lengths)
+        is_selected = values == extremes
+    else:
+        is_selected = values < np.repeat(threshold, lengths)
+
+    first_selected = np.minimum.reduceat(
+        np.where(is_selected, positions, len(values)), segment_starts)
+    found = first_selected < len(values)
+    result = np.zeros(len(starts), dtype='i8') - 1
+    result[found] = branch_rows[first_selected[found]]
+    return result
@@ -0,0 +1,246 @@
+""" Module storing the extraction of dense main-branch histories,
+such as the mass accretion histories of millions of halos,
+into two-dimensional arrays indexed by halo and by snapshot.
+"""
+import os
+import multiprocessing
+import numpy as np
+
+from .main_branches import main_branches, _gather
+
+
+__all__ = ('main_branch_histories', 'write_main_branch_histories')
+
+
+def main_branch_histories(tree_data, rows, *colnames, **kwargs):
+    """ Values of the requested columns along the main branch of each input halo,
+    stored in arrays of shape (len(rows), num_snapshots) indexed by ``snap_num``.
+
+    The halos are processed in batches, and within each batch every main branch
+    is located and scattered into the output with array operations only,
+    see `~ctwalker.tree_walking.main_branches`.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order,
+        with the ``depth_first_id``, ``last_mainleaf_depthfirst_id`` and ``snap_num``
+        columns, such as a structured array, a
+        `~ctwalker.memmap_processing.SubvolMemmapReader` or a
+        `~ctwalker.memmap_processing.TreeCatalog`
+
+    rows : ndarray
+        Integer array of shape (num_halos, ) storing the rows of the halos,
+        typically the roots of the trees at the final snapshot
+
+    *colnames : sequence of strings
+        Names of the columns whose histories are extracted, e.g., 'mvir', 'vmax'
+
+    num_snapshots : int, optional
+        Number of columns of the output arrays. Default is one plus
+        the largest ``snap_num`` of the input halos.
+
+    fill_value : scalar or dict, optional
+        Value of the entries of the snapshots where the main branch has no halo,
+        such as the snapshots before the formation of the halo. A dictionary
+        maps each column name to its fill value. Default is NaN for
+        floating-point columns and -1 for integer columns.
+
+    out : dict, optional
+        Dictionary mapping each column name to a preallocated array of shape
+        (num_halos, num_snapshots), such as a memmap, into which the histories are written.
+        Entries of the snapshots without a halo are left untouched,
+        so the arrays must be initialized with the fill value beforehand.
+        Default is None, in which case new arrays are allocated.
+
+    batch_size : int, optional
+        Number of halos processed at once. Default is 2**16.
+
+    snap_colname : string, optional
+        Name of the column storing the snapshot number. Default is 'snap_num'.
+
+    Returns
+    -------
+    histories : dict
+        Dictionary mapping each column name to an array of shape (num_halos, num_snapshots),
+        whose i^th row stores the history of ``rows[i]``
+
+    Examples
+    --------
+    >>> from ctwalker.memmap_processing import TreeCatalog  # doctest: +SKIP
+    >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+    >>> roots = catalog.tree_root_indices  # doctest: +SKIP
+    >>> histories = main_branch_histories(catalog, roots, 'mvir', 'vmax')  # doctest: +SKIP
+    >>> mah = histories['mvir']  # doctest: +SKIP
+    """
+    if len(colnames) == 0:
+        raise ValueError("Must pass the names of the columns whose histories are extracted")
+    rows = np.atleast_1d(rows).astype('i8')
+    snap_colname = kwargs.get('snap_colname', 'snap_num')
+    batch_size = kwargs.get('batch_size', 2**16)
+
+    out = kwargs.get('out', None)
+    if out is None:
+        num_snapshots = kwargs.get('num_snapshots', None)
+        if num_snapshots is None:
+            num_snapshots = _default_num_snapshots(tree_data, rows, snap_colname)
+        out = dict((colname, np.empty(
+            (len(rows), num_snapshots) + tuple(tree_data[colname].shape[1:]),
+            dtype=tree_data[colname].dtype)) for colname in colnames)
+        for colname in colnames:
+            out[colname][...] = _fill_value(kwargs.get('fill_value', None), colname,
+                out[colname].dtype)
+
+    for first in range(0, len(rows), batch_size):
+        _scatter_histories(tree_data, rows[first:first+batch_size], first, out, colnames,
+            snap_colname)
+    return out
+
+
+def write_main_branch_histories(tree_data, rows, output_dirname, *colnames, **kwargs):
+    """ Extract the main-branch histories of the input halos with `main_branch_histories`
+    into ``.npy`` files of shape (len(rows), num_snapshots), one per column.
+
+    The output files are allocated on disk and filled in batches, so that
+    the histories do not need to fit in memory. The batches can be processed
+    concurrently by a pool of processes, each of which writes disjoint rows
+    of the memory-mapped output files.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order,
+        see `main_branch_histories`. With more than one worker, ``tree_data`` must be a
+        `~ctwalker.memmap_processing.SubvolMemmapReader` or a
+        `~ctwalker.memmap_processing.TreeCatalog`, which each worker opens again.
+
+    rows : ndarray
+        Integer array of shape (num_halos, ) storing the rows of the halos
+
+    output_dirname : string
+        Directory where the ``colname.npy`` files are written, along with
+        ``rows.npy`` storing the input rows
+
+    *colnames : sequence of strings
+        Names of the columns whose histories are extracted
+
+    num_workers : int, optional
+        Number of processes filling the output files concurrently. Default is 1.
+
+    **kwargs : optional
+        The ``num_snapshots``, ``fill_value``, ``batch_size`` and ``snap_colname``
+        arguments of `main_branch_histories`
+
+    Returns
+    -------
+    histories : dict
+        Dictionary mapping each column name to a read-only memmap of its output file
+
+    Examples
+    --------
+    >>> from ctwalker.memmap_processing import TreeCatalog  # doctest: +SKIP
+    >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+    >>> roots = catalog.select_rows(('snap_num', '==', 178), ('upid', '==', -1))  # doctest: +SKIP
+    >>> histories = write_main_branch_histories(catalog, roots, 'some/path/to/mah',  # doctest: +SKIP
+    ...     'mvir', 'vmax', num_workers=8)  # doctest: +SKIP
+    """
+    if len(colnames) == 0:
+        raise ValueError("Must pass the names of the columns whose histories are extracted")
+    rows = np.atleast_1d(rows).astype('i8')
+    snap_colname = kwargs.get('snap_colname', 'snap_num')
+    batch_size = kwargs.get('batch_size', 2**16)
+    num_workers = kwargs.get('num_workers', 1)
+    num_snapshots = kwargs.get('num_snapshots', None)
+    if num_snapshots is None:
+        num_snapshots = _default_num_snapshots(tree_data, rows, snap_colname)
+
+    try:
+        os.makedirs(output_dirname)
+    except OSError:
+        pass
+    np.save(os.path.join(output_dirname, 'rows.npy'), rows)
+    fnames = dict((colname, os.path.join(output_dirname, colname + '.npy'))
+        for colname in colnames)
+    for colname in colnames:
+        col = tree_data[colname]
+        arr = np.lib.format.open_memmap(fnames[colname], mode='w+', dtype=col.dtype,
+            shape=(len(rows), num_snapshots) + tuple(col.shape[1:]))
+        arr[...] = _fill_value(kwargs.get('fill_value', None), colname, col.dtype)
+        arr.flush()
+        del arr
+
+    task_sequence = list((None, rows[first:first+batch_size], first, fnames, colnames, snap_colname)
+        for first in range(0, len(rows), batch_size))
+    if num_workers > 1 and len(task_sequence) > 1:
+        tree_data_spec = (type(tree_data), _tree_data_dirname(tree_data))
+        task_sequence = list((tree_data_spec, ) + task[1:] for task in task_sequence)
+        pool = multiprocessing.Pool(min(num_workers, len(task_sequence)))
+        try:
+            for __ in pool.imap_unordered(_write_histories_batch, task_sequence):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in task_sequence:
+            _write_histories_batch(task, tree_data=tree_data)
+
+    return dict((colname, np.load(fnames[colname], mmap_mode='r')) for colname in colnames)
+
+
+def _scatter_histories(tree_data, rows, first, out, colnames, snap_colname):
+    """ Write the histories of a batch of halos into rows ``first`` and onwards of ``out``.
+    """
+    if len(rows) == 0:
+        return
+    offsets, branch_rows = main_branches(tree_data, rows)
+    halo_indices = np.repeat(np.arange(first, first + len(rows)), np.diff(offsets))
+    snaps = _gather(tree_data[snap_colname], branch_rows)
+
+    num_snapshots = out[colnames[0]].shape[1]
+    is_stored = (snaps >= 0) & (snaps < num_snapshots)
+    halo_indices, snaps = halo_indices[is_stored], snaps[is_stored]
+    branch_rows = branch_rows[is_stored]
+    for colname in colnames:
+        out[colname][halo_indices, snaps] = _gather(tree_data[colname], branch_rows, dtype=None)
+
+
+def _write_histories_batch(task, tree_data=None):
+    """ Fill the rows of the output files of a single batch of halos.
+    Worker processes reopen ``tree_data`` from its directory.
+    """
+    tree_data_spec, rows, first, fnames, colnames, snap_colname = task
+    if tree_data is None:
+        tree_data_type, tree_data_dirname = tree_data_spec
+        tree_data = tree_data_type(tree_data_dirname)
+    out = dict((colname, np.load(fnames[colname], mmap_mode='r+')) for colname in colnames)
+    _scatter_histories(tree_data, rows, first, out, colnames, snap_colname)
+    for arr in out.values():
+        arr.flush()
+
+
+def _tree_data_dirname(tree_data):
+    """ Directory from which ``tree_data`` can be opened again by a worker process.
+    """
+    for attr in ('output_root_dirname', 'subvol_dirname'):
+        if hasattr(tree_data, attr):
+            return getattr(tree_data, attr)
+    msg = "Input ``tree_data`` must be a SubvolMemmapReader or a TreeCatalog"
+    raise TypeError(msg)
+
+
+def _default_num_snapshots(tree_data, rows, snap_colname):
+    """ One plus the largest snapshot of the input halos, which is the latest
+    snapshot of their main branches.
+    """
+    if len(rows) == 0:
+        return 0
+    return int(_gather(tree_data[snap_colname], rows).max()) + 1
+
+
+def _fill_value(fill_value, colname, dtype):
+    if isinstance(fill_value, dict):
+        fill_value = fill_value.get(colname, None)
+    if fill_value is None:
+        fill_value = np.nan if np.dtype(dtype).kind in ('f', 'c') else -1
+    return fill_value
@@ -0,0 +1,122 @@
+""" Module storing the vectorized extraction of main progenitor branches.
+
+Consistent Trees stores the halos of each tree in depth-first order,
+visiting the most massive progenitor of every halo first. The main branch of
+a halo is therefore a contiguous range of rows, starting at the row of
+the halo and ending at the row of its main leaf, whose depth-first ID is
+stored in the ``last_mainleaf_depthfirst_id`` column. The row of the
+main leaf is offset from the row of the halo by the difference of their
+depth-first IDs, so every main branch is located without walking the tree.
+"""
+import numpy as np
+
+from ..utils.array_utils import ragged_ranges
+
+
+__all__ = ('main_branch_ranges', 'main_branches')
+
+
+def main_branch_ranges(tree_data, rows):
+    """ Range of rows storing the main branch of each input halo.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order
+        with the ``depth_first_id`` and ``last_mainleaf_depthfirst_id`` columns,
+        such as a structured array, a
+        `~ctwalker.memmap_processing.SubvolMemmapReader` or a
+        `~ctwalker.memmap_processing.TreeCatalog`.
+
+    rows : int or ndarray
+        Rows of the halos whose main branches are located
+
+    Returns
+    -------
+    starts, stops : ndarray
+        Integer arrays storing the first and one past the last row of each main branch.
+        The main branch of ``rows[i]`` begins with the halo itself, followed by
+        its main progenitor at each earlier snapshot, down to its main leaf.
+    """
+    rows = np.atleast_1d(rows).astype('i8')
+    depth_first_id = _gather(tree_data['depth_first_id'], rows)
+    last_mainleaf_depthfirst_id = _gather(tree_data['last_mainleaf_depthfirst_id'], rows)
+
+    branch_lengths = last_mainleaf_depthfirst_id - depth_first_id + 1
+    if np.any(branch_lengths < 1):
+        msg = ("Input ``tree_data`` has halos whose ``last_mainleaf_depthfirst_id`` "
+            "is smaller than their ``depth_first_id``")
+        raise ValueError(msg)
+    return rows, rows + branch_lengths
+
+
+def main_branches(tree_data, rows):
+    """ Rows of the main branches of the input halos, as a ragged array.
+
+    The calculation only involves array operations on the ``depth_first_id``
+    and ``last_mainleaf_depthfirst_id`` columns of the input halos,
+    see `main_branch_ranges`, so that millions of branches are located
+    without any loop over halos.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order,
+        see `main_branch_ranges`
+
+    rows : int or ndarray
+        Integer array of shape (n, ) storing the rows of the halos
+        whose main branches are extracted
+
+    Returns
+    -------
+    offsets : ndarray
+        Integer array of shape (n+1, ). The rows of the main branch of ``rows[i]``
+        are ``branch_rows[offsets[i]:offsets[i+1]]``.
+
+    branch_rows : ndarray
+        Integer array storing the concatenated main branches,
+        each ordered from the input halo towards earlier snapshots
+
+    Examples
+    --------
+    >>> from ctwalker.memmap_processing import TreeCatalog  # doctest: +SKIP
+    >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+    >>> offsets, branch_rows = main_branches(catalog, catalog.tree_root_indices)  # doctest: +SKIP
+    >>> mvir_history = catalog['mvir'][branch_rows]  # doctest: +SKIP
+    >>> first_branch_mvir = mvir_history[offsets[0]:offsets[1]]  # doctest: +SKIP
+    """
+    starts, stops = main_branch_ranges(tree_data, rows)
+    return ragged_ranges(starts, stops)
+
+
+def _gather(column, rows, dtype='i8'):
+    """ Copy the values of a column at the input rows,
+    visiting the rows in increasing order so that memmaps are read sequentially.
+    """
+    if dtype is None:
+        dtype = column.dtype
+    result = np.empty((len(rows), ) + tuple(column.shape[1:]), dtype=dtype)
+    if len(rows) == 0:
+        return result
+    order = np.argsort(rows, kind='mergesort')
+    result[order] = column[rows[order]]
+    return result
+
+
+def _gather_columns(tree_data, rows, colnames):
+    """ Copy the requested columns at the input rows into a structured array.
+    """
+    if len(colnames) == 0:
+        try:
+            colnames = tree_data.colnames
+        except AttributeError:
+            colnames = tree_data.dtype.names
+
+    columns = list(tree_data[colname] for colname in colnames)
+    dt = np.dtype(list((colname, col.dtype, col.shape[1:])
+        for colname, col in zip(colnames, columns)))
+    result = np.zeros(len(rows), dtype=dt)
+    for colname, col in zip(colnames, columns):
+        result[colname] = _gather(col, rows, dtype=None)
+    return result
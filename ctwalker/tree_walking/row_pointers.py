@@ -0,0 +1,150 @@
+""" Module storing the row-pointer columns ``desc_row`` and ``mmp_row``,
+which store the row of the descendant and of the main progenitor of every halo,
+so that walks through the trees only involve fancy indexing.
+"""
+import numpy as np
+
+from .main_branches import _gather
+from ..utils.halo_id_index import lookup_sorted_ids
+from ..utils.np_memmap_utils import StructuredArrayMemmapWriter, load_memmap_column
+
+
+__all__ = ('compute_row_pointers', 'write_row_pointers', 'follow_row_pointers')
+
+
+row_pointer_colnames = ('desc_row', 'mmp_row')
+
+
+def compute_row_pointers(halo_id, desc_id):
+    """ Row of the descendant and of the main progenitor of every halo.
+
+    The descendant of each halo is located by matching its ``desc_id`` to the
+    ``halo_id`` column. Since Consistent Trees visits the main progenitor of a halo
+    first in depth-first order, the main progenitor of the halo in row ``r``
+    is the halo in row ``r+1`` whenever the descendant of that halo is in row ``r``.
+
+    Parameters
+    ----------
+    halo_id : ndarray
+        Integer array of shape (num_rows, ) storing the ID of each halo,
+        in depth-first order
+
+    desc_id : ndarray
+        Integer array of shape (num_rows, ) storing the ID of the descendant
+        of each halo, or -1 for halos without descendant
+
+    Returns
+    -------
+    desc_row : ndarray
+        Integer array of shape (num_rows, ) storing the row of the descendant
+        of each halo, or -1 for halos without descendant
+
+    mmp_row : ndarray
+        Integer array of shape (num_rows, ) storing the row of the main progenitor
+        of each halo, or -1 for halos without progenitor
+
+    Examples
+    --------
+    >>> halo_id = np.array([5, 3, 8, 1, 9])
+    >>> desc_id = np.array([-1, 5, 3, 5, -1])
+    >>> desc_row, mmp_row = compute_row_pointers(halo_id, desc_id)
+    >>> desc_row
+    array([-1,  0,  1,  0, -1], dtype=int32)
+    >>> mmp_row
+    array([ 1,  2, -1, -1, -1], dtype=int32)
+    """
+    halo_id, desc_id = np.asarray(halo_id), np.asarray(desc_id)
+    if len(halo_id) >= 2**31:
+        msg = "Row pointers are stored as int32, which requires fewer than 2**31 rows"
+        raise ValueError(msg)
+
+    idx_sorted = np.argsort(halo_id, kind='mergesort')
+    desc_row = lookup_sorted_ids(halo_id[idx_sorted], idx_sorted, desc_id).astype('i4')
+    desc_row[desc_id == -1] = -1
+
+    mmp_row = np.zeros(len(halo_id), dtype='i4') - 1
+    rows = np.arange(len(halo_id) - 1)
+    has_mmp = desc_row[1:] == rows
+    mmp_row[:-1][has_mmp] = rows[has_mmp] + 1
+    return desc_row, mmp_row
+
+
+def write_row_pointers(subvol_dirname):
+    """ Compute the ``desc_row`` and ``mmp_row`` columns of a converted subvolume
+    from its ``halo_id`` and ``desc_id`` columns, and store them alongside.
+    The row pointers are always stored uncompressed so that they can be memory-mapped.
+
+    Parameters
+    ----------
+    subvol_dirname : string
+        Absolute path to a ``subvol_X_Y_Z`` directory
+
+    Returns
+    -------
+    num_bytes : int
+        Number of bytes written to disk
+    """
+    halo_id = np.asarray(load_memmap_column(subvol_dirname, 'halo_id'))
+    desc_id = np.asarray(load_memmap_column(subvol_dirname, 'desc_id'))
+    desc_row, mmp_row = compute_row_pointers(halo_id, desc_id)
+
+    dt = np.dtype(list((colname, 'i4') for colname in row_pointer_colnames))
+    pointers = np.zeros(len(halo_id), dtype=dt)
+    pointers['desc_row'] = desc_row
+    pointers['mmp_row'] = mmp_row
+    with StructuredArrayMemmapWriter(subvol_dirname, dt, zone_map_size=None) as writer:
+        writer.append(pointers)
+    return writer.num_bytes
+
+
+def follow_row_pointers(tree_data, rows, pointer_colname='desc_row', num_steps=1):
+    """ Follow a row-pointer column for a number of steps, starting from the input rows.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays storing the row-pointer columns,
+        such as a structured array, a `~ctwalker.memmap_processing.SubvolMemmapReader`
+        or a `~ctwalker.memmap_processing.TreeCatalog`. The pointers
+        of a `~ctwalker.memmap_processing.TreeCatalog` are translated into global rows.
+
+    rows : int or ndarray
+        Rows of the starting halos
+
+    pointer_colname : string, optional
+        'desc_row' to walk forward in time along the descendants, or 'mmp_row'
+        to walk backward in time along the main progenitors. Default is 'desc_row'.
+
+    num_steps : int, optional
+        Number of steps. Default is 1.
+
+    Returns
+    -------
+    rows : ndarray
+        Integer array storing the row reached from each input row, or -1 for walks
+        that ran out of descendants or progenitors before ``num_steps`` steps
+
+    Examples
+    --------
+    >>> from ctwalker.memmap_processing import SubvolMemmapReader  # doctest: +SKIP
+    >>> reader = SubvolMemmapReader('some/path/subvol_0_1_2')  # doctest: +SKIP
+    >>> rows = reader.snapshot_rows(100)  # doctest: +SKIP
+    >>> rows_ten_snapshots_earlier = follow_row_pointers(reader, rows, 'mmp_row', 10)  # doctest: +SKIP
+    """
+    if pointer_colname not in row_pointer_colnames:
+        msg = "Input ``pointer_colname`` must be one of {0}".format(row_pointer_colnames)
+        raise ValueError(msg)
+    rows = np.array(np.atleast_1d(rows), dtype='i8')
+    pointers = tree_data[pointer_colname]
+    row_offsets = getattr(tree_data, 'row_offsets', None)
+
+    for __ in range(num_steps):
+        valid = np.flatnonzero(rows != -1)
+        if len(valid) == 0:
+            break
+        next_rows = _gather(pointers, rows[valid])
+        if row_offsets is not None:
+            subvol_indices = tree_data.locate_rows(rows[valid])[0]
+            next_rows = np.where(next_rows == -1, -1, next_rows + row_offsets[subvol_indices])
+        rows[valid] = next_rows
+    return rows
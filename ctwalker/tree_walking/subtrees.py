@@ -0,0 +1,117 @@
+""" Module storing the vectorized extraction of progenitor subtrees.
+
+In the depth-first order of Consistent Trees, every progenitor of a halo,
+at any depth, is stored after the halo and before the first halo that
+is not one of its progenitors. The depth-first ID of the last of these progenitors
+is stored in the ``last_progenitor_depthfirst_id`` column, so the entire subtree
+of a halo is a contiguous range of rows that is located in constant time.
+"""
+import numpy as np
+
+from .main_branches import _gather, _gather_columns
+from ..utils.array_utils import ragged_ranges
+
+
+__all__ = ('subtree_ranges', 'subtrees', 'read_subtrees')
+
+
+def subtree_ranges(tree_data, rows):
+    """ Range of rows storing the subtree of each input halo.
+
+    Within a tree, the row of a halo is the row of the tree root plus the
+    difference between the depth-first IDs of the halo and of the root.
+    The subtree of the halo in row ``r`` therefore ends at row
+    ``r + last_progenitor_depthfirst_id - depth_first_id``.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order
+        with the ``depth_first_id`` and ``last_progenitor_depthfirst_id`` columns,
+        such as a structured array, a
+        `~ctwalker.memmap_processing.SubvolMemmapReader` or a
+        `~ctwalker.memmap_processing.TreeCatalog`.
+
+    rows : int or ndarray
+        Rows of the halos whose subtrees are located
+
+    Returns
+    -------
+    starts, stops : ndarray
+        Integer arrays storing the first and one past the last row of each subtree.
+        The subtree of ``rows[i]`` begins with the halo itself, followed by all
+        of its progenitors in depth-first order.
+    """
+    rows = np.atleast_1d(rows).astype('i8')
+    depth_first_id = _gather(tree_data['depth_first_id'], rows)
+    last_progenitor_depthfirst_id = _gather(tree_data['last_progenitor_depthfirst_id'], rows)
+
+    subtree_sizes = last_progenitor_depthfirst_id - depth_first_id + 1
+    if np.any(subtree_sizes < 1):
+        msg = ("Input ``tree_data`` has halos whose ``last_progenitor_depthfirst_id`` "
+            "is smaller than their ``depth_first_id``")
+        raise ValueError(msg)
+    return rows, rows + subtree_sizes
+
+
+def subtrees(tree_data, rows):
+    """ Rows of the subtrees of the input halos, as a ragged array.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order,
+        see `subtree_ranges`
+
+    rows : int or ndarray
+        Integer array of shape (n, ) storing the rows of the halos
+        whose subtrees are extracted
+
+    Returns
+    -------
+    offsets : ndarray
+        Integer array of shape (n+1, ). The rows of the subtree of ``rows[i]``
+        are ``subtree_rows[offsets[i]:offsets[i+1]]``.
+
+    subtree_rows : ndarray
+        Integer array storing the concatenated subtrees
+    """
+    starts, stops = subtree_ranges(tree_data, rows)
+    return ragged_ranges(starts, stops)
+
+
+def read_subtrees(tree_data, rows, *colnames):
+    """ Copy the requested columns of the subtrees of the input halos
+    into a single structured array.
+
+    Parameters
+    ----------
+    tree_data : object
+        Any object mapping column names to arrays of halos stored in depth-first order,
+        see `subtree_ranges`
+
+    rows : int or ndarray
+        Integer array of shape (n, ) storing the rows of the halos
+        whose subtrees are read
+
+    *colnames : sequence of strings, optional
+        Names of the returned columns. Default is all columns of ``tree_data``.
+
+    Returns
+    -------
+    offsets : ndarray
+        Integer array of shape (n+1, ). The progenitors of ``rows[i]``
+        are ``progenitors[offsets[i]:offsets[i+1]]``.
+
+    progenitors : ndarray
+        Structured array storing the requested columns of the concatenated subtrees
+
+    Examples
+    --------
+    >>> from ctwalker.memmap_processing import TreeCatalog  # doctest: +SKIP
+    >>> catalog = TreeCatalog('some/path/to/output_root_dirname')  # doctest: +SKIP
+    >>> rows = catalog.select_rows(('snap_num', '==', 100), ('mvir', '>', 1e14))  # doctest: +SKIP
+    >>> offsets, progenitors = read_subtrees(catalog, rows, 'mvir', 'scale_factor')  # doctest: +SKIP
+    """
+    offsets, subtree_rows = subtrees(tree_data, rows)
+    return offsets, _gather_columns(tree_data, subtree_rows, colnames)
@@ -0,0 +1,91 @@
+"""
+"""
+import os
+import pytest
+import numpy as np
+
+from ..branch_reductions import reduce_main_branches, write_main_branch_reduction
+from ..main_branches import main_branches
+from ...ascii_processing import write_full_tree_memmaps
+from ...ascii_processing.fake_trees import write_fake_tree_file
+from ...memmap_processing import TreeCatalog
+
+
+__all__ = ('test_reduce_main_branches', 'test_write_main_branch_reduction')
+
+
+def _convert_fake_trees(dirname, num_files=2):
+    fname_list = list(os.path.join(dirname, 'tree_0_0_{0}.dat'.format(i)) for i in range(num_files))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=3, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(dirname, 'memmaps')
+    dt = np.dtype([('scale_factor', 'f4'), ('halo_id', 'i8'), ('mvir', 'f4'), ('vmax', 'f4'),
+        ('num_prog', 'i8'), ('depth_first_id', 'i8'), ('last_mainleaf_depthfirst_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 0, 1, 10, 16, 4, 28, 34)
+    return TreeCatalog(output_dirname)
+
+
+def test_reduce_main_branches(tmpdir):
+    catalog = _convert_fake_trees(str(tmpdir))
+    mvir, num_prog = np.array(catalog['mvir']), np.array(catalog['num_prog'])
+    mvir[5] = np.nan
+    halos = dict(mvir=mvir, num_prog=num_prog, depth_first_id=catalog['depth_first_id'],
+        last_mainleaf_depthfirst_id=catalog['last_mainleaf_depthfirst_id'])
+
+    offsets, branch_rows = main_branches(halos, np.arange(catalog.num_rows))
+    mpeak = reduce_main_branches(halos, 'mvir', 'max', max_rows=100)
+    mpeak_row = reduce_main_branches(halos, 'mvir', 'argmax', max_rows=7)
+    mmin_row = reduce_main_branches(halos, 'mvir', 'argmin')
+    total_prog = reduce_main_branches(halos, 'num_prog', 'sum')
+    half_mass_row = reduce_main_branches(halos, 'mvir', 'first_crossing', fraction=0.5)
+    for row in range(catalog.num_rows):
+        branch = branch_rows[offsets[row]:offsets[row+1]]
+        assert mpeak[row] == np.nanmax(mvir[branch])
+        assert mpeak_row[row] == branch[np.nanargmax(mvir[branch])]
+        assert mmin_row[row] == branch[np.nanargmin(mvir[branch])]
+        assert total_prog[row] == num_prog[branch].sum()
+        below = np.flatnonzero(mvir[branch] < 0.5*mvir[row])
+        assert half_mass_row[row] == (branch[below[0]] if len(below) else -1)
+
+    rows = np.array([0, 100, 20])
+    crossing = reduce_main_branches(catalog, 'mvir', 'first_crossing', rows, threshold=1e11)
+    for row, result in zip(rows, crossing):
+        branch = branch_rows[offsets[row]:offsets[row+1]]
+        below = np.flatnonzero(np.array(catalog['mvir'][branch]) < 1e11)
+        assert result == (branch[below[0]] if len(below) else -1)
+
+    with pytest.raises(ValueError):
+        reduce_main_branches(halos, 'mvir', 'median')
+    with pytest.raises(ValueError):
+        reduce_main_branches(halos, 'mvir', 'first_crossing')
+
+
+def test_write_main_branch_reduction(tmpdir):
+    catalog = _convert_fake_trees(str(tmpdir))
+    write_main_branch_reduction(catalog, 'vpeak', 'vmax', 'max')
+    write_main_branch_reduction(catalog, 'mpeak_row', 'mvir', 'argmax', compression='zlib')
+
+    #  Overwriting a column that the catalog has already opened
+    vpeak = np.array(catalog['vpeak'])
+    write_main_branch_reduction(catalog, 'vpeak', 'mvir', 'max')
+    assert np.all(np.array(catalog['vpeak']) == reduce_main_branches(catalog, 'mvir', 'max'))
+    write_main_branch_reduction(catalog, 'vpeak', 'vmax', 'max')
+    assert np.all(np.array(catalog['vpeak']) == vpeak)
+
+    catalog = TreeCatalog(catalog.output_root_dirname)
+    assert 'vpeak' in catalog.colnames and 'mpeak_row' in catalog.colnames
+    assert np.all(np.array(catalog['vpeak']) == reduce_main_branches(catalog, 'vmax', 'max'))
+    subvol = catalog.subvols[1]
+    assert subvol['mpeak_row'].dtype == np.dtype('i4')
+    assert np.all(subvol['mpeak_row'][:] == reduce_main_branches(subvol, 'mvir', 'argmax'))
+
+    #  An array threshold stores one value per row of the catalog
+    threshold = 0.5*np.array(catalog['mvir'])
+    write_main_branch_reduction(catalog, 'half_mass_row', 'mvir', 'first_crossing',
+        threshold=threshold)
+    for subvol in catalog.subvols:
+        correct = reduce_main_branches(subvol, 'mvir', 'first_crossing', fraction=0.5)
+        assert np.all(subvol['half_mass_row'][:] == correct)
+    with pytest.raises(ValueError):
+        write_main_branch_reduction(catalog, 'half_mass_row', 'mvir', 'first_crossing',
+            threshold=threshold[:10])
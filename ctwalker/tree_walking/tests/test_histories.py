@@ -0,0 +1,54 @@
+"""
+"""
+import os
+import numpy as np
+
+from ..histories import main_branch_histories, write_main_branch_histories
+from ..main_branches import main_branches
+from ...ascii_processing import write_full_tree_memmaps
+from ...ascii_processing.fake_trees import write_fake_tree_file
+from ...memmap_processing import TreeCatalog
+
+
+__all__ = ('test_main_branch_histories', )
+
+
+def test_main_branch_histories(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(2))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=4, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('snap_num', 'i4'),
+        ('depth_first_id', 'i8'), ('last_mainleaf_depthfirst_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 10, 31, 28, 34)
+    catalog = TreeCatalog(output_dirname)
+
+    #  Roots of every tree followed by a few halos formed at later times
+    rows = np.append(catalog.tree_root_indices, [3, catalog.tree_root_indices[5] + 7])
+    mvir, halo_id = np.array(catalog['mvir']), np.array(catalog['halo_id'])
+    snap_num = np.array(catalog['snap_num'])
+    offsets, branch_rows = main_branches(catalog, rows)
+
+    histories = main_branch_histories(catalog, rows, 'mvir', 'halo_id', batch_size=3)
+    assert histories['mvir'].shape == (len(rows), 20)
+    for i in range(len(rows)):
+        branch = branch_rows[offsets[i]:offsets[i+1]]
+        correct_mvir = np.zeros(20) + np.nan
+        correct_mvir[snap_num[branch]] = mvir[branch]
+        assert np.allclose(histories['mvir'][i], correct_mvir, equal_nan=True)
+        assert np.all(histories['halo_id'][i, snap_num[branch]] == halo_id[branch])
+        assert np.all(np.delete(histories['halo_id'][i], snap_num[branch]) == -1)
+
+    histories2 = main_branch_histories(catalog, rows, 'mvir', num_snapshots=25,
+        fill_value=dict(mvir=0.))
+    assert histories2['mvir'].shape == (len(rows), 25)
+    assert np.all(histories2['mvir'][:, 20:] == 0)
+    assert np.all(histories2['mvir'][:, :20] == np.nan_to_num(histories['mvir']))
+
+    mah_dirname = os.path.join(str(tmpdir), 'mah')
+    for num_workers in (1, 2):
+        on_disk = write_main_branch_histories(catalog, rows, mah_dirname, 'mvir', 'halo_id',
+            batch_size=4, num_workers=num_workers)
+        assert np.allclose(on_disk['mvir'], histories['mvir'], equal_nan=True)
+        assert np.all(on_disk['halo_id'] == histories['halo_id'])
+        assert np.all(np.load(os.path.join(mah_dirname, 'rows.npy')) == rows)
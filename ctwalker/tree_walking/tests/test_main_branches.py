@@ -0,0 +1,59 @@
+"""
+"""
+import os
+import pytest
+import numpy as np
+
+from ..main_branches import main_branches, main_branch_ranges
+from ...ascii_processing import write_full_tree_memmaps
+from ...ascii_processing.fake_trees import write_fake_tree_file
+from ...memmap_processing import TreeCatalog
+
+
+__all__ = ('test_main_branches', )
+
+
+def _brute_force_main_branch(halos, row):
+    """ Follow the most massive progenitor of the input halo one halo at a time.
+    """
+    branch = [row]
+    while True:
+        progenitors = np.flatnonzero(
+            (halos['desc_id'] == halos['halo_id'][branch[-1]]) & (halos['mmp'] == 1))
+        if len(progenitors) == 0:
+            return branch
+        branch.append(progenitors[0])
+
+
+def test_main_branches(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(2))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=3, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('desc_id', 'i8'), ('mmp', 'i4'),
+        ('depth_first_id', 'i8'), ('last_mainleaf_depthfirst_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 3, 14, 28, 34)
+
+    catalog = TreeCatalog(output_dirname)
+    halos = np.zeros(catalog.num_rows, dtype=dt)
+    for name in dt.names:
+        halos[name] = catalog[name][:]
+
+    rows = np.random.RandomState(43).randint(0, catalog.num_rows, 50)
+    rows = np.concatenate((catalog.tree_root_indices, rows, [catalog.num_rows - 1]))
+    for tree_data in (catalog, halos):
+        offsets, branch_rows = main_branches(tree_data, rows)
+        assert len(offsets) == len(rows) + 1
+        for i, row in enumerate(rows):
+            branch = branch_rows[offsets[i]:offsets[i+1]]
+            assert list(branch) == _brute_force_main_branch(halos, row)
+
+    starts, stops = main_branch_ranges(catalog, catalog.tree_root_indices[1])
+    assert starts[0] == catalog.tree_root_indices[1]
+    assert stops[0] - starts[0] == 20
+    offsets, branch_rows = main_branches(halos, [])
+    assert len(offsets) == 1 and len(branch_rows) == 0
+
+    halos['last_mainleaf_depthfirst_id'][0] = -1
+    with pytest.raises(ValueError):
+        main_branches(halos, [0])
@@ -0,0 +1,52 @@
+"""
+"""
+import os
+import numpy as np
+
+from ..row_pointers import follow_row_pointers
+from ..main_branches import main_branches
+from ...ascii_processing import write_full_tree_memmaps, load_conversion_manifest
+from ...ascii_processing.fake_trees import write_fake_tree_file
+from ...memmap_processing import TreeCatalog
+
+
+__all__ = ('test_row_pointers', )
+
+
+def test_row_pointers(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(2))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=3, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('mmp', 'i4'), ('depth_first_id', 'i8'),
+        ('last_mainleaf_depthfirst_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 14, 28, 34)
+    assert 'desc_row' not in TreeCatalog(output_dirname).colnames
+
+    #  Adding desc_id to the conversion computes the row pointers
+    dt2 = np.dtype(dt.descr + [('desc_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt2, 1, 14, 28, 34, 3)
+    entry = load_conversion_manifest(output_dirname)[os.path.abspath(fname_list[0])]
+    assert entry['row_pointers'] == ['halo_id', 'desc_id']
+
+    catalog = TreeCatalog(output_dirname)
+    subvol = catalog.subvols[1]
+    halo_id, desc_id = np.array(subvol['halo_id']), np.array(subvol['desc_id'])
+    desc_row, mmp_row = np.array(subvol['desc_row']), np.array(subvol['mmp_row'])
+    assert desc_row.dtype == mmp_row.dtype == np.dtype('i4')
+    for row in range(subvol.num_rows):
+        correct_desc_row = np.flatnonzero(halo_id == desc_id[row])
+        assert desc_row[row] == (correct_desc_row[0] if len(correct_desc_row) else -1)
+        correct_mmp_row = np.flatnonzero((desc_id == halo_id[row]) & (np.array(subvol['mmp']) == 1))
+        assert mmp_row[row] == (correct_mmp_row[0] if len(correct_mmp_row) else -1)
+
+    #  Walking along mmp_row with the global rows of the catalog follows the main branches
+    roots = catalog.tree_root_indices
+    offsets, branch_rows = main_branches(catalog, roots)
+    for num_steps in (0, 1, 5, 19, 20):
+        rows = follow_row_pointers(catalog, roots, 'mmp_row', num_steps)
+        for i, row in enumerate(rows):
+            branch = branch_rows[offsets[i]:offsets[i+1]]
+            assert row == (branch[num_steps] if num_steps < len(branch) else -1)
+        back = follow_row_pointers(catalog, rows, 'desc_row', num_steps)
+        assert np.all(back[rows != -1] == roots[rows != -1])
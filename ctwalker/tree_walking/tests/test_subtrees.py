@@ -0,0 +1,58 @@
+"""
+"""
+import os
+import numpy as np
+
+from ..subtrees import subtrees, read_subtrees
+from ...ascii_processing import write_full_tree_memmaps
+from ...ascii_processing.fake_trees import write_fake_tree_file
+from ...memmap_processing import TreeCatalog
+
+
+__all__ = ('test_subtrees', )
+
+
+def _brute_force_subtree(halos, row):
+    """ Collect every progenitor of the input halo by following the ``desc_id`` pointers.
+    """
+    subtree, new_ids = [row], [halos['halo_id'][row]]
+    while len(new_ids) > 0:
+        progenitors = np.flatnonzero(np.isin(halos['desc_id'], new_ids))
+        subtree.extend(progenitors)
+        new_ids = halos['halo_id'][progenitors]
+    return sorted(subtree)
+
+
+def test_subtrees(tmpdir):
+    fname_list = list(os.path.join(str(tmpdir), 'tree_0_0_{0}.dat'.format(i)) for i in range(2))
+    for i, fname in enumerate(fname_list):
+        write_fake_tree_file(fname, num_trees=3, seed=i, first_halo_id=10**6*i)
+    output_dirname = os.path.join(str(tmpdir), 'memmaps')
+    dt = np.dtype([('halo_id', 'i8'), ('desc_id', 'i8'), ('mvir', 'f4'),
+        ('depth_first_id', 'i8'), ('last_progenitor_depthfirst_id', 'i8')])
+    write_full_tree_memmaps(fname_list, output_dirname, dt, 1, 3, 10, 28, 33)
+
+    catalog = TreeCatalog(output_dirname)
+    halos = np.zeros(catalog.num_rows, dtype=dt)
+    for name in dt.names:
+        halos[name] = catalog[name][:]
+
+    rows = np.random.RandomState(43).randint(0, catalog.num_rows, 30)
+    rows = np.concatenate((catalog.tree_root_indices, rows))
+    for tree_data in (catalog, halos):
+        offsets, subtree_rows = subtrees(tree_data, rows)
+        for i, row in enumerate(rows):
+            assert list(subtree_rows[offsets[i]:offsets[i+1]]) == _brute_force_subtree(halos, row)
+
+    #  The subtree of each root is its entire tree
+    for itree, row in enumerate(catalog.tree_root_indices):
+        s = catalog.tree_slice(tree_index=itree)
+        assert np.all(subtree_rows[offsets[itree]:offsets[itree+1]] == np.arange(s.start, s.stop))
+
+    offsets2, progenitors = read_subtrees(catalog, rows, 'mvir', 'halo_id')
+    assert np.all(offsets2 == offsets)
+    assert progenitors.dtype.names == ('mvir', 'halo_id')
+    assert np.all(progenitors['halo_id'] == halos['halo_id'][subtree_rows])
+    assert np.all(progenitors['mvir'] == halos['mvir'][subtree_rows])
+    __, progenitors = read_subtrees(halos, rows[:3])
+    assert progenitors.dtype.names == dt.names
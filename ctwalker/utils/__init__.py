@@ -1,3 +1,3 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 
-from .robust_file_opener import _compression_safe_opener
+from .robust_file_opener import _compression_safe_opener, robust_open, detect_compression
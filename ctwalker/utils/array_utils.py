@@ -0,0 +1,136 @@
+""" Module storing vectorized helper functions used to manipulate
+ragged collections of index ranges and the row indices of array-like columns.
+"""
+import numpy as np
+
+
+__all__ = ('ragged_ranges', 'intersect_ranges', 'normalize_row_index')
+
+
+def ragged_ranges(starts, stops):
+    """ Concatenate the integer ranges [starts[i], stops[i]) into a single flat array.
+
+    Parameters
+    ----------
+    starts : ndarray
+        Integer array of shape (n, ) storing the first index of each range
+
+    stops : ndarray
+        Integer array of shape (n, ) storing one past the last index of each range
+
+    Returns
+    -------
+    offsets : ndarray
+        Integer array of shape (n+1, ). The indices of the i^th range are stored
+        in ``indices[offsets[i]:offsets[i+1]]``.
+
+    indices : ndarray
+        Integer array of shape (offsets[-1], ) storing the concatenated ranges
+
+    Examples
+    --------
+    >>> offsets, indices = ragged_ranges([3, 10, 0], [5, 13, 1])
+    >>> offsets
+    array([0, 2, 5, 6])
+    >>> indices
+    array([ 3,  4, 10, 11, 12,  0])
+    """
+    starts = np.atleast_1d(starts).astype('i8')
+    lengths = np.atleast_1d(stops).astype('i8') - starts
+    msg = "Each element of ``stops`` must be at least as large as the corresponding ``starts``"
+    assert np.all(lengths >= 0), msg
+
+    offsets = np.zeros(len(starts) + 1, dtype='i8')
+    np.cumsum(lengths, out=offsets[1:])
+    indices = np.arange(offsets[-1], dtype='i8') + np.repeat(starts - offsets[:-1], lengths)
+    return offsets, indices
+
+
+def intersect_ranges(starts1, stops1, starts2, stops2):
+    """ Intersection of two collections of sorted, non-overlapping integer ranges.
+
+    Parameters
+    ----------
+    starts1, stops1 : ndarray
+        Integer arrays storing the first and one past the last index
+        of each range of the first collection, sorted in increasing order
+
+    starts2, stops2 : ndarray
+        Integer arrays storing the ranges of the second collection
+
+    Returns
+    -------
+    starts, stops : ndarray
+        Integer arrays storing the sorted ranges of indices that belong to both collections
+
+    Examples
+    --------
+    >>> starts, stops = intersect_ranges([0, 10], [5, 20], [3, 8, 18], [9, 12, 30])
+    >>> starts
+    array([ 3, 10, 18])
+    >>> stops
+    array([ 5, 12, 20])
+    """
+    starts1, stops1 = np.atleast_1d(starts1).astype('i8'), np.atleast_1d(stops1).astype('i8')
+    starts2, stops2 = np.atleast_1d(starts2).astype('i8'), np.atleast_1d(stops2).astype('i8')
+
+    #  Range i of the first collection overlaps with ranges first[i] through last[i]-1
+    first = np.searchsorted(stops2, starts1, side='right')
+    last = np.searchsorted(starts2, stops1, side='left')
+    offsets, idx2 = ragged_ranges(first, np.maximum(first, last))
+    idx1 = np.repeat(np.arange(len(starts1)), np.diff(offsets))
+
+    starts = np.maximum(starts1[idx1], starts2[idx2])
+    stops = np.minimum(stops1[idx1], stops2[idx2])
+    keep = stops > starts
+    return starts[keep], stops[keep]
+
+
+def normalize_row_index(key, num_rows):
+    """ Translate the index of the rows of an array-like column into non-negative row numbers,
+    checking that they are in bounds.
+
+    Parameters
+    ----------
+    key : int, slice, or ndarray
+        Integer, slice, boolean mask or array of integers indexing the rows.
+        Negative integers count from the last row.
+
+    num_rows : int
+        Number of rows of the column
+
+    Returns
+    -------
+    rows : int, slice, or ndarray
+        Non-negative integer for an integer ``key``, slice with a unit step
+        and bounds between 0 and ``num_rows`` for a slice with a unit step,
+        and integer array of the shape of the selection otherwise
+
+    Examples
+    --------
+    >>> normalize_row_index(-1, 10)
+    9
+    >>> normalize_row_index(slice(-3, None), 10)
+    slice(7, 10, 1)
+    >>> normalize_row_index(slice(None, None, 4), 10)
+    array([0, 4, 8])
+    """
+    if isinstance(key, (int, np.integer)):
+        row = int(key) + num_rows if key < 0 else int(key)
+        if not 0 <= row < num_rows:
+            raise IndexError("Index {0} is out of bounds for size {1}".format(key, num_rows))
+        return row
+
+    if isinstance(key, slice):
+        start, stop, step = key.indices(num_rows)
+        if step == 1:
+            return slice(start, stop, 1)
+        key = np.arange(start, stop, step)
+
+    rows = np.asarray(key)
+    if rows.dtype == bool:
+        rows = np.flatnonzero(rows)
+    rows = np.where(rows < 0, rows + num_rows, rows).astype('i8')
+    if np.any((rows < 0) | (rows >= num_rows)):
+        raise IndexError("Index array is out of bounds for size {0}".format(num_rows))
+    return rows
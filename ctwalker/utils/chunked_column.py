@@ -0,0 +1,305 @@
+""" Module storing the chunked compressed storage format of a single column.
+
+Each column is split into chunks of a fixed number of rows, and each chunk
+is compressed independently with a codec of the standard library. The file ends
+with a table of the byte offset of every chunk, so that a reader only needs
+to decompress the chunks touched by a slice.
+"""
+import os
+import json
+import zlib
+import struct
+from collections import OrderedDict
+import numpy as np
+
+from .array_utils import normalize_row_index
+
+try:
+    import lzma
+    HAS_LZMA = True
+except ImportError:
+    HAS_LZMA = False
+
+
+__all__ = ('ChunkedColumnWriter', 'ChunkedColumn')
+
+
+available_codecs = ('zlib', 'lzma')
+
+_magic = b'CTWZCOL1'
+_trailer_format = '<Q8s'
+
+
+def chunked_column_fname(parent_dirname, colname):
+    """ Filename of the chunked compressed file storing the column ``colname``.
+    """
+    return os.path.join(parent_dirname, colname + '.zcol')
+
+
+class ChunkedColumnWriter(object):
+    """ Class used to write a single column to disk in compressed chunks,
+    one array at a time.
+
+    Rows are buffered until a full chunk of ``chunk_size`` rows is available,
+    so that memory usage is bounded by the chunk size regardless of the size
+    of the appended arrays. The chunk offset table is written when the writer is closed.
+    """
+
+    def __init__(self, fname, dtype, codec='zlib', chunk_size=2**16, **kwargs):
+        """
+        Parameters
+        ----------
+        fname : string
+            Absolute path to the output file
+
+        dtype : `numpy.dtype`
+            Dtype of the column, possibly with a subarray shape such as ('f4', (3, ))
+
+        codec : string, optional
+            One of ``available_codecs``. Default is 'zlib'.
+
+        chunk_size : int, optional
+            Number of rows per chunk. Default is 2**16.
+
+        level : int, optional
+            Compression level passed to the codec. Default is 6.
+
+        shuffle : bool, optional
+            Whether to group together the bytes of equal significance
+            of every value before compression, which typically improves the
+            compression ratio of numerical data significantly. Default is True.
+        """
+        if codec not in available_codecs:
+            msg = "Input ``codec`` = {0} must be one of {1}".format(codec, available_codecs)
+            raise ValueError(msg)
+        if codec == 'lzma' and not HAS_LZMA:
+            raise ImportError("Must have the ``lzma`` module installed to use codec='lzma'")
+
+        self.fname = fname
+        self.dtype = np.dtype(dtype)
+        self.codec = codec
+        self.chunk_size = int(chunk_size)
+        self.level = kwargs.get('level', 6)
+        self.shuffle = kwargs.get('shuffle', True)
+        self.num_rows = 0
+        self.num_bytes = 0
+
+        self._offsets = [len(_magic)]
+        self._buffer = []
+        self._num_buffered_rows = 0
+        self._file = open(fname, 'wb')
+        self._file.write(_magic)
+
+    def append(self, arr):
+        """ Append the rows of the input array to the column.
+        """
+        arr = np.asarray(arr, dtype=self.dtype.base).reshape((-1, ) + self.dtype.shape)
+        self._buffer.append(arr)
+        self._num_buffered_rows += len(arr)
+        self.num_rows += len(arr)
+        if self._num_buffered_rows >= self.chunk_size:
+            buffered = np.concatenate(self._buffer)
+            num_full_chunks = len(buffered) // self.chunk_size
+            for ichunk in range(num_full_chunks):
+                first = ichunk*self.chunk_size
+                self._write_chunk(buffered[first:first+self.chunk_size])
+            remainder = buffered[num_full_chunks*self.chunk_size:]
+            self._buffer = [remainder]
+            self._num_buffered_rows = len(remainder)
+
+    def close(self):
+        """ Write the last partial chunk and the chunk offset table, and close the file.
+        """
+        if self._file is None:
+            return
+        if self._num_buffered_rows > 0:
+            self._write_chunk(np.concatenate(self._buffer))
+        self._buffer = []
+
+        metadata = dict(dtype=self.dtype.base.str, shape=[self.num_rows] + list(self.dtype.shape),
+            codec=self.codec, shuffle=self.shuffle, chunk_size=self.chunk_size,
+            offsets=self._offsets)
+        footer = json.dumps(metadata, sort_keys=True).encode('ascii')
+        self._file.write(footer)
+        self._file.write(struct.pack(_trailer_format, len(footer), _magic))
+        self._file.close()
+        self._file = None
+
+    def _write_chunk(self, chunk):
+        data = _shuffle_bytes(chunk) if self.shuffle else np.ascontiguousarray(chunk).tobytes()
+        compressed = _compress(data, self.codec, self.level)
+        self._file.write(compressed)
+        self._offsets.append(self._offsets[-1] + len(compressed))
+        self.num_bytes += len(compressed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ChunkedColumn(object):
+    """ Read-only array-like view of a column written by `ChunkedColumnWriter`.
+
+    Indexing with an integer, a slice or an array of integers decompresses
+    only the chunks storing the requested rows. The most recently used chunks
+    are kept in a cache of bounded size, so that nearby requests are cheap.
+    The compressed chunks are read through a read-only memory map of the file
+    that is opened at the first access and kept for the lifetime of the column.
+
+    Examples
+    --------
+    >>> mvir = ChunkedColumn('some/path/subvol_0_1_2/mvir.zcol')  # doctest: +SKIP
+    >>> first_halos = mvir[:100]  # doctest: +SKIP
+    """
+
+    def __init__(self, fname, cache_size=16):
+        """
+        Parameters
+        ----------
+        fname : string
+            Absolute path to the file
+
+        cache_size : int, optional
+            Maximum number of decompressed chunks kept in memory. Default is 16.
+        """
+        self.fname = fname
+        self.cache_size = cache_size
+
+        with open(fname, 'rb') as f:
+            if f.read(len(_magic)) != _magic:
+                raise IOError("``{0}`` is not a chunked column file".format(fname))
+            trailer_size = struct.calcsize(_trailer_format)
+            f.seek(-trailer_size, os.SEEK_END)
+            footer_size, magic = struct.unpack(_trailer_format, f.read(trailer_size))
+            if magic != _magic:
+                raise IOError("``{0}`` is truncated".format(fname))
+            f.seek(-trailer_size-footer_size, os.SEEK_END)
+            metadata = json.loads(f.read(footer_size).decode('ascii'))
+
+        self.dtype = np.dtype(metadata['dtype'])
+        self.shape = tuple(metadata['shape'])
+        self.codec = metadata['codec']
+        self.shuffle = metadata['shuffle']
+        self.chunk_size = metadata['chunk_size']
+        self.offsets = np.array(metadata['offsets'], dtype='i8')
+        self.num_chunks = len(self.offsets) - 1
+        self._cache = OrderedDict()
+        self._payload = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        """ Number of bytes of the decompressed column.
+        """
+        return int(np.prod(self.shape))*self.dtype.itemsize
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows = self[key[0]]
+            if isinstance(key[0], (int, np.integer)):
+                return rows[key[1:]]
+            else:
+                return rows[(slice(None), ) + key[1:]]
+
+        indices = normalize_row_index(key, len(self))
+        if isinstance(indices, int):
+            return self._chunk(indices // self.chunk_size)[indices % self.chunk_size]
+        elif isinstance(indices, slice):
+            return self._contiguous_rows(indices.start, indices.stop)
+
+        result = np.empty(indices.shape + self.shape[1:], dtype=self.dtype)
+        chunk_ids = indices // self.chunk_size
+        order = np.argsort(chunk_ids, kind='mergesort')
+        sorted_chunk_ids = chunk_ids[order]
+        unique_chunk_ids, first = np.unique(sorted_chunk_ids, return_index=True)
+        last = np.append(first[1:], len(order))
+        for chunk_id, i, j in zip(unique_chunk_ids, first, last):
+            positions = order[i:j]
+            result[positions] = self._chunk(chunk_id)[indices[positions] - chunk_id*self.chunk_size]
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self._contiguous_rows(0, len(self))
+        return arr if dtype is None else arr.astype(dtype)
+
+    def _contiguous_rows(self, start, stop):
+        """ Copy of the rows between ``start`` and ``stop``.
+        """
+        result = np.empty((max(stop - start, 0), ) + self.shape[1:], dtype=self.dtype)
+        if stop <= start:
+            return result
+        for chunk_id in range(start // self.chunk_size, (stop - 1) // self.chunk_size + 1):
+            chunk_start = chunk_id*self.chunk_size
+            lo, hi = max(start, chunk_start), min(stop, chunk_start + self.chunk_size)
+            result[lo-start:hi-start] = self._chunk(chunk_id)[lo-chunk_start:hi-chunk_start]
+        return result
+
+    def _chunk(self, chunk_id):
+        """ Decompressed chunk, from the cache when possible.
+        """
+        chunk_id = int(chunk_id)
+        try:
+            chunk = self._cache.pop(chunk_id)
+        except KeyError:
+            if self._payload is None:
+                self._payload = np.memmap(self.fname, dtype='u1', mode='r')
+            compressed = self._payload[self.offsets[chunk_id]:self.offsets[chunk_id+1]]
+            data = _decompress(compressed, self.codec)
+            chunk_shape = (-1, ) + self.shape[1:]
+            if self.shuffle:
+                chunk = _unshuffle_bytes(data, self.dtype).reshape(chunk_shape)
+            else:
+                chunk = np.frombuffer(data, dtype=self.dtype).reshape(chunk_shape)
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[chunk_id] = chunk
+        return chunk
+
+    def __getstate__(self):
+        """ The memory map and the cached chunks are not pickled,
+        so that the column can be sent cheaply to other processes.
+        """
+        state = self.__dict__.copy()
+        state.update(_cache=OrderedDict(), _payload=None)
+        return state
+
+    def __repr__(self):
+        return "{0}('{1}', shape={2}, dtype={3}, codec='{4}')".format(
+            type(self).__name__, self.fname, self.shape, self.dtype.str, self.codec)
+
+
+def _shuffle_bytes(arr):
+    """ Bytes of the input array, with the bytes of equal significance
+    of all values stored contiguously.
+    """
+    as_bytes = np.ascontiguousarray(arr).reshape(-1).view('u1')
+    return as_bytes.reshape(-1, arr.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle_bytes(data, dt):
+    """ Invert `_shuffle_bytes`.
+    """
+    as_bytes = np.frombuffer(data, dtype='u1').reshape(dt.itemsize, -1)
+    return np.ascontiguousarray(as_bytes.T).view(dt).reshape(-1)
+
+
+def _compress(data, codec, level):
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    else:
+        return lzma.compress(data, preset=level)
+
+
+def _decompress(data, codec):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    else:
+        return lzma.decompress(data)
@@ -0,0 +1,464 @@
+""" Module providing random access into gzip-compressed files
+by means of an index of decompressor checkpoints, following the approach
+of the ``zran.c`` example distributed with zlib.
+
+During one sequential decompression pass, the state of the decompressor is
+recorded at deflate block boundaries spaced roughly ``spacing`` bytes apart:
+the compressed and uncompressed offsets, the bit offset into the compressed byte,
+and the last 32 kB of uncompressed data. Decompression can later be restarted at any
+of these access points, so that reaching an arbitrary uncompressed offset
+costs at most ``spacing`` bytes of decompression rather than a pass from the beginning.
+
+The standard library ``zlib`` module does not expose the Z_BLOCK flush mode or
+``inflatePrime`` needed for this, and so the zlib shared library is called via ctypes.
+"""
+import io
+import os
+import ctypes
+import ctypes.util
+import numpy as np
+
+
+__all__ = ('build_gzip_index', 'load_gzip_index', 'open_gzip_indexed',
+    'GzipIndexingReader', 'gzip_index_fname')
+
+
+def _load_libz():
+    candidates = [ctypes.util.find_library('z'), 'libz.so.1', 'libz.dylib', 'zlib1.dll']
+    for name in candidates:
+        if name is None:
+            continue
+        try:
+            return ctypes.CDLL(name)
+        except OSError:
+            pass
+    return None
+
+
+_libz = _load_libz()
+HAS_LIBZ = _libz is not None
+
+if HAS_LIBZ:
+    _libz.zlibVersion.restype = ctypes.c_char_p
+
+_WINSIZE = 32768
+_CHUNK = 2**18
+
+_Z_OK, _Z_STREAM_END, _Z_NEED_DICT, _Z_BUF_ERROR = 0, 1, 2, -5
+_Z_NO_FLUSH, _Z_BLOCK = 0, 5
+
+#  windowBits of 15 + 32 enables automatic detection of the gzip header,
+#  while -15 requests raw deflate data with no header, used to resume at an access point
+_AUTO_HEADER_WBITS, _RAW_WBITS = 47, -15
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint),
+        ('total_in', ctypes.c_ulong), ('next_out', ctypes.c_void_p),
+        ('avail_out', ctypes.c_uint), ('total_out', ctypes.c_ulong),
+        ('msg', ctypes.c_char_p), ('state', ctypes.c_void_p),
+        ('zalloc', ctypes.c_void_p), ('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p),
+        ('data_type', ctypes.c_int), ('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong)]
+
+
+class _Inflater(object):
+    """ Thin wrapper around a zlib inflate stream.
+    """
+
+    def __init__(self, window_bits):
+        if not HAS_LIBZ:
+            msg = "Must have the zlib shared library available to use random access into gzip files"
+            raise ImportError(msg)
+
+        self.strm = _ZStream()
+        self._input = None
+        ret = _libz.inflateInit2_(ctypes.byref(self.strm), window_bits,
+            _libz.zlibVersion(), ctypes.sizeof(self.strm))
+        self._check(ret)
+
+    def feed(self, data):
+        """ Provide the next compressed bytes to the stream,
+        which must have consumed all previous input.
+        """
+        self._input = ctypes.create_string_buffer(data, len(data))
+        self.strm.next_in = ctypes.addressof(self._input)
+        self.strm.avail_in = len(data)
+
+    def inflate(self, out_address, out_size, flush):
+        """ Decompress into ``out_size`` bytes of memory at ``out_address``,
+        returning the zlib return code and the number of bytes written.
+        """
+        self.strm.next_out = out_address
+        self.strm.avail_out = out_size
+        ret = _libz.inflate(ctypes.byref(self.strm), flush)
+        if ret not in (_Z_OK, _Z_STREAM_END, _Z_BUF_ERROR):
+            self._check(ret)
+        return ret, out_size - self.strm.avail_out
+
+    def prime(self, bits, value):
+        self._check(_libz.inflatePrime(ctypes.byref(self.strm), bits, value))
+
+    def set_dictionary(self, window):
+        self._check(_libz.inflateSetDictionary(ctypes.byref(self.strm), window, len(window)))
+
+    def reset(self):
+        self._check(_libz.inflateReset(ctypes.byref(self.strm)))
+
+    def close(self):
+        if self.strm is not None:
+            _libz.inflateEnd(ctypes.byref(self.strm))
+            self.strm = None
+
+    def _check(self, ret):
+        if ret != _Z_OK:
+            msg = self.strm.msg.decode() if self.strm.msg else 'error code {0}'.format(ret)
+            raise IOError("zlib inflate failed: {0}".format(msg))
+
+    def __del__(self):
+        self.close()
+
+
+def gzip_index_fname(fname, index_dirname=None):
+    """ Filename of the access-point index of the gzip file ``fname``.
+
+    By default, the index is stored next to the compressed file,
+    e.g., the index of 'some/path/tree_0_1_2.dat.gz' is 'some/path/tree_0_1_2.dat.gz.gzindex.npz'.
+    """
+    if index_dirname is None:
+        index_dirname = os.path.dirname(os.path.abspath(fname))
+    return os.path.join(index_dirname, os.path.basename(fname) + '.gzindex.npz')
+
+
+class GzipIndexingReader(io.RawIOBase):
+    """ Read-only binary stream decompressing a gzip file from beginning to end
+    while recording the access points of its checkpoint index.
+
+    Wrapping the reader in an `io.BufferedReader` gives a drop-in replacement
+    for ``gzip.open(fname, 'rb')`` in sequential code, so that the index can be built
+    during a pass over the file that is needed anyway, e.g., the first conversion.
+    Once the end of the compressed data has been reached, `save` stores the index.
+    """
+
+    def __init__(self, fname, spacing=2**22):
+        """
+        Parameters
+        ----------
+        fname : string
+            Absolute path to the gzip file
+
+        spacing : int, optional
+            Approximate number of uncompressed bytes between consecutive access points.
+            Default is 2**22.
+        """
+        self.fname = fname
+        self.spacing = spacing
+        self._fileobj = open(fname, 'rb')
+        self._inflater = _Inflater(_AUTO_HEADER_WBITS)
+        self._window = ctypes.create_string_buffer(_WINSIZE)
+        self._window_used = _WINSIZE
+        self._totin, self._totout, self._last = 0, 0, 0
+        self._finished = False
+        self._points = []
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._totout
+
+    def readinto(self, b):
+        data = self._next_output(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def _next_output(self, max_size):
+        """ Decompress at most one deflate block, and at most ``max_size`` bytes.
+        """
+        strm = self._inflater.strm
+        while not self._finished:
+            if strm.avail_in == 0:
+                data = self._fileobj.read(_CHUNK)
+                if not data:
+                    raise EOFError("Compressed file ended before the end of the gzip stream")
+                self._inflater.feed(data)
+
+            if self._window_used == _WINSIZE:
+                self._window_used = 0
+            size = min(max_size, _WINSIZE - self._window_used)
+            avail_in = strm.avail_in
+            ret, num_out = self._inflater.inflate(
+                ctypes.addressof(self._window) + self._window_used, size, _Z_BLOCK)
+            self._totin += avail_in - strm.avail_in
+            self._totout += num_out
+            output = ctypes.string_at(ctypes.addressof(self._window) + self._window_used, num_out)
+            self._window_used += num_out
+
+            if ret == _Z_STREAM_END:
+                self._start_next_member()
+            elif (strm.data_type & 128) and not (strm.data_type & 64):
+                #  End of a deflate block that is not the last block of the stream
+                if self._totout == 0 or self._totout - self._last > self.spacing:
+                    self._add_point(strm.data_type & 7)
+
+            if num_out > 0:
+                return output
+        return b''
+
+    def _start_next_member(self):
+        """ Gzip files may store several concatenated members, e.g., when written by bgzip.
+        """
+        strm = self._inflater.strm
+        if strm.avail_in == 0:
+            data = self._fileobj.read(_CHUNK)
+            if not data:
+                self._finished = True
+                return
+            self._inflater.feed(data)
+        self._inflater.reset()
+
+    def _add_point(self, bits):
+        window = self._window.raw
+        window = window[self._window_used:] + window[:self._window_used]
+        self._points.append((self._totout, self._totin, bits, window))
+        self._last = self._totout
+
+    def save(self, index_dirname=None):
+        """ Store the access-point index of the file, which requires that
+        the entire file has been read.
+
+        Parameters
+        ----------
+        index_dirname : string, optional
+            Directory where the index will be stored.
+            Default is the directory of the gzip file.
+        """
+        if not self._finished:
+            raise ValueError("The access-point index can only be saved after reading the entire file")
+        save_gzip_index(self.fname, self._points, self.spacing, index_dirname)
+
+    def close(self):
+        if not self.closed:
+            self._fileobj.close()
+            self._inflater.close()
+        super(GzipIndexingReader, self).close()
+
+
+def save_gzip_index(fname, points, spacing, index_dirname=None):
+    """ Store the list of (uncompressed offset, compressed offset, bits, window) access points.
+    """
+    num_points = len(points)
+    windows = np.zeros((num_points, _WINSIZE), dtype='u1')
+    for i, point in enumerate(points):
+        windows[i] = np.frombuffer(point[3], dtype='u1')
+
+    stat = os.stat(fname)
+    np.savez_compressed(gzip_index_fname(fname, index_dirname),
+        uncompressed_offsets=np.array([p[0] for p in points], dtype='i8'),
+        compressed_offsets=np.array([p[1] for p in points], dtype='i8'),
+        bits=np.array([p[2] for p in points], dtype='i1'),
+        windows=windows, spacing=spacing,
+        source_size=stat.st_size, source_mtime=stat.st_mtime)
+
+
+def build_gzip_index(fname, index_dirname=None, spacing=2**22):
+    """ Decompress the gzip file ``fname`` once and store its access-point index.
+
+    Parameters
+    ----------
+    fname : string
+        Absolute path to the gzip file
+
+    index_dirname : string, optional
+        Directory where the index will be stored.
+        Default is the directory of the gzip file.
+
+    spacing : int, optional
+        Approximate number of uncompressed bytes between consecutive access points.
+        Default is 2**22.
+
+    Returns
+    -------
+    gzip_index : dict
+        Dictionary storing the arrays of the index, as returned by `load_gzip_index`
+    """
+    with GzipIndexingReader(fname, spacing=spacing) as reader:
+        with io.BufferedReader(reader, _CHUNK) as f:
+            while f.read(_CHUNK*4):
+                pass
+            reader.save(index_dirname)
+    return load_gzip_index(fname, index_dirname)
+
+
+def load_gzip_index(fname, index_dirname=None):
+    """ Load the access-point index of ``fname`` stored by `build_gzip_index`.
+
+    Parameters
+    ----------
+    fname : string
+        Absolute path to the gzip file
+
+    index_dirname : string, optional
+        Directory where the index is stored. Default is the directory of the gzip file.
+
+    Returns
+    -------
+    gzip_index : dict
+        Dictionary with keys ``uncompressed_offsets``, ``compressed_offsets``,
+        ``bits``, ``windows`` and ``spacing``
+    """
+    index_fname = gzip_index_fname(fname, index_dirname)
+    with np.load(index_fname) as data:
+        gzip_index = dict((key, data[key]) for key in data.files)
+
+    source_size = int(gzip_index.pop('source_size'))
+    source_mtime = float(gzip_index.pop('source_mtime')) if 'source_mtime' in gzip_index else None
+
+    stat = os.stat(fname)
+    is_stale = ((source_size != stat.st_size) or
+        ((source_mtime is not None) and (source_mtime != stat.st_mtime)))
+    if is_stale:
+        msg = ("The gzip index {0} is stale: ``{1}`` has changed since the index was built.\n"
+            "Rebuild the index with build_gzip_index".format(index_fname, fname))
+        raise ValueError(msg)
+    gzip_index['spacing'] = int(gzip_index['spacing'])
+    return gzip_index
+
+
+class _GzipIndexedRaw(io.RawIOBase):
+    """ Seekable read-only binary stream of the uncompressed data of a gzip file.
+    """
+
+    def __init__(self, fname, gzip_index):
+        self.fname = fname
+        self.gzip_index = gzip_index
+        self._fileobj = open(fname, 'rb')
+        self._inflater = None
+        self._raw_mode = False
+        self._position = 0
+        self._target = 0
+        self._scratch = ctypes.create_string_buffer(_CHUNK)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._target
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._target
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Can only seek relative to the start or the current position")
+        self._target = max(offset, 0)
+        return self._target
+
+    def readinto(self, b):
+        #  Restart at the closest access point unless the target is a short way ahead
+        ahead = self._target - self._position
+        if self._inflater is None or ahead < 0 or ahead > self.gzip_index['spacing']:
+            self._restart()
+
+        while self._position < self._target:
+            size = min(_CHUNK, self._target - self._position)
+            num_out = self._inflate_into(ctypes.addressof(self._scratch), size)
+            if num_out == 0:
+                return 0
+
+        num_out = self._inflate_into(ctypes.addressof(self._scratch), min(len(b), _CHUNK))
+        b[:num_out] = ctypes.string_at(ctypes.addressof(self._scratch), num_out)
+        self._target = self._position
+        return num_out
+
+    def _restart(self):
+        uncompressed_offsets = self.gzip_index['uncompressed_offsets']
+        ipoint = np.searchsorted(uncompressed_offsets, self._target, side='right') - 1
+        if self._inflater is not None:
+            self._inflater.close()
+
+        if ipoint < 0:
+            self._inflater = _Inflater(_AUTO_HEADER_WBITS)
+            self._raw_mode = False
+            self._fileobj.seek(0)
+            self._position = 0
+            return
+
+        bits = int(self.gzip_index['bits'][ipoint])
+        compressed_offset = int(self.gzip_index['compressed_offsets'][ipoint])
+        self._inflater = _Inflater(_RAW_WBITS)
+        self._raw_mode = True
+        self._fileobj.seek(compressed_offset - (1 if bits else 0))
+        if bits:
+            value = ord(self._fileobj.read(1))
+            self._inflater.prime(bits, value >> (8 - bits))
+        self._inflater.set_dictionary(self.gzip_index['windows'][ipoint].tobytes())
+        self._position = int(uncompressed_offsets[ipoint])
+
+    def _inflate_into(self, out_address, size):
+        """ Decompress up to ``size`` bytes, returning the number of bytes written,
+        which is zero only at the end of the data.
+        """
+        while True:
+            strm = self._inflater.strm
+            if strm.avail_in == 0:
+                data = self._fileobj.read(_CHUNK)
+                if not data:
+                    return 0
+                self._inflater.feed(data)
+
+            ret, num_out = self._inflater.inflate(out_address, size, _Z_NO_FLUSH)
+            self._position += num_out
+            if ret == _Z_STREAM_END:
+                self._start_next_member()
+            if num_out > 0:
+                return num_out
+
+    def _start_next_member(self):
+        """ Gzip files may store several concatenated members, e.g., when written by bgzip.
+        A raw inflate stream started at an access point stops before the 8-byte trailer
+        of its member, whereas zlib consumes the trailer itself when it parsed the header.
+        """
+        next_member = self._fileobj.tell() - self._inflater.strm.avail_in
+        if self._raw_mode:
+            next_member += 8
+        self._inflater.close()
+        self._inflater = _Inflater(_AUTO_HEADER_WBITS)
+        self._raw_mode = False
+        self._fileobj.seek(next_member)
+
+    def close(self):
+        if not self.closed:
+            self._fileobj.close()
+            if self._inflater is not None:
+                self._inflater.close()
+        super(_GzipIndexedRaw, self).close()
+
+
+def open_gzip_indexed(fname, gzip_index=None, index_dirname=None, buffer_size=_CHUNK):
+    """ Open a gzip file for random access using its access-point index.
+
+    Parameters
+    ----------
+    fname : string
+        Absolute path to the gzip file
+
+    gzip_index : dict, optional
+        Index returned by `load_gzip_index` or `build_gzip_index`.
+        Default is to load the index stored in ``index_dirname``.
+
+    index_dirname : string, optional
+        Directory where the index is stored. Default is the directory of the gzip file.
+
+    buffer_size : int, optional
+        Size of the read buffer. Default is 2**18.
+
+    Returns
+    -------
+    f : `io.BufferedReader`
+        Seekable binary file object storing the uncompressed data
+    """
+    if gzip_index is None:
+        gzip_index = load_gzip_index(fname, index_dirname)
+    return io.BufferedReader(_GzipIndexedRaw(fname, gzip_index), buffer_size)
@@ -0,0 +1,140 @@
+""" Module storing the persistent index used to translate halo IDs into row numbers.
+
+The index stores the halo IDs sorted in increasing order together with
+the permutation that sorts them, so that any number of halo IDs can be located
+with a single call to `numpy.searchsorted`. Both arrays are memory-mapped,
+so that opening the index is instantaneous regardless of its size.
+"""
+import os
+import json
+import numpy as np
+
+
+__all__ = ('write_halo_id_index', 'load_halo_id_index', 'HaloIDIndex', 'lookup_sorted_ids')
+
+
+def halo_id_index_dirname(parent_dirname):
+    """ Directory storing the halo ID index of ``parent_dirname``.
+    """
+    return os.path.join(parent_dirname, 'halo_id_index')
+
+
+def write_halo_id_index(parent_dirname, halo_ids, key_colname='halo_id'):
+    """ Build the halo ID index of an array of IDs and store it on disk.
+
+    Parameters
+    ----------
+    parent_dirname : string
+        Directory storing the columns, e.g., 'some/path/subvol_0_1_2'
+
+    halo_ids : ndarray
+        Integer array of shape (num_rows, ) storing the ID of every row
+
+    key_colname : string, optional
+        Name of the column storing ``halo_ids``. Default is 'halo_id'.
+
+    Returns
+    -------
+    index : `HaloIDIndex`
+    """
+    halo_ids = np.asarray(halo_ids)
+    #  With a stable sort, duplicated IDs are located at their first row
+    idx_sorted = np.argsort(halo_ids, kind='mergesort')
+    rows_dtype = 'i4' if len(halo_ids) < 2**31 else 'i8'
+
+    dirname = halo_id_index_dirname(parent_dirname)
+    try:
+        os.makedirs(dirname)
+    except OSError:
+        pass
+    np.save(os.path.join(dirname, 'sorted_ids.npy'), halo_ids[idx_sorted])
+    np.save(os.path.join(dirname, 'rows.npy'), idx_sorted.astype(rows_dtype))
+    with open(os.path.join(dirname, 'metadata.json'), 'w') as f:
+        json.dump(dict(key_colname=key_colname, num_rows=len(halo_ids)), f)
+    return HaloIDIndex(dirname)
+
+
+def load_halo_id_index(parent_dirname):
+    """ Load the halo ID index stored in ``parent_dirname``, or return None if there is none.
+    """
+    dirname = halo_id_index_dirname(parent_dirname)
+    if not os.path.isfile(os.path.join(dirname, 'metadata.json')):
+        return None
+    return HaloIDIndex(dirname)
+
+
+class HaloIDIndex(object):
+    """ Read-only view of the halo ID index written by `write_halo_id_index`.
+
+    Examples
+    --------
+    >>> index = load_halo_id_index('some/path/subvol_0_1_2')  # doctest: +SKIP
+    >>> desc_rows = index.lookup(desc_id)  # doctest: +SKIP
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, 'metadata.json')) as f:
+            metadata = json.load(f)
+        self.key_colname = metadata['key_colname']
+        self.num_rows = metadata['num_rows']
+        self.sorted_ids = np.load(os.path.join(dirname, 'sorted_ids.npy'), mmap_mode='r')
+        self.rows = np.load(os.path.join(dirname, 'rows.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return self.num_rows
+
+    def lookup(self, halo_ids):
+        """ Row numbers of the input halo IDs, see `lookup_sorted_ids`.
+        """
+        return lookup_sorted_ids(self.sorted_ids, self.rows, halo_ids)
+
+    def __repr__(self):
+        return "{0}('{1}', num_rows={2})".format(type(self).__name__, self.dirname, self.num_rows)
+
+
+def lookup_sorted_ids(sorted_ids, rows, halo_ids):
+    """ Row numbers of the input halo IDs, with -1 for IDs that are not found.
+
+    The IDs are sorted before they are searched for, so that the searches sweep
+    through ``sorted_ids`` in a single pass, and are then returned in the input order.
+
+    Parameters
+    ----------
+    sorted_ids : ndarray
+        Integer array storing every halo ID in increasing order
+
+    rows : ndarray
+        Integer array storing the row number of each entry of ``sorted_ids``
+
+    halo_ids : int or ndarray
+        Halo IDs to locate, such as the ``desc_id`` or ``upid`` column
+
+    Returns
+    -------
+    result : int or ndarray
+        Row number of each input ID, -1 where the ID is not found
+
+    Examples
+    --------
+    >>> halo_ids = np.array([40, 10, 30, 20])
+    >>> idx_sorted = np.argsort(halo_ids)
+    >>> lookup_sorted_ids(halo_ids[idx_sorted], idx_sorted, [30, 31, -1, 40])
+    array([ 2, -1, -1,  0])
+    """
+    halo_ids = np.asarray(halo_ids)
+    if halo_ids.ndim == 0:
+        return int(lookup_sorted_ids(sorted_ids, rows, halo_ids.reshape(1))[0])
+
+    result = np.zeros(halo_ids.shape, dtype='i8') - 1
+    if (len(sorted_ids) == 0) or (halo_ids.size == 0):
+        return result
+
+    flat_ids = halo_ids.reshape(-1)
+    order = np.argsort(flat_ids, kind='mergesort')
+    queries = flat_ids[order]
+    idx = np.searchsorted(sorted_ids, queries)
+    np.minimum(idx, len(sorted_ids) - 1, out=idx)
+    found = sorted_ids[idx] == queries
+    result.reshape(-1)[order[found]] = rows[idx[found]]
+    return result
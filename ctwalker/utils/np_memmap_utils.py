@@ -3,14 +3,22 @@
 import os
 import numpy as np
 
+from .chunked_column import ChunkedColumnWriter, ChunkedColumn, chunked_column_fname
+from .zone_maps import ZoneMapWriter, zone_map_fname
 
-__all__ = ('memmap_ndarray', 'memmap_structured_array')
+
+__all__ = ('memmap_ndarray', 'memmap_structured_array', 'load_memmap_column',
+    'StructuredArrayMemmapWriter')
 
 
 def memmap_ndarray(arr, output_fname, store_shape_dtype=True):
     """ Create a Numpy memmap of the input array,
     optionally storing the array shape and dtype.
 
+    If ``output_fname`` ends in ``.npy``, the array is stored in the
+    self-describing `numpy.lib.format` and can be opened in a single call
+    with ``np.load(output_fname, mmap_mode='r')``. Otherwise a raw binary is written.
+
     Parameters
     ----------
     arr : ndarray
@@ -21,27 +29,33 @@ def memmap_ndarray(arr, output_fname, store_shape_dtype=True):
 
     store_shape_dtype : bool, optional
         If True, two additional Numpy binaries will be stored in the same parent
-        directory as the output memmap file, `shape.npy` and `dtype.npy`.
+        directory as a raw output memmap file, `shape.npy` and `dtype.npy`.
         The purpose of these binaries is to facilitate calculating binary offsets.
+        Ignored for ``.npy`` files, whose header already stores this information.
         Default is True.
     """
-    mmp = np.memmap(output_fname, mode='w+',
-        dtype=arr.dtype, shape=arr.shape)
-    mmp[:] = arr[:]
-    del mmp
+    arr = np.ascontiguousarray(arr)
+    if output_fname.endswith('.npy'):
+        np.save(output_fname, arr)
+        return
 
-    output_dirname = os.path.dirname(output_fname)
-    np.save(os.path.join(output_dirname, 'shape'), arr.shape)
-    np.save(os.path.join(output_dirname, 'dtype'), arr.dtype)
+    with open(output_fname, 'wb') as f:
+        f.write(arr.tobytes())
 
+    if store_shape_dtype:
+        _save_shape_dtype(os.path.dirname(output_fname), arr.shape, arr.dtype)
 
-def memmap_structured_array(arr, parent_dirname, *columns_to_save):
+
+def memmap_structured_array(arr, parent_dirname, *columns_to_save, **kwargs):
     """ Function saves a memory map of the desired columns of a structured array
     according to the standard directory tree layout.
 
-    For each memory-mapped column, two additional Numpy binaries will be stored
-    in the same directory: 1. shape.npy, 2. dtype.npy. These two binaries
-    facilitate calculating binary offsets into the memory mapped array.
+    Each column is stored as a contiguous array in its own ``.npy`` file,
+    ``parent_dirname/colname.npy``, storing only the data of that column,
+    so that disk usage and the I/O of readers scale with the number of columns
+    actually used. The header of each file describes its shape and dtype,
+    so that each column can be opened with a single call to
+    ``np.load(fname, mmap_mode='r')``.
 
     Parameters
     ----------
@@ -57,24 +71,288 @@ def memmap_structured_array(arr, parent_dirname, *columns_to_save):
         List of column names that will be memory-mapped to disk.
         If a single string argument ``all`` is passed, all columns will be stored.
         If no argument is passed, default behavior is to store all columns.
+
+    compression : string or dict, optional
+        Codec of the columns stored in compressed chunks instead of ``.npy`` files,
+        see `StructuredArrayMemmapWriter`. Default is None.
+
+    chunk_size : int, optional
+        Number of rows per compressed chunk. Default is 2**16.
+
+    zone_map_size : int, optional
+        Number of rows per block of the zone map of each column,
+        see `StructuredArrayMemmapWriter`. Default is 2**12.
+
+    See also
+    --------
+    load_memmap_column : memory-map a single column stored by this function
+    """
+    with StructuredArrayMemmapWriter(
+            parent_dirname, arr.dtype, *columns_to_save, **kwargs) as writer:
+        writer.append(arr)
+
+
+def load_memmap_column(parent_dirname, colname, mode='r'):
+    """ Memory-map a single column stored according to the standard directory tree layout.
+
+    Columns stored in the ``parent_dirname/colname.npy`` format are opened
+    with `numpy.load`, and columns stored in compressed chunks
+    in the ``parent_dirname/colname.zcol`` format are opened as a
+    `~ctwalker.utils.chunked_column.ChunkedColumn`, which decompresses
+    only the chunks touched by each slice. Columns stored in the older layout of a
+    ``parent_dirname/colname`` directory with `shape.npy` and `dtype.npy` sidecars
+    are also supported. In the oldest version of this layout, every column directory
+    stores the full structured array, in which case a view of the requested field
+    of the structured memmap is returned.
+
+    Parameters
+    ----------
+    parent_dirname : string
+        Root directory where the data is stored.
+
+        Typically this is of the form 'some/path/subvol_0_1_2'.
+
+    colname : string
+        Name of the column
+
+    mode : string, optional
+        Mode used to open the memmap, see `numpy.memmap`. Default is 'r'.
+
+    Returns
+    -------
+    arr : `numpy.memmap` or `~ctwalker.utils.chunked_column.ChunkedColumn`
+        Array storing the data of the column
+    """
+    npy_fname = os.path.join(parent_dirname, colname + '.npy')
+    if os.path.isfile(npy_fname):
+        return np.load(npy_fname, mmap_mode=mode)
+
+    zcol_fname = chunked_column_fname(parent_dirname, colname)
+    if os.path.isfile(zcol_fname):
+        return ChunkedColumn(zcol_fname)
+
+    dirname = os.path.join(parent_dirname, colname)
+    shape = tuple(int(n) for n in np.load(os.path.join(dirname, 'shape.npy')))
+    dt = np.dtype(np.load(os.path.join(dirname, 'dtype.npy'), allow_pickle=True).item())
+
+    fname = os.path.join(dirname, colname + '.memmap')
+    if np.prod(shape) == 0:
+        arr = np.zeros(shape, dtype=dt)
+    else:
+        arr = np.memmap(fname, mode=mode, dtype=dt, shape=shape)
+
+    if (dt.names is not None) and (colname in dt.names):
+        return arr[colname]
+    else:
+        return arr
+
+
+class StructuredArrayMemmapWriter(object):
+    """ Class used to write a structured array to disk one chunk at a time,
+    according to the same directory tree layout as `memmap_structured_array`.
+
+    Only the chunk passed to `append` needs to be held in memory, so that
+    arbitrarily large arrays can be stored with a fixed memory footprint.
+    Each ``.npy`` file begins with a fixed-size header that is rewritten with
+    the final number of rows when the writer is closed.
+
+    Examples
+    --------
+    >>> dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4')])
+    >>> with StructuredArrayMemmapWriter(parent_dirname, dt) as writer:  # doctest: +SKIP
+    ...     for chunk in chunk_generator:
+    ...         writer.append(chunk)
     """
-    dt = arr.dtype
 
+    def __init__(self, parent_dirname, dtype, *columns_to_save, **kwargs):
+        """
+        Parameters
+        ----------
+        parent_dirname : string
+            Root directory where the data will be stored.
+
+            Typically this is of the form 'some/path/subvol_0_1_2'.
+
+        dtype : `numpy.dtype`
+            Structured dtype of the chunks that will be appended
+
+        columns_to_save : sequence of strings, optional
+            List of column names that will be memory-mapped to disk.
+            Default behavior is to store all columns.
+
+        compression : string or dict, optional
+            Codec used to store the columns in compressed chunks with
+            `~ctwalker.utils.chunked_column.ChunkedColumnWriter`, either 'zlib' or 'lzma'.
+            A dictionary mapping column names to codecs selects the codec of each column,
+            with None or missing columns stored as uncompressed ``.npy`` files.
+            Default is None, in which case every column is stored as a ``.npy`` file.
+
+        chunk_size : int, optional
+            Number of rows per compressed chunk. Default is 2**16.
+
+        zone_map_size : int, optional
+            Number of rows per block of the zone map stored next to each column,
+            see `~ctwalker.utils.zone_maps.ZoneMapWriter`. The minimum, maximum and
+            number of sentinel values of each block allow selections to skip
+            the blocks that cannot match. If None, no zone map is stored.
+            Default is 2**12.
+        """
+        self.parent_dirname = parent_dirname
+        self.dtype = np.dtype(dtype)
+        self.columns_to_save = _get_columns_to_save(self.dtype, columns_to_save)
+        self.num_rows = 0
+
+        compression = kwargs.get('compression', None)
+        if not isinstance(compression, dict):
+            compression = dict((colname, compression) for colname in self.columns_to_save)
+        chunk_size = kwargs.get('chunk_size', 2**16)
+        zone_map_size = kwargs.get('zone_map_size', 2**12)
+
+        self._column_writers = []
+        for colname in self.columns_to_save:
+            npy_fname = _column_memmap_fname(parent_dirname, colname)
+            zcol_fname = chunked_column_fname(parent_dirname, colname)
+            codec = compression.get(colname, None)
+            if codec is None:
+                writer = _NpyColumnWriter(npy_fname, self.dtype[colname])
+                stale_fname = zcol_fname
+            else:
+                writer = ChunkedColumnWriter(zcol_fname, self.dtype[colname],
+                    codec=codec, chunk_size=chunk_size)
+                stale_fname = npy_fname
+            if os.path.isfile(stale_fname):
+                os.remove(stale_fname)
+            self._column_writers.append(writer)
+
+        self._zone_map_writers = []
+        for colname in self.columns_to_save:
+            fname = zone_map_fname(parent_dirname, colname)
+            if zone_map_size is None:
+                if os.path.isfile(fname):
+                    os.remove(fname)
+            else:
+                self._zone_map_writers.append(
+                    ZoneMapWriter(fname, self.dtype[colname], zone_map_size))
+
+    @property
+    def num_bytes(self):
+        """ Number of bytes of column data written to disk so far.
+        """
+        return sum(writer.num_bytes for writer in self._column_writers)
+
+    def append(self, arr):
+        """ Append the rows of the input structured array to the memmaps on disk.
+
+        Parameters
+        ----------
+        arr : array
+            Numpy structured array with the same dtype as the writer
+        """
+        arr = np.asarray(arr, dtype=self.dtype)
+        for colname, writer in zip(self.columns_to_save, self._column_writers):
+            writer.append(arr[colname])
+        for colname, writer in zip(self.columns_to_save, self._zone_map_writers):
+            writer.append(arr[colname])
+        self.num_rows += len(arr)
+
+    def close(self):
+        """ Write the final shape into the header of each file and close the files.
+        """
+        for writer in self._column_writers:
+            writer.close()
+        for writer in self._zone_map_writers:
+            writer.close()
+        self._zone_map_writers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _NpyColumnWriter(object):
+    """ Writer of a single column to a ``.npy`` file of initially unknown length.
+
+    The file begins with a header with room for the largest possible number
+    of rows, which is rewritten with the final number of rows upon closing.
+    """
+
+    def __init__(self, fname, dtype):
+        self.dtype = np.dtype(dtype)
+        self.num_rows = 0
+        self.num_bytes = 0
+        self._file = open(fname, 'wb')
+        header = _npy_header(self.dtype.base, (2**63-1, ) + self.dtype.shape)
+        self._file.write(header)
+        self._header_size = len(header)
+
+    def append(self, arr):
+        column_data = np.ascontiguousarray(arr, dtype=self.dtype.base)
+        self._file.write(column_data.tobytes())
+        self.num_rows += len(column_data)
+        self.num_bytes += column_data.nbytes
+
+    def close(self):
+        if self._file is None:
+            return
+        shape = (self.num_rows, ) + self.dtype.shape
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype.base, shape, self._header_size))
+        self._file.close()
+        self._file = None
+
+
+def _npy_header(dt, shape, header_size=None):
+    """ Version 1.0 header of a C-ordered ``.npy`` file storing an array
+    with the input dtype and shape, padded with spaces to ``header_size`` bytes.
+    By default the header is padded to the next multiple of 64 bytes.
+    """
+    header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': {1!r}, }}".format(
+        np.lib.format.dtype_to_descr(dt), tuple(int(n) for n in shape))
+    #  The magic string, version and header length occupy 10 bytes
+    if header_size is None:
+        header_size = 64*((10 + len(header) + 1 + 63) // 64)
+    header = header.ljust(header_size - 10 - 1) + '\n'
+    preamble = np.lib.format.magic(1, 0) + np.array(len(header), dtype='<u2').tobytes()
+    return preamble + header.encode('latin1')
+
+
+def _save_shape_dtype(output_dirname, shape, dt):
+    """ Store the `shape.npy` and `dtype.npy` binaries describing a raw memmap.
+    Simple dtypes are stored as their type string so that they can be loaded
+    without unpickling.
+    """
+    np.save(os.path.join(output_dirname, 'shape'), np.array(shape, dtype='i8'))
+    if dt.names is None:
+        np.save(os.path.join(output_dirname, 'dtype'), np.array(dt.str))
+    else:
+        np.save(os.path.join(output_dirname, 'dtype'), dt)
+
+
+def _get_columns_to_save(dt, columns_to_save):
+    """ Interpret the ``columns_to_save`` argument of `memmap_structured_array`.
+    """
     if len(columns_to_save) == 0:
         columns_to_save = ['all']
 
-    if columns_to_save[0] is 'all':
+    if columns_to_save[0] == 'all':
         columns_to_save = dt.names
 
     for colname in columns_to_save:
         msg = "Column name ``{0}`` does not appear in input array".format(colname)
         assert colname in dt.names, msg
 
-        output_dirname = os.path.join(parent_dirname, colname)
-        try:
-            os.makedirs(output_dirname)
-        except OSError:
-            pass
+    return tuple(columns_to_save)
+
+
+def _column_memmap_fname(parent_dirname, colname):
+    """ Filename of the ``.npy`` file storing the column ``colname``,
+    creating the parent directory if necessary.
+    """
+    try:
+        os.makedirs(parent_dirname)
+    except OSError:
+        pass
 
-        output_fname = os.path.join(output_dirname, colname + '.memmap')
-        memmap_ndarray(arr, output_fname, store_shape_dtype=True)
+    return os.path.join(parent_dirname, colname + '.npy')
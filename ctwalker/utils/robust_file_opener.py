@@ -1,29 +1,133 @@
 """
 """
+import io
+import os
+
 try:
     import gzip
     HAS_GZIP = True
 except ImportError:
     HAS_GZIP = False
 
+try:
+    import bz2
+    HAS_BZ2 = True
+except ImportError:
+    HAS_BZ2 = False
+
+try:
+    import lzma
+    HAS_LZMA = True
+except ImportError:
+    HAS_LZMA = False
+
+
+__all__ = ('_compression_safe_opener', 'robust_open', 'detect_compression')
+
 
-__all__ = ('_compression_safe_opener', )
+#  Leading bytes of each supported compression format
+_magic_bytes = (('gzip', b'\x1f\x8b'), ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'), ('lzma', b'\x5d\x00\x00'))
+
+_has_module = {'gzip': HAS_GZIP, 'bz2': HAS_BZ2, 'xz': HAS_LZMA, 'lzma': HAS_LZMA}
+
+#  Compression format of each file that has already been sniffed,
+#  keyed by absolute path, size and modification time
+_compression_cache = {}
+
+
+def detect_compression(fname):
+    """ Determine the compression format of the input file from its first few bytes.
+
+    The result is cached per absolute path, size and modification time,
+    so that each file is sniffed only once no matter how many times it is opened,
+    while a file replaced at the same path is sniffed again.
+
+    Parameters
+    ----------
+    fname : string
+        Absolute path to the file
+
+    Returns
+    -------
+    compression : string or None
+        One of 'gzip', 'bz2', 'xz' or 'lzma', or None for uncompressed files
+    """
+    stat = os.stat(fname)
+    key = (os.path.abspath(fname), stat.st_size, stat.st_mtime)
+    try:
+        return _compression_cache[key]
+    except KeyError:
+        pass
+
+    with open(fname, 'rb') as f:
+        leading_bytes = f.read(6)
+
+    compression = None
+    for name, magic in _magic_bytes:
+        if leading_bytes.startswith(magic):
+            compression = name
+            break
+
+    _compression_cache[key] = compression
+    return compression
+
+
+def robust_open(fname, buffer_size=2**20):
+    """ Open a possibly compressed file for reading as a binary buffered stream.
+
+    The compression format is detected from the magic bytes of the file
+    with `detect_compression`, and gzip, bz2, xz and lzma files are decompressed
+    transparently.
+
+    Parameters
+    ----------
+    fname : string
+        Absolute path to the file
+
+    buffer_size : int, optional
+        Size of the read buffer in bytes. Large buffers reduce the number of
+        system calls on parallel filesystems. Default is 2**20.
+
+    Returns
+    -------
+    f : `io.BufferedReader`
+        Binary file object storing the uncompressed data
+    """
+    compression = detect_compression(fname)
+    if compression is None:
+        return io.open(fname, 'rb', buffering=buffer_size)
+
+    if not _has_module[compression]:
+        msg = "Must have the ``{0}`` module installed to read ``{1}``".format(
+            'lzma' if compression == 'xz' else compression, fname)
+        raise ImportError(msg)
+
+    if compression == 'gzip':
+        f = gzip.GzipFile(fname, 'rb')
+    elif compression == 'bz2':
+        f = bz2.BZ2File(fname, 'rb')
+    else:
+        f = lzma.LZMAFile(fname, 'rb')
+    return io.BufferedReader(f, buffer_size)
 
 
 def _compression_safe_opener(fname):
-    """ Determine whether to use *open* or *gzip.open* to read
-    the input file, depending on whether or not the file is compressed.
+    """ Determine whether to use *open* or the opener of the appropriate
+    decompression module to read the input file, depending on whether or not
+    the file is compressed. The builtin *open* is returned for uncompressed files.
     """
-    if not HAS_GZIP:
-        msg = "Must have ``gzip`` installed to use _compression_safe_opener"
+    compression = detect_compression(fname)
+    if compression is None:
+        return open
+
+    if not _has_module[compression]:
+        msg = "Must have ``{0}`` installed to use _compression_safe_opener".format(compression)
         raise ImportError(msg)
 
-    f = gzip.open(fname, 'r')
-    try:
-        f.read(1)
-        opener = gzip.open
-    except IOError:
-        opener = open
-    finally:
-        f.close()
-    return opener
+    if compression == 'gzip':
+        return gzip.open
+    elif compression == 'bz2':
+        return bz2.BZ2File
+    else:
+        return lzma.LZMAFile
@@ -0,0 +1,133 @@
+""" Module storing the per-snapshot index of a converted subvolume.
+
+Halos are stored in depth-first order, so the halos of any one snapshot
+are scattered throughout every tree. The index groups the row numbers
+of the halos by snapshot in compressed sparse row (CSR) format:
+the rows of the i^th snapshot are ``rows[offsets[i]:offsets[i+1]]``,
+sorted in increasing order so that gathering them from a memmap
+proceeds through the file in a single forward pass.
+"""
+import os
+import json
+import numpy as np
+
+
+__all__ = ('write_snapshot_index', 'load_snapshot_index', 'SnapshotIndex')
+
+
+snapshot_key_colnames = ('snap_num', 'scale_factor')
+
+
+def snapshot_index_dirname(parent_dirname):
+    """ Directory storing the snapshot index of the subvolume ``parent_dirname``.
+    """
+    return os.path.join(parent_dirname, 'snapshot_index')
+
+
+def write_snapshot_index(parent_dirname, keys, key_colname):
+    """ Build the snapshot index from the snapshot of every row and store it on disk.
+
+    Parameters
+    ----------
+    parent_dirname : string
+        Directory storing the columns, e.g., 'some/path/subvol_0_1_2'
+
+    keys : ndarray
+        Array of shape (num_rows, ) storing the snapshot of every row,
+        e.g., the ``snap_num`` or ``scale_factor`` column
+
+    key_colname : string
+        Name of the column storing ``keys``
+
+    Returns
+    -------
+    index : `SnapshotIndex`
+    """
+    keys = np.asarray(keys)
+    #  A stable sort keeps the rows of each snapshot in increasing order
+    idx_sorted = np.argsort(keys, kind='mergesort')
+    values, counts = np.unique(keys[idx_sorted], return_counts=True)
+    offsets = np.zeros(len(values) + 1, dtype='i8')
+    np.cumsum(counts, out=offsets[1:])
+    rows_dtype = 'i4' if len(keys) < 2**31 else 'i8'
+
+    dirname = snapshot_index_dirname(parent_dirname)
+    try:
+        os.makedirs(dirname)
+    except OSError:
+        pass
+    np.save(os.path.join(dirname, 'values.npy'), values)
+    np.save(os.path.join(dirname, 'offsets.npy'), offsets)
+    np.save(os.path.join(dirname, 'rows.npy'), idx_sorted.astype(rows_dtype))
+    with open(os.path.join(dirname, 'metadata.json'), 'w') as f:
+        json.dump(dict(key_colname=key_colname, num_rows=len(keys)), f)
+    return SnapshotIndex(dirname)
+
+
+def load_snapshot_index(parent_dirname):
+    """ Load the snapshot index of a subvolume, or return None if there is none.
+    """
+    dirname = snapshot_index_dirname(parent_dirname)
+    if not os.path.isfile(os.path.join(dirname, 'metadata.json')):
+        return None
+    return SnapshotIndex(dirname)
+
+
+class SnapshotIndex(object):
+    """ Read-only view of the snapshot index written by `write_snapshot_index`.
+
+    The snapshot values and offsets are loaded into memory,
+    while the row numbers are memory-mapped.
+
+    Examples
+    --------
+    >>> index = load_snapshot_index('some/path/subvol_0_1_2')  # doctest: +SKIP
+    >>> rows = index.rows_of(214)  # doctest: +SKIP
+    >>> mvir_at_snap214 = mvir[rows]  # doctest: +SKIP
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, 'metadata.json')) as f:
+            metadata = json.load(f)
+        self.key_colname = metadata['key_colname']
+        self.num_rows = metadata['num_rows']
+        self.values = np.load(os.path.join(dirname, 'values.npy'))
+        self.offsets = np.load(os.path.join(dirname, 'offsets.npy'))
+        self.rows = np.load(os.path.join(dirname, 'rows.npy'), mmap_mode='r')
+
+    @property
+    def counts(self):
+        """ Number of rows of every snapshot in ``values``.
+        """
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, snapshot):
+        i = np.searchsorted(self.values, snapshot)
+        return bool((i < len(self.values)) and (self.values[i] == snapshot))
+
+    def rows_of(self, snapshot):
+        """ Sorted row numbers of the halos of the input snapshot.
+
+        Parameters
+        ----------
+        snapshot : scalar
+            Value of the ``key_colname`` column of the snapshot.
+            Floating-point keys must match the stored values exactly.
+
+        Returns
+        -------
+        rows : ndarray
+            Sorted integer array. An empty array is returned for snapshots without halos.
+        """
+        i = np.searchsorted(self.values, snapshot)
+        if (i == len(self.values)) or (self.values[i] != snapshot):
+            return np.zeros(0, dtype=self.rows.dtype)
+        return np.array(self.rows[self.offsets[i]:self.offsets[i+1]])
+
+    def __repr__(self):
+        return "{0}('{1}', key_colname='{2}', num_snapshots={3})".format(
+            type(self).__name__, self.dirname, self.key_colname, len(self))
@@ -0,0 +1,80 @@
+"""
+"""
+import os
+import pytest
+import numpy as np
+
+from ..chunked_column import ChunkedColumnWriter, ChunkedColumn, HAS_LZMA
+from ..np_memmap_utils import StructuredArrayMemmapWriter, load_memmap_column
+
+
+__all__ = ('test_chunked_column_slicing', 'test_compressed_structured_writer')
+
+
+def test_chunked_column_slicing(tmpdir):
+    rng = np.random.RandomState(43)
+    arr = np.cumsum(rng.randint(0, 5, 10000)).astype('i8')
+    pos = rng.uniform(0, 250, (10000, 3)).astype('f4')
+
+    codecs = ['zlib', 'lzma'] if HAS_LZMA else ['zlib']
+    for codec in codecs:
+        for shuffle in (True, False):
+            fname = os.path.join(str(tmpdir), 'halo_id.zcol')
+            with ChunkedColumnWriter(fname, arr.dtype, codec=codec,
+                    chunk_size=1000, shuffle=shuffle) as writer:
+                for i in range(0, len(arr), 777):
+                    writer.append(arr[i:i+777])
+            assert writer.num_bytes < arr.nbytes
+
+            col = ChunkedColumn(fname, cache_size=3)
+            assert len(col) == len(arr)
+            assert col.num_chunks == 10
+            assert np.all(np.array(col) == arr)
+            assert col[0] == arr[0]
+            assert col[-1] == arr[-1]
+            assert len(col._cache) <= 3
+            for s in (slice(995, 2010), slice(None, None, 7), slice(50, 40), slice(-30, None)):
+                assert np.all(col[s] == arr[s])
+            indices = rng.randint(-len(arr), len(arr), 50)
+            assert np.all(col[indices] == arr[indices])
+            mask = arr % 3 == 0
+            assert np.all(col[mask] == arr[mask])
+            with pytest.raises(IndexError):
+                col[len(arr)]
+
+    fname = os.path.join(str(tmpdir), 'pos.zcol')
+    with ChunkedColumnWriter(fname, np.dtype(('f4', (3, ))), chunk_size=999) as writer:
+        writer.append(pos)
+    col = ChunkedColumn(fname)
+    assert col.shape == pos.shape
+    assert np.all(col[10:2000] == pos[10:2000])
+    assert np.all(col[5, 1] == pos[5, 1])
+    assert np.all(col[10:20, 2] == pos[10:20, 2])
+
+
+def test_compressed_structured_writer(tmpdir):
+    dt = np.dtype([('halo_id', 'i8'), ('snap_num', 'i4'), ('mvir', 'f4')])
+    arr = np.zeros(5000, dtype=dt)
+    arr['halo_id'] = np.arange(5000)
+    arr['snap_num'] = np.repeat(np.arange(50), 100)
+    arr['mvir'] = np.random.RandomState(43).uniform(1e10, 1e12, 5000)
+
+    dirname = str(tmpdir)
+    compression = {'halo_id': 'zlib', 'snap_num': 'zlib'}
+    with StructuredArrayMemmapWriter(dirname, dt, compression=compression,
+            chunk_size=512) as writer:
+        for i in range(0, len(arr), 1500):
+            writer.append(arr[i:i+1500])
+    assert writer.num_bytes < arr.nbytes
+
+    assert os.path.isfile(os.path.join(dirname, 'halo_id.zcol'))
+    assert os.path.isfile(os.path.join(dirname, 'mvir.npy'))
+    for colname in dt.names:
+        col = load_memmap_column(dirname, colname)
+        assert np.all(col[:] == arr[colname])
+    assert isinstance(load_memmap_column(dirname, 'snap_num'), ChunkedColumn)
+
+    #  Storing a column again with another format replaces the previous file
+    with StructuredArrayMemmapWriter(dirname, dt, 'halo_id') as writer:
+        writer.append(arr)
+    assert not os.path.isfile(os.path.join(dirname, 'halo_id.zcol'))
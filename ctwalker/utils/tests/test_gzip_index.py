@@ -0,0 +1,64 @@
+"""
+"""
+import os
+import gzip
+import pytest
+import numpy as np
+
+from ..gzip_index import HAS_LIBZ, build_gzip_index, open_gzip_indexed, gzip_index_fname
+from ..gzip_index import load_gzip_index
+
+
+__all__ = ('test_random_access', 'test_stale_index')
+
+
+def _fake_text(num_lines, seed=43):
+    rng = np.random.RandomState(seed)
+    values = rng.uniform(0, 1e4, size=(num_lines, 8))
+    return ''.join(' '.join('%.6g' % v for v in row) + '\n' for row in values).encode()
+
+
+@pytest.mark.skipif('not HAS_LIBZ')
+def test_random_access(tmpdir):
+    data = _fake_text(40000)
+
+    single_member_fname = os.path.join(str(tmpdir), 'single.dat.gz')
+    with gzip.open(single_member_fname, 'wb') as f:
+        f.write(data)
+
+    multi_member_fname = os.path.join(str(tmpdir), 'multi.dat.gz')
+    with open(multi_member_fname, 'wb') as f:
+        for start in range(0, len(data), 300000):
+            with gzip.GzipFile(fileobj=f, mode='wb') as member:
+                member.write(data[start:start+300000])
+
+    rng = np.random.RandomState(0)
+    for fname in (single_member_fname, multi_member_fname):
+        gzip_index = build_gzip_index(fname, spacing=2**16)
+        assert os.path.isfile(gzip_index_fname(fname))
+        assert len(gzip_index['uncompressed_offsets']) > 10
+
+        with open_gzip_indexed(fname) as f:
+            for offset in rng.randint(0, len(data), 50):
+                f.seek(offset)
+                assert f.read(1000) == data[offset:offset+1000]
+            f.seek(len(data) - 10)
+            assert f.read() == data[-10:]
+            f.seek(0)
+            assert f.readline() == data[:data.find(b'\n')+1]
+
+
+@pytest.mark.skipif('not HAS_LIBZ')
+def test_stale_index(tmpdir):
+    """ Rewriting the gzip file invalidates its index even when the size is unchanged.
+    """
+    fname = os.path.join(str(tmpdir), 'single.dat.gz')
+    with gzip.open(fname, 'wb') as f:
+        f.write(_fake_text(1000))
+    build_gzip_index(fname)
+    __ = load_gzip_index(fname)
+
+    stat = os.stat(fname)
+    os.utime(fname, (stat.st_atime, stat.st_mtime + 10))
+    with pytest.raises(ValueError):
+        __ = load_gzip_index(fname)
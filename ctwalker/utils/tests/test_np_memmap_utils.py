@@ -0,0 +1,70 @@
+"""
+"""
+import os
+import numpy as np
+
+from ..np_memmap_utils import memmap_ndarray, memmap_structured_array, load_memmap_column
+from ..np_memmap_utils import StructuredArrayMemmapWriter
+
+
+__all__ = ('test_columnar_layout', 'test_legacy_layout')
+
+
+def _fake_structured_array(num_rows, seed=43):
+    rng = np.random.RandomState(seed)
+    dt = np.dtype([('halo_id', 'i8'), ('mvir', 'f4'), ('pos', 'f4', (3, ))])
+    arr = np.zeros(num_rows, dtype=dt)
+    arr['halo_id'] = rng.permutation(num_rows)
+    arr['mvir'] = 10**rng.uniform(10, 15, num_rows)
+    arr['pos'] = rng.uniform(0, 250, (num_rows, 3))
+    return arr
+
+
+def test_columnar_layout(tmpdir):
+    arr = _fake_structured_array(1000)
+    dirname1 = os.path.join(str(tmpdir), 'subvol_0_0_0')
+    dirname2 = os.path.join(str(tmpdir), 'subvol_0_0_1')
+
+    memmap_structured_array(arr, dirname1)
+    with StructuredArrayMemmapWriter(dirname2, arr.dtype, 'mvir', 'pos') as writer:
+        for i in range(0, len(arr), 300):
+            writer.append(arr[i:i+300])
+    assert writer.num_bytes == arr['mvir'].nbytes + arr['pos'].nbytes
+
+    for colname in arr.dtype.names:
+        fname = os.path.join(dirname1, colname + '.npy')
+        result = np.load(fname, mmap_mode='r')
+        assert isinstance(result, np.memmap)
+        assert result.offset + arr[colname].nbytes == os.path.getsize(fname)
+        assert result.shape == arr[colname].shape
+        assert np.all(result == arr[colname])
+    assert not os.path.isfile(os.path.join(dirname2, 'halo_id.npy'))
+    for colname in ('mvir', 'pos'):
+        result = load_memmap_column(dirname2, colname)
+        assert result.offset % 64 == 0
+        assert result.dtype == arr[colname].dtype
+        assert np.all(result == arr[colname])
+
+    with StructuredArrayMemmapWriter(dirname2, arr.dtype, 'halo_id') as writer:
+        pass
+    assert load_memmap_column(dirname2, 'halo_id').shape == (0, )
+
+
+def test_legacy_layout(tmpdir):
+    """ Column directories with shape.npy and dtype.npy sidecars can still be read,
+    including those storing the full structured array.
+    """
+    arr = _fake_structured_array(100)
+    parent_dirname = os.path.join(str(tmpdir), 'subvol_0_0_0')
+
+    dirname = os.path.join(parent_dirname, 'mvir')
+    os.makedirs(dirname)
+    arr.tofile(os.path.join(dirname, 'mvir.memmap'))
+    np.save(os.path.join(dirname, 'shape'), arr.shape)
+    np.save(os.path.join(dirname, 'dtype'), arr.dtype)
+    assert np.all(load_memmap_column(parent_dirname, 'mvir') == arr['mvir'])
+
+    dirname = os.path.join(parent_dirname, 'pos')
+    os.makedirs(dirname)
+    memmap_ndarray(arr['pos'], os.path.join(dirname, 'pos.memmap'))
+    assert np.all(load_memmap_column(parent_dirname, 'pos') == arr['pos'])
@@ -0,0 +1,63 @@
+"""
+"""
+import os
+import gzip
+import bz2
+
+from ..robust_file_opener import robust_open, detect_compression, HAS_LZMA
+
+
+__all__ = ('test_robust_open_compression_formats', 'test_detect_compression_cache')
+
+_data = b''.join('{0} {1:.4f}\n'.format(i, i/7.).encode() for i in range(20000))
+
+
+def _write(fname, compression):
+    if compression == 'gzip':
+        f = gzip.GzipFile(fname, 'wb')
+    elif compression == 'bz2':
+        f = bz2.BZ2File(fname, 'wb')
+    elif compression == 'xz':
+        import lzma
+        f = lzma.LZMAFile(fname, 'wb')
+    else:
+        f = open(fname, 'wb')
+    with f:
+        f.write(_data)
+
+
+def test_robust_open_compression_formats(tmpdir):
+    """ Every supported format is recognized from its magic bytes,
+    regardless of the file extension, and decompresses to the same bytes.
+    """
+    formats = [None, 'gzip', 'bz2']
+    if HAS_LZMA:
+        formats.append('xz')
+    for compression in formats:
+        fname = os.path.join(str(tmpdir), 'tree_0_0_0_{0}.dat'.format(compression))
+        _write(fname, compression)
+        assert detect_compression(fname) == compression
+        with robust_open(fname, buffer_size=2**12) as f:
+            assert f.readline() == b'0 0.0000\n'
+            assert f.read() == _data[len(b'0 0.0000\n'):]
+
+
+def test_detect_compression_cache(tmpdir):
+    """ A file replaced at the same path by a file with a different
+    compression format is sniffed again.
+    """
+    fname = os.path.join(str(tmpdir), 'tree_0_0_0.dat')
+    _write(fname, 'gzip')
+    assert detect_compression(fname) == 'gzip'
+    assert detect_compression(fname) == 'gzip'
+    _write(fname, None)
+    assert detect_compression(fname) is None
+
+    #  Same size, different modification time
+    with open(fname, 'rb') as f:
+        data = f.read()
+    with open(fname, 'wb') as f:
+        f.write(b'\x1f\x8b' + data[2:])
+    stat = os.stat(fname)
+    os.utime(fname, (stat.st_atime, stat.st_mtime + 10))
+    assert detect_compression(fname) == 'gzip'
@@ -0,0 +1,62 @@
+"""
+"""
+import os
+import pytest
+import numpy as np
+
+from ..zone_maps import ZoneMapWriter, load_zone_map, candidate_row_ranges, comparison_operators
+from ..np_memmap_utils import StructuredArrayMemmapWriter
+from ..array_utils import ragged_ranges
+
+
+__all__ = ('test_zone_map_writer', 'test_candidate_row_ranges')
+
+
+def test_zone_map_writer(tmpdir):
+    rng = np.random.RandomState(43)
+    arr = rng.uniform(0, 1, 10000)
+    arr[rng.randint(0, len(arr), 20)] = np.nan
+
+    fname = os.path.join(str(tmpdir), 'mvir.zonemap.npy')
+    with ZoneMapWriter(fname, arr.dtype, block_size=1000) as writer:
+        for i in range(0, len(arr), 777):
+            writer.append(arr[i:i+777])
+    zone_map = load_zone_map(str(tmpdir), 'mvir')
+    assert len(zone_map) == 10
+    assert np.all(zone_map['first_row'] == np.arange(0, 10000, 1000))
+    for block in zone_map:
+        rows = arr[block['first_row']:block['first_row']+block['num_rows']]
+        assert block['min'] == np.nanmin(rows)
+        assert block['max'] == np.nanmax(rows)
+        assert block['num_sentinel'] == np.isnan(rows).sum()
+    assert load_zone_map(str(tmpdir), 'vmax') is None
+
+
+def test_candidate_row_ranges(tmpdir):
+    rng = np.random.RandomState(43)
+    dt = np.dtype([('snap_num', 'i4'), ('mvir', 'f4')])
+    arr = np.zeros(10000, dtype=dt)
+    arr['snap_num'] = np.sort(rng.randint(-1, 100, len(arr)))
+    arr['mvir'] = rng.uniform(0, 1, len(arr))
+    arr['mvir'][::97] = np.nan
+
+    writer = StructuredArrayMemmapWriter(str(tmpdir), dt, zone_map_size=500)
+    for i in range(0, len(arr), 3000):
+        writer.append(arr[i:i+3000])
+    writer.close()
+
+    zone_map = load_zone_map(str(tmpdir), 'snap_num')
+    starts, stops = candidate_row_ranges(zone_map, '==', 50)
+    assert len(starts) == 1
+    assert stops[0] - starts[0] <= 1000
+
+    for colname, value in (('snap_num', 50), ('snap_num', -1), ('mvir', 0.5)):
+        zone_map = load_zone_map(str(tmpdir), colname)
+        for op, func in comparison_operators.items():
+            starts, stops = candidate_row_ranges(zone_map, op, value)
+            candidates = ragged_ranges(starts, stops)[1]
+            matches = np.flatnonzero(func(arr[colname], value))
+            assert np.all(np.isin(matches, candidates))
+
+    with pytest.raises(ValueError):
+        candidate_row_ranges(zone_map, '=~', 0.5)
@@ -0,0 +1,204 @@
+""" Module storing zone maps, the per-block summary statistics of a stored column
+used to skip the blocks of rows that cannot satisfy a selection.
+
+For each block of a fixed number of rows, the zone map stores the minimum
+and maximum value of the column, along with the number of sentinel values,
+-1 for integer columns and NaN for floating-point columns.
+NaN values are excluded from the minimum and maximum.
+"""
+import os
+import operator
+import numpy as np
+
+
+__all__ = ('ZoneMapWriter', 'load_zone_map', 'candidate_row_ranges')
+
+
+comparison_operators = {'==': operator.eq, '!=': operator.ne, '<': operator.lt,
+    '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+
+def zone_map_fname(parent_dirname, colname):
+    """ Filename of the zone map of the column ``colname``.
+    """
+    return os.path.join(parent_dirname, colname + '.zonemap.npy')
+
+
+def zone_map_dtype(column_dtype):
+    """ Structured dtype of the zone map of a column with the input dtype.
+    """
+    dt = np.dtype(column_dtype).base
+    return np.dtype([('first_row', 'i8'), ('num_rows', 'i8'),
+        ('min', dt), ('max', dt), ('num_sentinel', 'i8')])
+
+
+class ZoneMapWriter(object):
+    """ Class used to accumulate the zone map of a column one array at a time.
+
+    Only the rows of the last incomplete block are buffered,
+    and the zone map is stored in ``fname`` when the writer is closed.
+    """
+
+    def __init__(self, fname, dtype, block_size=2**12):
+        """
+        Parameters
+        ----------
+        fname : string
+            Absolute path to the output ``.zonemap.npy`` file
+
+        dtype : `numpy.dtype`
+            Dtype of the column, possibly with a subarray shape
+
+        block_size : int, optional
+            Number of rows summarized by each entry of the zone map. Default is 2**12.
+        """
+        self.fname = fname
+        self.dtype = np.dtype(dtype)
+        self.block_size = int(block_size)
+        self.num_rows = 0
+
+        self._blocks = []
+        self._buffer = []
+        self._num_buffered_rows = 0
+
+    def append(self, arr):
+        """ Append the rows of the input array to the column being summarized.
+        """
+        arr = np.asarray(arr, dtype=self.dtype.base).reshape((-1, ) + self.dtype.shape)
+        self._buffer.append(arr)
+        self._num_buffered_rows += len(arr)
+        if self._num_buffered_rows >= self.block_size:
+            buffered = np.concatenate(self._buffer)
+            num_full = (len(buffered) // self.block_size)*self.block_size
+            self._summarize(buffered[:num_full])
+            self._buffer = [buffered[num_full:]]
+            self._num_buffered_rows = len(buffered) - num_full
+
+    def close(self):
+        """ Summarize the last incomplete block and store the zone map.
+        """
+        if self._num_buffered_rows > 0:
+            self._summarize(np.concatenate(self._buffer))
+        self._buffer = []
+        self._num_buffered_rows = 0
+
+        if len(self._blocks) > 0:
+            zone_map = np.concatenate(self._blocks)
+        else:
+            zone_map = np.zeros(0, dtype=zone_map_dtype(self.dtype))
+        np.save(self.fname, zone_map)
+
+    def _summarize(self, rows):
+        """ Append the statistics of consecutive blocks of ``rows`` to the zone map.
+        """
+        num_blocks = (len(rows) + self.block_size - 1) // self.block_size
+        zone_map = np.zeros(num_blocks, dtype=zone_map_dtype(self.dtype))
+        zone_map['first_row'] = self.num_rows + self.block_size*np.arange(num_blocks)
+        zone_map['num_rows'] = np.minimum(
+            self.block_size, len(rows) - self.block_size*np.arange(num_blocks))
+
+        values = rows.reshape(len(rows), -1)
+        boundaries = self.block_size*np.arange(num_blocks)
+        if values.shape[1] == 0:
+            pass
+        elif self.dtype.base.kind == 'f':
+            is_nan = np.isnan(values)
+            zone_map['min'] = np.minimum.reduceat(
+                np.where(is_nan, np.inf, values).min(axis=1), boundaries)
+            zone_map['max'] = np.maximum.reduceat(
+                np.where(is_nan, -np.inf, values).max(axis=1), boundaries)
+            zone_map['num_sentinel'] = np.add.reduceat(is_nan.sum(axis=1), boundaries)
+        else:
+            zone_map['min'] = np.minimum.reduceat(values.min(axis=1), boundaries)
+            zone_map['max'] = np.maximum.reduceat(values.max(axis=1), boundaries)
+            if self.dtype.base.kind == 'i':
+                zone_map['num_sentinel'] = np.add.reduceat((values == -1).sum(axis=1), boundaries)
+
+        self._blocks.append(zone_map)
+        self.num_rows += len(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_zone_map(parent_dirname, colname):
+    """ Load the zone map of a stored column, or return None if there is none.
+
+    Parameters
+    ----------
+    parent_dirname : string
+        Directory storing the column, e.g., 'some/path/subvol_0_1_2'
+
+    colname : string
+        Name of the column
+
+    Returns
+    -------
+    zone_map : ndarray or None
+        Structured array with one entry per block of rows, with fields
+        ``first_row``, ``num_rows``, ``min``, ``max`` and ``num_sentinel``
+    """
+    fname = zone_map_fname(parent_dirname, colname)
+    if not os.path.isfile(fname):
+        return None
+    return np.load(fname)
+
+
+def candidate_row_ranges(zone_map, op, value):
+    """ Ranges of rows that may satisfy the comparison ``column op value``,
+    according to the zone map of the column. Adjacent blocks are merged.
+
+    Parameters
+    ----------
+    zone_map : ndarray
+        Zone map returned by `load_zone_map`
+
+    op : string
+        One of '==', '!=', '<', '<=', '>', '>='
+
+    value : scalar
+        Value the column is compared to
+
+    Returns
+    -------
+    starts, stops : ndarray
+        Integer arrays storing the first and one past the last row of each range
+
+    Examples
+    --------
+    >>> zone_map = np.zeros(3, dtype=zone_map_dtype('i4'))
+    >>> zone_map['first_row'] = (0, 100, 200)
+    >>> zone_map['num_rows'] = 100
+    >>> zone_map['min'], zone_map['max'] = (0, 5, 40), (10, 30, 90)
+    >>> candidate_row_ranges(zone_map, '>', 20)
+    (array([100]), array([300]))
+    """
+    lo, hi = zone_map['min'], zone_map['max']
+    if op == '==':
+        may_match = (lo <= value) & (value <= hi)
+    elif op == '!=':
+        #  NaN values are excluded from min and max but differ from every value
+        has_nan = zone_map['num_sentinel'] > 0 if lo.dtype.kind == 'f' else False
+        may_match = ~((lo == value) & (hi == value)) | has_nan
+    elif op == '<':
+        may_match = lo < value
+    elif op == '<=':
+        may_match = lo <= value
+    elif op == '>':
+        may_match = hi > value
+    elif op == '>=':
+        may_match = hi >= value
+    else:
+        msg = "Comparison operator ``{0}`` must be one of {1}".format(
+            op, sorted(comparison_operators))
+        raise ValueError(msg)
+
+    starts = zone_map['first_row'][may_match]
+    stops = starts + zone_map['num_rows'][may_match]
+    is_new_range = np.ones(len(starts), dtype=bool)
+    is_new_range[1:] = starts[1:] != stops[:-1]
+    is_last_of_range = np.append(is_new_range[1:], True)[:len(starts)]
+    return starts[is_new_range].astype('i8'), stops[is_last_of_range].astype('i8')